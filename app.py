@@ -1,5 +1,7 @@
+import argparse
 import asyncio
 import logging
+import sys
 from datetime import datetime
 import time
 
@@ -10,10 +12,11 @@ from configurations import configuration
 from clients.gsheet_client import GSheetClient
 from logger import SheetLogger, LogInfo
 from pricing import CrawlerGetter, Product
+from services.sharding import Shard, run_shards
 from services.streaming_service import StreamingService
 
 
-def run():
+def run(shard: Shard = None, merge: bool = True):
     config = configuration.config
     SPREADSHEET_ID = config['DEFAULT']['SPREADSHEET_ID']
     BQ_PROJECT_ID = config['DEFAULT']['BIGQUERY_PROJECT']
@@ -21,9 +24,30 @@ def run():
     LOGGING_SPREADSHEET_ID =  config['DEFAULT']['LOGGING_SPREADSHEET_ID']
     gsheet_client = GSheetClient(SPREADSHEET_ID, SCOPES)
     bq_client = BQClient(project=BQ_PROJECT_ID)
+    if shard is None or shard.count == 1:
+        sheet_logger = SheetLogger.from_config(GSheetClient(LOGGING_SPREADSHEET_ID, SCOPES), config)
+    else:
+        # the next free row of the log sheet cannot be shared by concurrent writers, each shard keeps a file
+        sheet_logger = SheetLogger.from_config(None, shard.config(config))
 
-    streaming_service = StreamingService(bq_client=bq_client, gsheet_client=gsheet_client)
-    asyncio.run(streaming_service.populate_prices())
+    streaming_service = StreamingService(bq_client=bq_client, gsheet_client=gsheet_client, listeners=[sheet_logger],
+                                         shard=shard)
+    try:
+        asyncio.run(streaming_service.populate_prices(merge=merge))
+    finally:
+        sheet_logger.close()
+
+
+def run_shard(shard: Shard):
+    # worker of a sharded run started by --local-shards
+    setup()
+    run(shard, merge=False)
+
+
+def merge():
+    # coordinator step of a sharded run, once every shard is done
+    bq_client = BQClient(project=configuration.config['DEFAULT']['BIGQUERY_PROJECT'])
+    StreamingService(bq_client=bq_client, gsheet_client=None).merge_product()
 
 
 async def empty():
@@ -55,10 +79,30 @@ def prepare():
         bigquery.SchemaField("_date", "DATE", mode="REQUIRED")
     ]
     bq_client.create_presync_table("pre_sync", "competitor_price", presync_schem)
-    #bq_client.create_table("staging", "competitor_price", schema)
+    #bq_client.create_table("staging", "competitor_price", main_schem, clustering_fields=["link"])
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shard-index", type=int, default=0, help="shard crawled by this worker, from 0")
+    parser.add_argument("--shard-count", type=int, default=1,
+                        help="number of workers of a sharded run, they do not merge, run --merge-only afterwards")
+    parser.add_argument("--merge-only", action="store_true", help="merge the rows of all shards into staging")
+    parser.add_argument("--local-shards", type=int, default=0,
+                        help="run this many shards as local processes and merge once they are all done")
+    args = parser.parse_args()
+
     setup()
     #prepare()
-    run()
+    if args.merge_only:
+        merge()
+    elif args.local_shards:
+        exit_codes = run_shards(run_shard, args.local_shards)
+        if any(exit_codes):
+            logging.error(f"shards exited with {exit_codes}, not merging")
+            sys.exit(1)
+        merge()
+    elif args.shard_count > 1:
+        run(Shard(args.shard_index, args.shard_count), merge=False)
+    else:
+        run()
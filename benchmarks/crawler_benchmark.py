@@ -0,0 +1,179 @@
+import argparse
+import asyncio
+import configparser
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from clients.gsheet_client import GSheetClient
+from configurations import configuration
+from pricing import CrawlerGetter, HtmlProductCrawler
+from services.streaming_service import StreamingService
+from tests.fakes import FakeBQClient, FakeSheetsService
+from tests.fixtures import PAGES, load_page, pad_page
+from tests.http_stub import LocalHttpClient, StubServer
+
+# python -m benchmarks.crawler_benchmark [--pages N] [--page-size KB] [--rows N] [--output results.json]
+#                                        [--baseline results.json] [--threshold 0.2]
+# Runs every crawler of CrawlerGetter.CRAWLERS against its recorded page (HTML pages padded to --page-size)
+# served by a local StubServer and reports, per shop, fetch + parse throughput, per-page parse latency
+# percentiles and peak python memory of parsing (tracemalloc, lxml's C tree is not counted). The end-to-end
+# run goes through StreamingService.populate_prices with an in-memory sheet and BigQuery client.
+# With --baseline, the run fails (exit code 1) when a metric regressed by more than --threshold.
+
+CRAWL_WINDOW = 20
+MEMORY_PAGES = 5
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def shop_pages(page_size: int) -> dict:
+    # domain -> (crawler, link, body)
+    crawler_getter = CrawlerGetter()
+    pages = {}
+    for domain in CrawlerGetter.CRAWLERS:
+        link = PAGES[domain][0]
+        pages[domain] = (crawler_getter.get_crawler(link), link, pad_page(load_page(domain), page_size))
+    return pages
+
+
+def serve_pages(pages: dict) -> StubServer:
+    routes = {}
+    for crawler, link, body in pages.values():
+        routes[LocalHttpClient.local_path(crawler.get_url(link))] = lambda handler, body=body: (200, {}, body)
+    return StubServer(routes)
+
+
+def bench_shop(server: StubServer, link: str, body: bytes, n_pages: int) -> dict:
+    crawler_getter = CrawlerGetter(LocalHttpClient(server, concurrency=CRAWL_WINDOW))
+    crawler = crawler_getter.get_crawler(link)
+
+    async def crawl():
+        async with crawler_getter.http_client:
+            start = time.perf_counter()
+            await asyncio.gather(*[crawler.get_price(link) for _ in range(n_pages)])
+            return time.perf_counter() - start
+
+    elapsed = asyncio.run(crawl())
+
+    text = body.decode("utf-8")
+    latencies = []
+    for _ in range(n_pages):
+        start = time.perf_counter()
+        crawler.parse_product(text, link)
+        latencies.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    for _ in range(MEMORY_PAGES):
+        crawler.parse_product(text, link)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "pages_per_s": n_pages / elapsed,
+        "parse_p50_ms": percentile(latencies, 0.5),
+        "parse_p95_ms": percentile(latencies, 0.95),
+        "parse_p99_ms": percentile(latencies, 0.99),
+        "peak_kb": peak / 1024,
+    }
+
+
+def bench_end_to_end(server: StubServer, pages: dict, n_rows: int) -> dict:
+    links = ["link"]
+    for i in range(n_rows):
+        crawler, link, _ = list(pages.values())[i % len(pages)]
+        # distinct rows of the same page, the crawlers only read the path
+        links.append(link + ("&" if "?" in link else "?") + f"row={i}")
+    sheets_service = FakeSheetsService({"Sheet1": [["", "", "", link] for link in links]})
+    bq_client = FakeBQClient()
+    service = StreamingService(bq_client, GSheetClient("benchmark", None, service=sheets_service))
+    # app.ini without the shops' rate limits and the files kept across runs
+    service.config = configparser.ConfigParser()
+    service.config.read_dict({section: configuration.config[section] for section in configuration.config.sections()
+                              if not section.startswith("domain:")})
+    service.config.read_dict({"SCHEDULER": {"DOMAIN_RATE": "0"}, "HTTP_CACHE": {"ENABLED": "false"},
+                              "CONTENT_STORE": {"ENABLED": "false"},
+                              "PRICE_STORE": {"ENABLED": "false"}, "CHECKPOINT": {"ENABLED": "false"},
+                              "METRICS": {"ENABLED": "false"},
+                              "SINK": {"MODE": "streaming"}, "PIPELINE": {"RUN_DEADLINE": "0"}})
+    service.config.read_dict({"DEFAULT": configuration.config.defaults()})
+    http_client = LocalHttpClient(server, concurrency=service.config['HTTP'].getint('CONCURRENCY', 20))
+
+    start = time.perf_counter()
+    # no merge, it would move the watermark of the real runs
+    asyncio.run(service.populate_prices(http_client, merge=False))
+    elapsed = time.perf_counter() - start
+    return {"rows": n_rows, "inserted": len(bq_client.rows), "seconds": elapsed, "rows_per_s": n_rows / elapsed}
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}/"))
+        elif isinstance(value, (int, float)):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(baseline: dict, results: dict, threshold: float) -> list:
+    # metrics ending with _per_s are better when higher, the others (latencies, memory, seconds) when lower
+    regressions = []
+    current = flatten(results)
+    for key, before in flatten(baseline).items():
+        after = current.get(key)
+        if after is None or not before or key.startswith("environment/") or key.endswith(("/rows", "/inserted")):
+            continue
+        change = (before - after) / before if key.endswith("_per_s") else (after - before) / before
+        if change > threshold:
+            regressions.append(f"{key}: {before:.2f} -> {after:.2f} ({change:.0%} worse)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=100, help="pages crawled per shop")
+    parser.add_argument("--page-size", type=int, default=500, help="size of the HTML pages in KB")
+    parser.add_argument("--rows", type=int, default=1000, help="sheet rows of the end-to-end run")
+    parser.add_argument("--output", help="write the results to this json file")
+    parser.add_argument("--baseline", help="results json of a previous run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed regression, 0.2 = 20%%")
+    args = parser.parse_args()
+
+    pages = shop_pages(args.page_size * 1024)
+    results = {"environment": {"python": platform.python_version(), "cpus": os.cpu_count(),
+                               "pages": args.pages, "page_size_kb": args.page_size},
+               "shops": {}}
+
+    print(f"{args.pages} pages per shop, HTML pages of {args.page_size}KB")
+    print(f"{'shop':<20} {'kind':<5} {'pages/s':>8} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'peak KB':>8}")
+    with serve_pages(pages) as server:
+        for domain, (crawler, link, body) in pages.items():
+            shop = bench_shop(server, link, body, args.pages)
+            results["shops"][domain] = shop
+            kind = "html" if isinstance(crawler, HtmlProductCrawler) else "api"
+            print(f"{domain:<20} {kind:<5} {shop['pages_per_s']:>8.1f} {shop['parse_p50_ms']:>7.2f} "
+                  f"{shop['parse_p95_ms']:>7.2f} {shop['parse_p99_ms']:>7.2f} {shop['peak_kb']:>8.0f}")
+        results["end_to_end"] = bench_end_to_end(server, pages, args.rows)
+    e2e = results["end_to_end"]
+    print(f"populate_prices: {e2e['rows']} rows in {e2e['seconds']:.2f}s ({e2e['rows_per_s']:.1f} rows/s), "
+          f"{e2e['inserted']} inserted")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import asyncio
+import os
+import sys
+import time
+
+from google.cloud import bigquery
+
+from clients.bq_client import BQClient
+from pricing import Product
+from services.product_sink import BQProductSink, LoadJobProductSink
+
+# python -m benchmarks.ingest_benchmark [rows ...]
+# Ingests N products through the streaming sink and the load-job sink with a local stand-in for the BigQuery
+# API. The stand-in does not sleep, it adds up the network time each request would take under the assumptions
+# below, so a run reports local CPU time + simulated network time and the billed amount.
+
+REQUEST_LATENCY = 0.15         # seconds per API round trip
+UPLOAD_BYTES_PER_SECOND = 10e6
+LOAD_JOB_OVERHEAD = 2.0        # seconds for a load job to be scheduled and finish
+STREAMING_PRICE_PER_MB = 0.01 / 200  # $0.01 per 200MB, each row billed at least 1KB
+STREAMING_MIN_ROW_BYTES = 1024
+ROW_BYTES = 200                # approximate size of a competitor_price row
+
+
+class StandInTable:
+
+    schema = [
+        bigquery.SchemaField("_date", "DATE", mode="REQUIRED"),
+        bigquery.SchemaField("_created_at", "TIMESTAMP", mode="REQUIRED"),
+        bigquery.SchemaField("link", "STRING", mode="REQUIRED"),
+        bigquery.SchemaField("sale_price", "INT64"),
+        bigquery.SchemaField("original_price", "INT64"),
+    ]
+
+
+class StandInJob:
+
+    job_id = "stand-in"
+
+    def __init__(self, output_rows):
+        self.output_rows = output_rows
+
+    def result(self, timeout=None):
+        return self
+
+
+class StandInBigQuery:
+
+    def __init__(self):
+        self.network_time = 0.0
+        self.billed_bytes = 0
+
+    def get_table(self, table_ref):
+        self.network_time += REQUEST_LATENCY
+        return StandInTable()
+
+    def insert_rows(self, table, rows):
+        payload = len(rows) * ROW_BYTES
+        self.network_time += REQUEST_LATENCY + payload / UPLOAD_BYTES_PER_SECOND
+        self.billed_bytes += len(rows) * max(ROW_BYTES, STREAMING_MIN_ROW_BYTES)
+        return []
+
+    def load_table_from_file(self, f, destination, job_config=None):
+        size = os.fstat(f.fileno()).st_size
+        self.network_time += REQUEST_LATENCY + size / UPLOAD_BYTES_PER_SECOND + LOAD_JOB_OVERHEAD
+        return StandInJob(output_rows=None)
+
+
+def ingest(sink, n: int):
+    async def run():
+        queue = asyncio.Queue(maxsize=1000)
+        consumer = asyncio.create_task(sink.consume(queue))
+        for i in range(n):
+            await queue.put(Product(original_price=1990000 + i, sale_price=1790000 + i,
+                                    link=f"https://cellphones.com.vn/samsung-galaxy-s{i}.html"))
+        await queue.put(None)
+        await consumer
+
+    asyncio.run(run())
+
+
+def main():
+    sizes = [int(n) for n in sys.argv[1:]] or [10_000, 100_000]
+    print(f"{'rows':>8} {'mode':>10} {'cpu s':>7} {'network s':>10} {'total s':>8} {'requests':>9} {'cost $':>9}")
+    for n in sizes:
+        for mode in ("streaming", "load"):
+            stand_in = StandInBigQuery()
+            bq_client = BQClient("stand-in", client=stand_in)
+            sink = BQProductSink(bq_client, flush_rows=500) if mode == "streaming" else LoadJobProductSink(bq_client)
+            start = time.perf_counter()
+            ingest(sink, n)
+            cpu = time.perf_counter() - start
+            cost = stand_in.billed_bytes / 1e6 * STREAMING_PRICE_PER_MB
+            print(f"{n:>8} {mode:>10} {cpu:>7.2f} {stand_in.network_time:>10.2f} {cpu + stand_in.network_time:>8.2f} "
+                  f"{sum(bq_client.api_calls.values()):>9} {cost:>9.5f}")
+
+
+if __name__ == '__main__':
+    main()
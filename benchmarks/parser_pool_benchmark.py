@@ -0,0 +1,48 @@
+import asyncio
+import sys
+import time
+
+from pricing import CrawlerGetter, HtmlProductCrawler
+from services.parser_pool import ParserPool
+from tests.fixtures import PAGES, load_page, pad_page
+
+# python -m benchmarks.parser_pool_benchmark [pages]
+# Parses saved product pages of every HTML shop (padded to 500KB) through a ParserPool with 1, 2 and 4 workers
+# and reports products/sec. Worker start-up is excluded by warming the pool up first.
+
+PAGE_SIZE = 500 * 1024
+
+
+async def parse_all(parser_pool: ParserPool, jobs) -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*[parser_pool.parse(crawler, page, "utf-8", link) for crawler, page, link in jobs])
+    return time.perf_counter() - start
+
+
+def main():
+    n_pages = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    crawler_getter = CrawlerGetter()
+    shops = []
+    for domain, (link, _, _) in PAGES.items():
+        crawler = crawler_getter.get_crawler(link)
+        if isinstance(crawler, HtmlProductCrawler):
+            shops.append((crawler, pad_page(load_page(domain), PAGE_SIZE), link))
+    jobs = [shops[i % len(shops)] for i in range(n_pages)]
+
+    start = time.perf_counter()
+    for crawler, page, link in jobs:
+        crawler.parse_product(page.decode("utf-8"), link)
+    inline = time.perf_counter() - start
+    print(f"{n_pages} pages of {PAGE_SIZE // 1024}KB")
+    print(f"{'workers':>8} {'products/s':>11}")
+    print(f"{'inline':>8} {n_pages / inline:>11.1f}")
+
+    for workers in (1, 2, 4):
+        with ParserPool(workers) as parser_pool:
+            asyncio.run(parse_all(parser_pool, shops * workers))
+            elapsed = asyncio.run(parse_all(parser_pool, jobs))
+        print(f"{workers:>8} {n_pages / elapsed:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
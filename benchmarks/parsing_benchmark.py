@@ -0,0 +1,67 @@
+import multiprocessing
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+from bs4 import BeautifulSoup
+
+from pricing import CrawlerGetter, HtmlProductCrawler
+from tests.fixtures import PAGES, load_page, pad_page
+
+# python -m benchmarks.parsing_benchmark [page size in KB]
+# Compares, for every HTML crawler, building the full BeautifulSoup tree of a saved product page (padded to a
+# realistic size) with the partial parse of the crawler's PRICE_ELEMENTS. Peak memory is measured with
+# tracemalloc in a fresh process per run; it covers python objects only, the partial parse additionally holds
+# lxml's C tree of the page (a few MB for 500KB) until the price regions are extracted.
+
+REPEATS = 5
+
+
+def get_crawler(domain: str, mode: str) -> HtmlProductCrawler:
+    crawler = CrawlerGetter().get_crawler(PAGES[domain][0])
+    if mode == "full":
+        crawler.parse_html = lambda text: BeautifulSoup(text, 'lxml')
+    return crawler
+
+
+def measure_memory(domain: str, mode: str, size: int) -> float:
+    crawler = get_crawler(domain, mode)
+    text = pad_page(load_page(domain), size).decode("utf-8")
+    link = PAGES[domain][0]
+    tracemalloc.start()
+    crawler.parse_product(text, link)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def measure_time(domain: str, mode: str, size: int) -> float:
+    crawler = get_crawler(domain, mode)
+    text = pad_page(load_page(domain), size).decode("utf-8")
+    link = PAGES[domain][0]
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        crawler.parse_product(text, link)
+    return (time.perf_counter() - start) / REPEATS * 1000
+
+
+def main():
+    size = int(sys.argv[1]) * 1024 if len(sys.argv) > 1 else 500 * 1024
+    domains = [domain for domain, (link, _, _) in PAGES.items()
+               if isinstance(CrawlerGetter().get_crawler(link), HtmlProductCrawler)]
+    print(f"page size {size // 1024}KB, {REPEATS} repeats")
+    print(f"{'shop':<20} {'full ms':>8} {'partial ms':>10} {'speedup':>8} {'full peak KB':>12} {'partial peak KB':>15}")
+    context = multiprocessing.get_context("spawn")
+    for domain in domains:
+        row = {}
+        for mode in ("full", "partial"):
+            row[mode + "_ms"] = measure_time(domain, mode, size)
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                row[mode + "_kb"] = executor.submit(measure_memory, domain, mode, size).result()
+        print(f"{domain:<20} {row['full_ms']:>8.1f} {row['partial_ms']:>10.1f} "
+              f"{row['full_ms'] / row['partial_ms']:>7.1f}x {row['full_kb']:>12.0f} {row['partial_kb']:>15.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+import random
+import sys
+import time
+
+from price_parser import parse_price, parse_prices
+
+# python -m benchmarks.price_parser_benchmark [texts]
+# Parses price texts as printed by the shops with the former helper.human_price_to_integer, parse_price one
+# text at a time and parse_prices in one batch, and reports microseconds per text.
+
+TEMPLATES = ["{} ₫", "{}đ", "Giá: {} vnđ", "\n    {} ₫\n  ", "{}"]
+
+
+def human_price_to_integer(human_price):
+    # former helper.human_price_to_integer
+    price_str = ''.join(filter(str.isnumeric, human_price))
+    return int(price_str, 10)
+
+
+def measure(func, texts) -> float:
+    start = time.perf_counter()
+    func(texts)
+    return (time.perf_counter() - start) / len(texts) * 1e6
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    rnd = random.Random(0)
+    texts = [rnd.choice(TEMPLATES).format(f"{rnd.randint(100, 50000) * 1000:,}".replace(",", rnd.choice(".,")))
+             for _ in range(n)]
+    print(f"{n} texts")
+    print(f"{'parser':<24} {'us/text':>8}")
+    for name, func in [("human_price_to_integer", lambda ts: [human_price_to_integer(t) for t in ts]),
+                       ("parse_price", lambda ts: [parse_price(t) for t in ts]),
+                       ("parse_prices", parse_prices)]:
+        print(f"{name:<24} {measure(func, texts):>8.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+import sys
+import tracemalloc
+
+from pricing import Product, ProductBatch
+
+# python -m benchmarks.product_memory_benchmark [products]
+# Python memory (tracemalloc) held by N crawled products: the former Product class with a __dict__ per
+# instance, the Product record, and a ProductBatch. The links are built beforehand and shared by all three,
+# so only the memory of the products themselves is counted; the prices are new ints, as parsed from a page.
+# Interning the links costs a slot of the interpreter's interned strings dict while the batch is alive.
+
+
+class DictProduct:
+    # former pricing.Product
+
+    def __init__(self, original_price: float, sale_price: float, name: str = None, link: str = None):
+        self.name = name
+        self.original_price = original_price
+        self.sale_price = sale_price
+        self.link = link
+
+
+def measure(build) -> int:
+    tracemalloc.start()
+    products = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del products
+    return size
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    links = [f"https://tiki.vn/san-pham-{i}-p{10000000 + i}.html" for i in range(n)]
+
+    def crawled(record):
+        return (record(1990000 + i * 1000, 1790000 + i * 1000, link=link) for i, link in enumerate(links))
+
+    results = {
+        "dict Product": measure(lambda: list(crawled(DictProduct))),
+        "Product": measure(lambda: list(crawled(Product))),
+        "ProductBatch": measure(lambda: ProductBatch(crawled(Product))),
+    }
+    print(f"{n} products")
+    print(f"{'container':<14} {'MB':>8} {'bytes/product':>14}")
+    for name, size in results.items():
+        print(f"{name:<14} {size / 1024 / 1024:>8.2f} {size / n:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
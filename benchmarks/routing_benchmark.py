@@ -0,0 +1,44 @@
+import random
+import time
+
+from pricing import CrawlerGetter, ProductCrawler
+
+# python -m benchmarks.routing_benchmark
+# Routes 100k links through CrawlerGetter.get_crawler with the real registry and with thousands of extra
+# fake shops registered; the per-link cost should stay flat.
+
+N_LINKS = 100_000
+
+
+def make_links(domains, n):
+    rnd = random.Random(42)
+    prefixes = ["https://", "https://www.", "http://m.", ""]
+    links = []
+    for i in range(n):
+        domain = rnd.choice(domains)
+        links.append(f"{rnd.choice(prefixes)}{domain}/product-{i}.html?gclid=abc{i}&ref=tiki.vn")
+    return links
+
+
+def bench(registry: dict, links) -> float:
+    crawler_getter = CrawlerGetter(registry=registry)
+    start = time.perf_counter()
+    for link in links:
+        crawler_getter.get_crawler(link)
+    return time.perf_counter() - start
+
+
+def main():
+    real_domains = list(CrawlerGetter.CRAWLERS)
+    links = make_links(real_domains, N_LINKS)
+    print(f"{'shops':>8} {'total (s)':>10} {'per link (us)':>14}")
+    for extra in (0, 100, 1000, 10000):
+        registry = dict(CrawlerGetter.CRAWLERS)
+        for i in range(extra):
+            registry[f"shop{i}.example.vn"] = ProductCrawler
+        elapsed = bench(registry, links)
+        print(f"{len(registry):>8} {elapsed:>10.3f} {elapsed / N_LINKS * 1e6:>14.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,21 +1,62 @@
+from collections import Counter
 from datetime import datetime, date
 
 from google.cloud import bigquery
-from typing import List
+from typing import Iterable, Iterator, List, Tuple
 from pytz import timezone
 import logging
+import time
 
 from google.cloud.bigquery import DatasetReference
 
-from pricing import Product
+from pricing import Product, ProductBatch
+
+
+# rough size of an inserted row without its link: the json of _date, _created_at and both prices
+ROW_OVERHEAD_BYTES = 120
+
+
+def chunk_products(products: Iterable[Product], chunk_rows: int = 500,
+                   chunk_bytes: int = 5 * 1024 * 1024) -> Iterator[ProductBatch]:
+    # streaming inserts are limited to 10MB per request, 500 rows is the recommended batch size
+    if isinstance(products, ProductBatch):
+        yield from _slice_batch(products, chunk_rows, chunk_bytes)
+        return
+    chunk, chunk_size = ProductBatch(), 0
+    for product in products:
+        row_size = len(product.link or "") + ROW_OVERHEAD_BYTES
+        if chunk and (len(chunk) >= chunk_rows or chunk_size + row_size > chunk_bytes):
+            yield chunk
+            chunk, chunk_size = ProductBatch(), 0
+        chunk.append(product)
+        chunk_size += row_size
+    if chunk:
+        yield chunk
+
+
+def _slice_batch(batch: ProductBatch, chunk_rows: int, chunk_bytes: int) -> Iterator[ProductBatch]:
+    start, chunk_size = 0, 0
+    for i, link in enumerate(batch.links):
+        row_size = len(link or "") + ROW_OVERHEAD_BYTES
+        if i > start and (i - start >= chunk_rows or chunk_size + row_size > chunk_bytes):
+            yield batch[start:i]
+            start, chunk_size = i, 0
+        chunk_size += row_size
+    if start < len(batch):
+        yield batch[start:]
 
 
 class BQClient:
 
-    def __init__(self, project: str):
+    def __init__(self, project: str, table_cache_ttl: float = 3600, client: bigquery.Client = None):
         self.project = project
-        self.client = bigquery.Client(project=project)
+        self.client = client if client is not None else bigquery.Client(project=project)
         self.hcm_timezone = timezone("Asia/Ho_Chi_Minh")
+        self.table_cache_ttl = table_cache_ttl
+        # "dataset.table" -> (expires_at, table)
+        self._tables = {}
+        # number of BigQuery API requests by method
+        self.api_calls = Counter()
 
     def create_presync_table(self, dataset: str, table_name: str, schema: List[bigquery.SchemaField]):
         schema.insert(0, bigquery.SchemaField("_created_at", "TIMESTAMP", mode="REQUIRED"))
@@ -29,9 +70,11 @@ class BQClient:
             expiration_ms=7*24*60*60*1000, # 7 days
         )
         table = self.client.create_table(table)  # Make an API request.
+        self.api_calls["create_table"] += 1
         logging.log(logging.INFO, "Created table {}.{}.{}".format(table.project, table.dataset_id, table.table_id))
 
-    def create_table(self, dataset: str, table_name: str, schema: List[bigquery.SchemaField]):
+    def create_table(self, dataset: str, table_name: str, schema: List[bigquery.SchemaField],
+                     clustering_fields: List[str] = None):
         dataset_ref = DatasetReference(project=self.project, dataset_id=dataset)
         table_ref = dataset_ref.table(table_name)
         table = bigquery.Table(table_ref, schema=schema)
@@ -39,26 +82,82 @@ class BQClient:
             type_=bigquery.TimePartitioningType.DAY,
             field="_date",  # name of column to use for partitioning
         )  # 90 days
+        # e.g. ["link"]: the MERGE only reads the blocks of the partition holding the merged links
+        table.clustering_fields = clustering_fields
         table = self.client.create_table(table)  # Make an API request.
+        self.api_calls["create_table"] += 1
 
         logging.log(logging.INFO, "Created table {}.{}.{}".format(table.project, table.dataset_id, table.table_id))
 
-    def insert_product(self, dataset: str, table_name: str, products: Product):
+    def get_table(self, dataset: str, table_name: str) -> bigquery.Table:
+        key = f"{dataset}.{table_name}"
+        cached = self._tables.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
         dataset_ref = DatasetReference(project=self.project, dataset_id=dataset)
-        table_ref = dataset_ref.table(table_name)
-        table = self.client.get_table(table_ref)
+        table = self.client.get_table(dataset_ref.table(table_name))
+        self.api_calls["get_table"] += 1
+        self._tables[key] = (time.monotonic() + self.table_cache_ttl, table)
+        return table
+
+    def insert_products(self, dataset: str, table_name: str, products: Iterable[Product], chunk_rows: int = 500,
+                        chunk_bytes: int = 5 * 1024 * 1024) -> List[Tuple[ProductBatch, list]]:
+        # Streams `products` as insert requests of at most chunk_rows rows / chunk_bytes bytes, only one chunk of
+        # rows is built at a time. Returns the chunks that failed with their errors.
+        table = self.get_table(dataset, table_name)
+        columns = [field.name for field in table.schema]
         hcm_now = datetime.now(self.hcm_timezone)
-        today = hcm_now.date()
-        rows = []
-        for p in products:
-            rows.append({"_date": today, "_created_at": hcm_now, "link": p.link, "original_price": p.original_price, "sale_price": p.sale_price})
-        errors = self.client.insert_rows(table=table, rows=rows)
+        extra = {"_date": hcm_now.date(), "_created_at": hcm_now}
+        failed = []
+        for chunk in chunk_products(products, chunk_rows, chunk_bytes):
+            # tuples in the order of the table's columns, insert_rows takes them without a dict per row
+            rows = chunk.rows(columns, extra)
+            try:
+                errors = self.client.insert_rows(table=table, rows=rows)
+            except Exception as e:
+                errors = [str(e)]
+            self.api_calls["insert_rows"] += 1
+            if errors:
+                logging.error(f"Encountered errors while inserting {len(rows)} rows: {errors}")
+                failed.append((chunk, errors))
+        return failed
+
+    @staticmethod
+    def to_row(p: Product, today: date, now: datetime) -> dict:
+        return {"_date": today, "_created_at": now, "link": p.link, "original_price": p.original_price, "sale_price": p.sale_price}
+
+    def now(self) -> datetime:
+        return datetime.now(self.hcm_timezone)
+
+    def load_file(self, dataset: str, table_name: str, path: str, partition: date = None) -> int:
+        # Loads a (gzipped) newline delimited json file into the table, or into one of its day partitions.
+        # Load jobs are free and their rows are visible to queries right away, unlike the streaming buffer.
+        table = self.get_table(dataset, table_name)
+        destination = f"{self.project}.{dataset}.{table_name}"
+        if partition is not None:
+            destination += "$" + partition.strftime("%Y%m%d")
+        job_config = bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+            write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+            schema=table.schema,
+        )
+        with open(path, "rb") as f:
+            job = self.client.load_table_from_file(f, destination, job_config=job_config)
+        self.api_calls["load_table_from_file"] += 1
+        job.result()
+        logging.info(f"load job {job.job_id} loaded {job.output_rows} rows into {destination}")
+        return job.output_rows
 
+    def insert_product(self, dataset: str, table_name: str, products: List[Product]):
+        failed = self.insert_products(dataset, table_name, products)
+        errors = [error for _, chunk_errors in failed for error in chunk_errors]
         if not errors:
             logging.info("New rows have been added.")
-        else:
-            logging.error(f"Encountered errors while inserting rows: {errors}")
+        return errors
 
-    def query(self, sql: str):
-        query_job = self.client.query(sql)
+    def query(self, sql: str, dry_run: bool = False):
+        # a dry run is free, the returned job only tells the bytes the query would process
+        job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False) if dry_run else None
+        query_job = self.client.query(sql, job_config=job_config)
+        self.api_calls["query"] += 1
         return query_job
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from pricing import Product
+
+
+class ContentStore:
+
+    # On-disk url -> (content digest, Product) store kept across runs, for shops without usable validators.
+    # Crawlers digest the fetched body (or its price regions, see HtmlProductCrawler.content_digest) and reuse the
+    # stored product when the digest did not change, so the page is not parsed at all. A product parsed more than
+    # `max_age` seconds ago is parsed again even when the digest matches. The store keeps at most `max_entries`
+    # urls, the least recently used ones are evicted.
+    def __init__(self, path: str, max_entries: int = 500_000, max_age: float = 24 * 3600, commit_every: int = 100):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.commit_every = commit_every
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        # crawlers call the store through run(), on this thread, so sqlite never blocks the event loop
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="content_store")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS content_store (
+                url TEXT PRIMARY KEY,
+                digest BLOB,
+                name TEXT,
+                sale_price INTEGER,
+                original_price INTEGER,
+                used_at INTEGER,
+                stored_at REAL
+            )""")
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(content_store)")]
+        if "stored_at" not in columns:
+            # store of a previous version, its products are parsed again
+            self.connection.execute("ALTER TABLE content_store ADD COLUMN stored_at REAL DEFAULT 0")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS content_store_used_at ON content_store (used_at)")
+        # logical clock ordering the accesses, wall time has ties
+        self.clock = self.connection.execute("SELECT COALESCE(MAX(used_at), 0) FROM content_store").fetchone()[0]
+        # number of urls in the store, counted once and kept up to date by put and evict
+        self.count = self.connection.execute("SELECT COUNT(*) FROM content_store").fetchone()[0]
+        self.pending_writes = 0
+        # domain -> counters: hits, misses
+        self.counters = defaultdict(Counter)
+
+    @classmethod
+    def from_config(cls, config):
+        # None when the store is disabled
+        if not config.has_section('CONTENT_STORE') or not config['CONTENT_STORE'].getboolean('ENABLED', False):
+            return None
+        store_config = config['CONTENT_STORE']
+        return cls(store_config.get('PATH', 'content_store.sqlite'),
+                   max_entries=store_config.getint('MAX_ENTRIES', 500_000),
+                   max_age=store_config.getfloat('MAX_AGE', 24 * 3600))
+
+    def get(self, domain: str, url: str, digest: bytes, link: str) -> Product:
+        row = self.connection.execute(
+            "SELECT digest, name, sale_price, original_price, stored_at FROM content_store WHERE url = ?",
+            (url,)).fetchone()
+        if row is None or row[0] != digest or time.time() - row[4] > self.max_age:
+            self.counters[domain]['misses'] += 1
+            return None
+        self.counters[domain]['hits'] += 1
+        self._write("UPDATE content_store SET used_at = ? WHERE url = ?", (self._tick(), url))
+        return Product(original_price=row[3], sale_price=row[2], name=row[1], link=link)
+
+    def put(self, url: str, digest: bytes, product: Product):
+        values = (digest, product.name, product.sale_price, product.original_price, self._tick(), time.time())
+        inserted = self.connection.execute("INSERT OR IGNORE INTO content_store VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                           (url, *values)).rowcount
+        if inserted:
+            self.count += 1
+            self._written()
+        else:
+            self._write("UPDATE content_store SET digest = ?, name = ?, sale_price = ?, original_price = ?, "
+                        "used_at = ?, stored_at = ? WHERE url = ?", (*values, url))
+
+    def _tick(self) -> int:
+        self.clock += 1
+        return self.clock
+
+    def _write(self, statement: str, parameters: tuple):
+        self.connection.execute(statement, parameters)
+        self._written()
+
+    def _written(self):
+        self.pending_writes += 1
+        if self.pending_writes >= self.commit_every:
+            self.commit()
+
+    def evict(self):
+        if self.count > self.max_entries:
+            self.count -= self.connection.execute(
+                "DELETE FROM content_store WHERE url IN (SELECT url FROM content_store ORDER BY used_at LIMIT ?)",
+                (self.count - self.max_entries,)).rowcount
+
+    def commit(self):
+        self.evict()
+        self.connection.commit()
+        self.pending_writes = 0
+
+    def __len__(self):
+        return self.count
+
+    def stats(self) -> dict:
+        stats = {}
+        for domain, counters in sorted(self.counters.items()):
+            requests = counters['hits'] + counters['misses']
+            stats[domain] = {
+                'requests': requests,
+                'hits': counters['hits'],
+                'hit_rate': counters['hits'] / requests if requests else 0.0,
+            }
+        return stats
+
+    def log_stats(self):
+        for domain, s in self.stats().items():
+            logging.info(f"content store {domain}: {s['hits']}/{s['requests']} unchanged pages ({s['hit_rate']:.0%})")
+
+    async def run(self, method, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, method, *args)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.commit()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
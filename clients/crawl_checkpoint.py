@@ -0,0 +1,107 @@
+import logging
+import sqlite3
+import time
+from datetime import date
+
+from pricing import Product
+
+
+class CrawlCheckpoint:
+
+    # On-disk journal of the rows crawled by the current run: row index -> link and product. A run that dies
+    # halfway is resumed by the next run of the same day, the rows in the journal are not crawled again and
+    # their products go to the sink and the sheet writer as if just crawled (the price store and the MERGE
+    # drop the ones BigQuery already has). Rows are buffered and written every `commit_rows` rows or
+    # `commit_interval` seconds with one executemany and one commit, a crash loses at most that buffer, whose
+    # rows are crawled again. A finished run clears the journal, a journal of another day is discarded.
+    def __init__(self, path: str, today: date, commit_rows: int = 500, commit_interval: float = 5):
+        self.path = path
+        self.today = today.isoformat()
+        self.commit_rows = commit_rows
+        self.commit_interval = commit_interval
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        # the journal is the only writer, a commit does not need to wait for the data to reach the disk
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS crawl_checkpoint (
+                run_date TEXT,
+                row_index INTEGER,
+                link TEXT,
+                name TEXT,
+                sale_price INTEGER,
+                original_price INTEGER,
+                PRIMARY KEY (run_date, row_index)
+            )""")
+        stale = self.connection.execute("DELETE FROM crawl_checkpoint WHERE run_date != ?", (self.today,)).rowcount
+        self.connection.commit()
+        if stale:
+            logging.info(f"discarded {stale} checkpointed rows of a previous day")
+        # row index -> (link, Product) of the rows committed by an interrupted run
+        self.restored = {}
+        for row_index, link, name, sale_price, original_price in self.connection.execute(
+                "SELECT row_index, link, name, sale_price, original_price FROM crawl_checkpoint WHERE run_date = ?",
+                (self.today,)):
+            self.restored[row_index] = (link, Product(original_price=original_price, sale_price=sale_price,
+                                                      name=name, link=link))
+        if self.restored:
+            logging.info(f"resuming the run of {self.today}, {len(self.restored)} rows already crawled")
+        self.buffer = []
+        self.last_commit_at = time.monotonic()
+        self.resumed = 0
+        self.commits = 0
+
+    @classmethod
+    def from_config(cls, config, today: date):
+        # None when checkpoints are disabled
+        if not config.has_section('CHECKPOINT') or not config['CHECKPOINT'].getboolean('ENABLED', False):
+            return None
+        checkpoint_config = config['CHECKPOINT']
+        return cls(checkpoint_config.get('PATH', 'crawl_checkpoint.sqlite'), today,
+                   commit_rows=checkpoint_config.getint('COMMIT_ROWS', 500),
+                   commit_interval=checkpoint_config.getfloat('COMMIT_INTERVAL', 5))
+
+    def get(self, row_index: int, link: str) -> Product:
+        # product of the row when the interrupted run crawled it and the row still holds the same link
+        restored = self.restored.get(row_index)
+        if restored is None or restored[0] != link:
+            return None
+        self.resumed += 1
+        return restored[1]
+
+    def record(self, row_index: int, product: Product):
+        self.buffer.append((self.today, row_index, product.link, product.name, product.sale_price,
+                            product.original_price))
+        if len(self.buffer) >= self.commit_rows or time.monotonic() - self.last_commit_at >= self.commit_interval:
+            self.commit()
+
+    def commit(self):
+        self.last_commit_at = time.monotonic()
+        if not self.buffer:
+            return
+        rows, self.buffer = self.buffer, []
+        self.connection.executemany("INSERT OR REPLACE INTO crawl_checkpoint VALUES (?, ?, ?, ?, ?, ?)", rows)
+        self.connection.commit()
+        self.commits += 1
+
+    def finish(self):
+        # the run went through, the next run starts from the first row
+        self.buffer = []
+        self.connection.execute("DELETE FROM crawl_checkpoint WHERE run_date = ?", (self.today,))
+        self.connection.commit()
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM crawl_checkpoint").fetchone()[0] + len(self.buffer)
+
+    def log_stats(self):
+        logging.info(f"checkpoint: {self.resumed} rows resumed without crawling, {self.commits} commits")
+
+    def close(self):
+        self.commit()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -1,6 +1,7 @@
 from __future__ import print_function
 import pickle
 import os.path
+from typing import List, Tuple
 
 from google.oauth2 import service_account
 from oauth2client.service_account import ServiceAccountCredentials
@@ -13,7 +14,7 @@ from google.auth.transport.requests import Request
 
 class GSheetClient:
     
-    def __init__(self, spreadsheet_id, scopes):
+    def __init__(self, spreadsheet_id, scopes, service=None):
         # creds = None
         # # The file token.pickle stores the user's access and refresh tokens, and is
         # # created automatically when the authorization flow completes for the first
@@ -33,9 +34,11 @@ class GSheetClient:
         #     with open('token.pickle', 'wb') as token:
         #         pickle.dump(creds, token)
 
-        credentials = service_account.Credentials.from_service_account_file('product-crawler-service-account.json')
         self.spreadsheet_id = spreadsheet_id
-        self.service = build('sheets', 'v4', credentials=credentials)
+        if service is None:
+            credentials = service_account.Credentials.from_service_account_file('product-crawler-service-account.json')
+            service = build('sheets', 'v4', credentials=credentials)
+        self.service = service
         self.sheet = self.service.spreadsheets()
 
     def get(self, range_name):
@@ -43,9 +46,35 @@ class GSheetClient:
                                     range=range_name).execute()
         return result.get('values', [])
 
+    def batch_get(self, range_names: List[str]) -> List[list]:
+        result = self.sheet.values().batchGet(spreadsheetId=self.spreadsheet_id, ranges=range_names).execute()
+        return [value_range.get('values', []) for value_range in result.get('valueRanges', [])]
+
+    def get_row_count(self, sheet_title: str) -> int:
+        # size of the sheet's grid, an upper bound of the used rows. The title may be quoted as in an A1 range
+        # ('My Sheet'), a sheet that does not exist is an error rather than an empty sheet
+        title = sheet_title
+        if len(title) >= 2 and title[0] == title[-1] == "'":
+            title = title[1:-1].replace("''", "'")
+        result = self.sheet.get(spreadsheetId=self.spreadsheet_id, ranges=[sheet_title],
+                                fields="sheets.properties(title,gridProperties.rowCount)").execute()
+        for sheet in result.get('sheets', []):
+            if sheet['properties']['title'] == title:
+                return sheet['properties']['gridProperties']['rowCount']
+        raise ValueError(f"sheet {sheet_title!r} not found")
+
     def update(self, range_name, values):
         body = {
             'values': values
         }
         value_input_option = "RAW"
         result = self.sheet.values().update(spreadsheetId=self.spreadsheet_id, range=range_name, valueInputOption=value_input_option, body=body).execute()
+
+    def batch_update(self, data: List[Tuple[str, list]], value_input_option: str = "RAW") -> int:
+        # writes several ranges in one values.batchUpdate request, returns the number of updated rows
+        body = {
+            'valueInputOption': value_input_option,
+            'data': [{'range': range_name, 'values': values} for range_name, values in data],
+        }
+        result = self.sheet.values().batchUpdate(spreadsheetId=self.spreadsheet_id, body=body).execute()
+        return result.get('totalUpdatedRows', 0)
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from pricing import Product
+
+
+class CacheEntry:
+
+    def __init__(self, url: str, etag: str, last_modified: str, name: str, sale_price, original_price, size: int,
+                 stored_at: float):
+        self.url = url
+        self.etag = etag
+        self.last_modified = last_modified
+        self.name = name
+        self.sale_price = sale_price
+        self.original_price = original_price
+        self.size = size
+        self.stored_at = stored_at
+
+    def conditional_headers(self) -> dict:
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def product(self, link: str) -> Product:
+        return Product(original_price=self.original_price, sale_price=self.sale_price, name=self.name, link=link)
+
+
+class HttpCache:
+
+    # On-disk cache kept across runs: url -> validators (ETag / Last-Modified) of the last 200 response and the
+    # Product parsed from it. Crawlers send the validators back and a 304 answer is served from the cache without
+    # downloading or parsing the page. Entries older than `max_age` seconds are not revalidated, so every product
+    # page is downloaded in full at least that often.
+    def __init__(self, path: str, max_age: float = 7 * 24 * 3600, commit_every: int = 100):
+        self.path = path
+        self.max_age = max_age
+        self.commit_every = commit_every
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        # crawlers call the store through run(), on this thread, so sqlite never blocks the event loop
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="http_cache")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS http_cache (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                name TEXT,
+                sale_price INTEGER,
+                original_price INTEGER,
+                size INTEGER,
+                stored_at REAL
+            )""")
+        self.pending_writes = 0
+        # domain -> counters: hits, misses, uncacheable, bytes_saved, bytes_downloaded
+        self.counters = defaultdict(Counter)
+
+    @classmethod
+    def from_config(cls, config):
+        # None when the cache is disabled
+        if not config.has_section('HTTP_CACHE') or not config['HTTP_CACHE'].getboolean('ENABLED', False):
+            return None
+        cache_config = config['HTTP_CACHE']
+        return cls(cache_config.get('PATH', 'http_cache.sqlite'),
+                   max_age=cache_config.getfloat('MAX_AGE', 7 * 24 * 3600))
+
+    def get(self, url: str) -> CacheEntry:
+        row = self.connection.execute(
+            "SELECT url, etag, last_modified, name, sale_price, original_price, size, stored_at "
+            "FROM http_cache WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        entry = CacheEntry(*row)
+        if time.time() - entry.stored_at > self.max_age:
+            return None
+        return entry
+
+    def hit(self, domain: str, entry: CacheEntry):
+        self.counters[domain]['hits'] += 1
+        self.counters[domain]['bytes_saved'] += entry.size
+
+    def store(self, domain: str, url: str, headers, content: bytes, product: Product):
+        counters = self.counters[domain]
+        counters['misses'] += 1
+        counters['bytes_downloaded'] += len(content)
+        etag, last_modified = headers.get('ETag'), headers.get('Last-Modified')
+        if not etag and not last_modified:
+            counters['uncacheable'] += 1
+            return
+        self.connection.execute(
+            "INSERT OR REPLACE INTO http_cache VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (url, etag, last_modified, product.name, product.sale_price, product.original_price, len(content),
+             time.time()))
+        self.pending_writes += 1
+        if self.pending_writes >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        self.connection.commit()
+        self.pending_writes = 0
+
+    def stats(self) -> dict:
+        stats = {}
+        for domain, counters in sorted(self.counters.items()):
+            requests = counters['hits'] + counters['misses']
+            stats[domain] = {
+                'requests': requests,
+                'hits': counters['hits'],
+                'hit_rate': counters['hits'] / requests if requests else 0.0,
+                'uncacheable': counters['uncacheable'],
+                'bytes_saved': counters['bytes_saved'],
+                'bytes_downloaded': counters['bytes_downloaded'],
+            }
+        return stats
+
+    def log_stats(self):
+        for domain, s in self.stats().items():
+            logging.info(f"http cache {domain}: {s['hits']}/{s['requests']} hits ({s['hit_rate']:.0%}), "
+                         f"{s['uncacheable']} without validators, saved {s['bytes_saved']} bytes, "
+                         f"downloaded {s['bytes_downloaded']} bytes")
+
+    async def run(self, method, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, method, *args)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.commit()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
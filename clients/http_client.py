@@ -0,0 +1,163 @@
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import aiohttp
+
+from metrics import run_metrics
+
+
+class HttpResponse:
+
+    def __init__(self, url: str, status_code: int, headers, content: bytes, encoding: str = "utf-8"):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.encoding = encoding
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding, errors="replace")
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class HttpStatusError(Exception):
+
+    # raised by crawlers for an unexpected status, `retry_after` in seconds when the server sent one
+    def __init__(self, message: str, status_code: int, retry_after: float = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: str) -> float:
+    # Retry-After is either a number of seconds or an HTTP date
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+
+
+class HttpClient:
+
+    # One client (and one aiohttp session) is shared by all crawlers of a run, so connections are pooled and
+    # kept alive per host. `concurrency` bounds the number of requests in flight across all shops.
+    # Every request is bounded by a connect timeout, a read timeout (longest wait for the next bytes of the
+    # response) and a total timeout, `domain_timeouts` overrides them per CrawlerGetter key.
+    SECTION_PREFIX = "domain:"
+
+    def __init__(self, concurrency: int = 20, keepalive_timeout: float = 30, connect_timeout: float = 10,
+                 read_timeout: float = 30, total_timeout: float = 60, domain_timeouts: dict = None):
+        self.concurrency = concurrency
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, sock_connect=connect_timeout,
+                                             sock_read=read_timeout)
+        self.domain_timeouts = {}
+        for domain, timeouts in (domain_timeouts or {}).items():
+            self.domain_timeouts[domain] = aiohttp.ClientTimeout(
+                total=timeouts.get("total", total_timeout),
+                sock_connect=timeouts.get("connect", connect_timeout),
+                sock_read=timeouts.get("read", read_timeout))
+        self._session = None
+        self._semaphore = None
+
+    @classmethod
+    def from_config(cls, config):
+        http_config = config['HTTP'] if config.has_section('HTTP') else config['DEFAULT']
+        domain_timeouts = {}
+        for section in config.sections():
+            if not section.startswith(cls.SECTION_PREFIX):
+                continue
+            timeouts = {}
+            for key, option in (("connect", 'CONNECT_TIMEOUT'), ("read", 'READ_TIMEOUT'), ("total", 'TOTAL_TIMEOUT')):
+                if config.has_option(section, option):
+                    timeouts[key] = config[section].getfloat(option)
+            if timeouts:
+                domain_timeouts[section[len(cls.SECTION_PREFIX):]] = timeouts
+        return cls(concurrency=http_config.getint('CONCURRENCY', 20),
+                   keepalive_timeout=http_config.getfloat('KEEPALIVE_TIMEOUT', 30),
+                   connect_timeout=http_config.getfloat('CONNECT_TIMEOUT', 10),
+                   read_timeout=http_config.getfloat('READ_TIMEOUT', 30),
+                   total_timeout=http_config.getfloat('TOTAL_TIMEOUT', 60),
+                   domain_timeouts=domain_timeouts)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # created lazily so the session is bound to the running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=self.keepalive_timeout,
+                                             ttl_dns_cache=300)
+            # dns and connect timings are only traced while the run metrics are enabled
+            trace_configs = [self._trace_config()] if run_metrics.enabled else None
+            self._session = aiohttp.ClientSession(connector=connector, trace_configs=trace_configs)
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._session
+
+    async def get(self, url: str, headers: dict = None, domain: str = None) -> HttpResponse:
+        session = self._get_session()
+        timeout = self.domain_timeouts.get(domain, self.timeout)
+        async with self._semaphore:
+            start = time.perf_counter()
+            try:
+                async with session.get(url, headers=headers, timeout=timeout,
+                                       trace_request_ctx={"domain": domain}) as resp:
+                    content = await resp.read()
+                    response = HttpResponse(str(resp.url), resp.status, resp.headers, content,
+                                            self._get_encoding(resp))
+            except BaseException:
+                run_metrics.observe("download", domain, time.perf_counter() - start, ok=False)
+                raise
+            run_metrics.observe("download", domain, time.perf_counter() - start, ok=response.status_code < 400,
+                                n_bytes=len(content))
+            return response
+
+    @staticmethod
+    def _trace_config() -> aiohttp.TraceConfig:
+        def on_start(stage):
+            async def handler(session, context, params):
+                setattr(context, stage, time.perf_counter())
+            return handler
+
+        def on_end(stage):
+            async def handler(session, context, params):
+                domain = (context.trace_request_ctx or {}).get("domain")
+                run_metrics.observe(stage, domain, time.perf_counter() - getattr(context, stage))
+            return handler
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_dns_resolvehost_start.append(on_start("dns"))
+        trace_config.on_dns_resolvehost_end.append(on_end("dns"))
+        trace_config.on_connection_create_start.append(on_start("connect"))
+        trace_config.on_connection_create_end.append(on_end("connect"))
+        return trace_config
+
+    @staticmethod
+    def _get_encoding(resp) -> str:
+        try:
+            return resp.get_encoding()
+        except (LookupError, RuntimeError):
+            return "utf-8"
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def __aenter__(self):
+        self._get_session()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
@@ -0,0 +1,99 @@
+import logging
+import sqlite3
+from collections import Counter
+from datetime import date
+from typing import Iterable
+
+from pricing import Product
+
+
+class PriceStore:
+
+    # On-disk link -> last prices written to BigQuery, kept across runs. The sinks only write the products whose
+    # sale or original price changed since, new links, and links whose prices were last written on another day:
+    # staging is merged from today's partition only, so every link gets a row in each day's partition while the
+    # runs of the same day only write what changed.
+    NEW = "new"
+    CHANGED = "changed"
+    REFRESHED = "refreshed"
+    UNCHANGED = "unchanged"
+
+    def __init__(self, path: str, today: date, commit_every: int = 1000):
+        self.path = path
+        self.today = today
+        self.commit_every = commit_every
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS price_store (
+                link TEXT PRIMARY KEY,
+                sale_price INTEGER,
+                original_price INTEGER,
+                written_on TEXT
+            )""")
+        self.pending_writes = 0
+        # NEW, CHANGED, REFRESHED, UNCHANGED -> number of products
+        self.counters = Counter()
+
+    @classmethod
+    def from_config(cls, config, today: date):
+        # None when the store is disabled, every product is written then
+        if not config.has_section('PRICE_STORE') or not config['PRICE_STORE'].getboolean('ENABLED', False):
+            return None
+        store_config = config['PRICE_STORE']
+        return cls(store_config.get('PATH', 'price_store.sqlite'), today)
+
+    def classify(self, product: Product) -> str:
+        row = self.connection.execute("SELECT sale_price, original_price, written_on FROM price_store WHERE link = ?",
+                                      (product.link,)).fetchone()
+        if row is None:
+            kind = self.NEW
+        elif row[0] != product.sale_price or row[1] != product.original_price:
+            kind = self.CHANGED
+        elif row[2] != self.today.isoformat():
+            kind = self.REFRESHED
+        else:
+            kind = self.UNCHANGED
+        self.counters[kind] += 1
+        return kind
+
+    def should_write(self, product: Product) -> bool:
+        return self.classify(product) != self.UNCHANGED
+
+    def record(self, products: Iterable[Product]):
+        # called by the sinks once the products are in BigQuery, a failed write is retried by the next run
+        today = self.today.isoformat()
+        for product in products:
+            self.connection.execute("INSERT OR REPLACE INTO price_store VALUES (?, ?, ?, ?)",
+                                    (product.link, product.sale_price, product.original_price, today))
+            self.pending_writes += 1
+            if self.pending_writes >= self.commit_every:
+                self.commit()
+
+    def commit(self):
+        self.connection.commit()
+        self.pending_writes = 0
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM price_store").fetchone()[0]
+
+    def stats(self) -> dict:
+        total = sum(self.counters.values())
+        stats = {kind: self.counters[kind] for kind in (self.NEW, self.CHANGED, self.REFRESHED, self.UNCHANGED)}
+        stats['written'] = total - self.counters[self.UNCHANGED]
+        stats['skipped_ratio'] = self.counters[self.UNCHANGED] / total if total else 0.0
+        return stats
+
+    def log_stats(self):
+        s = self.stats()
+        logging.info(f"price store: {s['written']} products written ({s['new']} new, {s['changed']} changed, "
+                     f"{s['refreshed']} refreshed), {s['unchanged']} unchanged skipped ({s['skipped_ratio']:.0%})")
+
+    def close(self):
+        self.commit()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
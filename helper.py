@@ -1,13 +1,10 @@
 import time
 
 
-def human_price_to_integer(human_price):
-    price_str = ''.join(filter(str.isnumeric, human_price))
-    return int(price_str, 10)
-
-def execution_time(func_name, func):
+def execution_time(func_name, func, *args, **kwargs):
+    # func is called here, passing its result would time nothing
     start = time.time()
-    result = func
+    result = func(*args, **kwargs)
     end = time.time()
     print(f"{func_name} took {end-start}s")
     return result
\ No newline at end of file
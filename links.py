@@ -0,0 +1,29 @@
+from typing import Iterable
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# query parameters added by ads and campaigns, they never change the product a link points to
+TRACKING_PARAMS = frozenset({
+    "gclid", "gclsrc", "dclid", "fbclid", "msclkid", "zarsrc", "_ga", "ref", "srsltid",
+})
+TRACKING_PREFIXES = ("utm_",)
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def canonicalize(link: str, tracking_params: Iterable[str] = TRACKING_PARAMS, trailing_slash: bool = False) -> str:
+    # Lower-cased scheme and host (https when missing), no default port, no fragment, no tracking parameters,
+    # remaining parameters sorted, path with (trailing_slash=True) or without a trailing slash.
+    link = link.strip()
+    if "://" not in link:
+        link = "https://" + link.lstrip("/")
+    parts = urlsplit(link)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").rstrip(".")
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    path = parts.path.rstrip("/")
+    if trailing_slash or not path:
+        path += "/"
+    tracking_params = set(tracking_params)
+    query = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if key.lower() not in tracking_params and not key.lower().startswith(TRACKING_PREFIXES))
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
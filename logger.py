@@ -1,31 +1,145 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 from clients.gsheet_client import GSheetClient
+from pricing import CrawlerListener
 
 
-class SheetLogger:
+class SheetLogger(CrawlerListener):
 
-    def __init__(self, sheet_client, metadata_cell, log_position_range_format):
+    # Crawl failures are buffered and written to the log sheet every `flush_size` failures or `flush_interval`
+    # seconds: the rows and the metadata cell (the next free row) go in a single values.batchUpdate, run on a
+    # background thread so callers on the event loop are not blocked. A timer writes the buffered rows once
+    # `flush_interval` has passed when no further failure comes to trigger the flush. Rows that could not be
+    # written to the sheet are appended to `fallback_path` instead, without a sheet client every row goes there.
+    def __init__(self, sheet_client, metadata_cell, log_position_range_format, flush_size: int = 500,
+                 flush_interval: float = 30, fallback_path: str = "failures.log"):
         self.sheet_client = sheet_client
         self.log_position_range_format = log_position_range_format
         self.metadata_cell = metadata_cell
-        self._get_metatdata(metadata_cell)
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.fallback_path = fallback_path
+        # read from the metadata cell by the first write
+        self.current_row = None
+        self.buffer = []
+        self.lock = threading.Lock()
+        # a single writer keeps the rows in order
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.last_flush_at = time.monotonic()
+        # armed while rows are buffered
+        self.timer = None
+        self.closed = False
+        self.written = 0
+        self.fallback_rows = 0
+        self.requests = 0
+
+    @classmethod
+    def from_config(cls, sheet_client, config):
+        log_config = config['FAILURE_LOG'] if config.has_section('FAILURE_LOG') else config['DEFAULT']
+        return cls(sheet_client, config['DEFAULT']['LOGGING_METADATA_RANGE'],
+                   config['DEFAULT']['LOGGING_LOG_RANGE_FORMAT'],
+                   flush_size=log_config.getint('FLUSH_SIZE', 500),
+                   flush_interval=log_config.getfloat('FLUSH_INTERVAL', 30),
+                   fallback_path=log_config.get('FALLBACK_PATH', 'failures.log'))
 
     def _get_metatdata(self, metadata_cell):
         cell_values = self.sheet_client.get(metadata_cell)
         self.current_row = int(cell_values[0][0], 10)
 
+    def onFailed(self, product_link, err):
+        self.log([LogInfo(product_link, err, datetime.now())])
+
+    def onSuccess(self, product_link, product):
+        pass
+
     def log(self, log_infos):
         if not log_infos:
             return
-        ranges = self.log_position_range_format.format(self.current_row, self.current_row + len(log_infos))
-        log_infos_array = list(map(LogInfo.to_array, log_infos))
-        self.sheet_client.update(ranges, log_infos_array)
-        self.current_row += len(log_infos)
-        self._commit()
+        with self.lock:
+            self.buffer.extend(log_infos)
+            if len(self.buffer) < self.flush_size and time.monotonic() - self.last_flush_at < self.flush_interval:
+                if self.timer is None:
+                    self.timer = threading.Timer(self.flush_interval - (time.monotonic() - self.last_flush_at),
+                                                 self._flush_due)
+                    self.timer.daemon = True
+                    self.timer.start()
+                return
+            log_infos, self.buffer = self.buffer, []
+            self.last_flush_at = time.monotonic()
+            self._cancel_timer()
+        self.executor.submit(self._write, log_infos)
+
+    def _flush_due(self):
+        # timer thread, the interval elapsed without a failure triggering the flush. A timer cancelled once it
+        # fired, by a flush or by close(), finds another timer or none in self.timer and does nothing.
+        with self.lock:
+            if self.closed or self.timer is not threading.current_thread():
+                return
+            self.timer = None
+            log_infos, self.buffer = self.buffer, []
+            if log_infos:
+                self.last_flush_at = time.monotonic()
+                # under the lock, close() cannot shut the executor down in between
+                self.executor.submit(self._write, log_infos)
+
+    def _cancel_timer(self):
+        # with the lock held
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    def flush(self):
+        # writes the buffered rows and waits for all the writes
+        with self.lock:
+            log_infos, self.buffer = self.buffer, []
+            self.last_flush_at = time.monotonic()
+            self._cancel_timer()
+        if log_infos:
+            self.executor.submit(self._write, log_infos)
+        self.executor.submit(lambda: None).result()
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self._cancel_timer()
+        self.flush()
+        self.executor.shutdown()
+        logging.info(f"failure log: {self.written} rows written in {self.requests} requests, "
+                     f"{self.fallback_rows} rows written to {self.fallback_path}")
+
+    def _write(self, log_infos):
+        rows = list(map(LogInfo.to_array, log_infos))
+        if self.sheet_client is None:
+            self._write_fallback(rows)
+            return
+        try:
+            if self.current_row is None:
+                self._get_metatdata(self.metadata_cell)
+            last_row = self.current_row + len(rows) - 1
+            self.requests += 1
+            self.sheet_client.batch_update([
+                (self.log_position_range_format.format(self.current_row, last_row), rows),
+                (self.metadata_cell, [[last_row + 1]]),
+            ])
+            self.current_row = last_row + 1
+            self.written += len(rows)
+        except Exception:
+            logging.exception(f"error writing {len(rows)} failures to the log sheet, writing them to "
+                              f"{self.fallback_path}")
+            self._write_fallback(rows)
 
-    def _commit(self):
-        self.sheet_client.update(self.metadata_cell, [[self.current_row]])
+    def _write_fallback(self, rows):
+        try:
+            with open(self.fallback_path, "a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write("\t".join(str(value).replace("\t", " ").replace("\n", " ") for value in row) + "\n")
+            self.fallback_rows += len(rows)
+        except OSError:
+            logging.exception(f"error writing {len(rows)} failures to {self.fallback_path}")
 
 
 class LogInfo:
@@ -51,4 +165,4 @@ if __name__ == '__main__':
             )
     log_infos = [LogInfo("link1", "error 1", datetime.now())]
     sheet_logger.log(log_infos)
-
+    sheet_logger.close()
@@ -0,0 +1,152 @@
+import bisect
+import json
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Run metrics: latency histograms, bytes and success / failure counts per (stage, domain). Stages are
+# sheet_read, dns, connect, download, parse, parse_wait (queued for a ParserPool worker), bq_insert and
+# merge; stages that are not about a shop use the domain "-". Recording is a no-op while the metrics are
+# disabled, which is the default.
+
+# upper bounds of the latency buckets, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf"))
+NO_DOMAIN = "-"
+
+
+class Histogram:
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q: float) -> float:
+        # upper bound of the bucket holding the q-th observation, capped by the largest one
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class StageMetrics:
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.ok = 0
+        self.failed = 0
+        self.bytes = 0
+
+
+class Metrics:
+
+    def __init__(self, enabled: bool = False, dump_path: str = None):
+        self.enabled = enabled
+        self.dump_path = dump_path
+        # (stage, domain) -> StageMetrics
+        self.stages = defaultdict(StageMetrics)
+
+    def configure(self, config):
+        metrics_config = config['METRICS'] if config.has_section('METRICS') else config['DEFAULT']
+        self.enabled = metrics_config.getboolean('ENABLED', False)
+        self.dump_path = metrics_config.get('DUMP_PATH', '') or None
+
+    def reset(self):
+        self.stages.clear()
+
+    def observe(self, stage: str, domain: str, seconds: float, ok: bool = True, n_bytes: int = 0):
+        if not self.enabled:
+            return
+        stage_metrics = self.stages[(stage, domain or NO_DOMAIN)]
+        stage_metrics.latency.observe(seconds)
+        if ok:
+            stage_metrics.ok += 1
+        else:
+            stage_metrics.failed += 1
+        stage_metrics.bytes += n_bytes
+
+    @contextmanager
+    def timer(self, stage: str, domain: str = None):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.observe(stage, domain, time.perf_counter() - start, ok=False)
+            raise
+        self.observe(stage, domain, time.perf_counter() - start)
+
+    def to_dict(self) -> dict:
+        result = defaultdict(dict)
+        for (stage, domain), m in sorted(self.stages.items()):
+            result[stage][domain] = {
+                "count": m.latency.count, "ok": m.ok, "failed": m.failed, "bytes": m.bytes,
+                "seconds": round(m.latency.sum, 6), "p50": m.latency.percentile(0.5),
+                "p95": m.latency.percentile(0.95), "max": round(m.latency.max, 6),
+                "buckets": {str(bound): count for bound, count in zip(BUCKETS, m.latency.counts)},
+            }
+        return dict(result)
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_prometheus(self) -> str:
+        # the samples of a family follow its TYPE line, families are not interleaved
+        seconds = ["# TYPE crawler_stage_seconds histogram"]
+        n_bytes = ["# TYPE crawler_stage_bytes_total counter"]
+        totals = ["# TYPE crawler_stage_total counter"]
+        for (stage, domain), m in sorted(self.stages.items()):
+            labels = f'stage="{stage}",domain="{domain}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS, m.latency.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                seconds.append(f'crawler_stage_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+            seconds.append(f"crawler_stage_seconds_sum{{{labels}}} {m.latency.sum}")
+            seconds.append(f"crawler_stage_seconds_count{{{labels}}} {m.latency.count}")
+            n_bytes.append(f"crawler_stage_bytes_total{{{labels}}} {m.bytes}")
+            totals.append(f'crawler_stage_total{{{labels},result="ok"}} {m.ok}')
+            totals.append(f'crawler_stage_total{{{labels},result="failed"}} {m.failed}')
+        return "\n".join(seconds + n_bytes + totals) + "\n"
+
+    def summary_table(self) -> str:
+        # stages sorted by the time they took in total
+        header = f"{'stage':<10} {'domain':<22} {'count':>7} {'failed':>6} {'total s':>9} {'p50 ms':>8} " \
+                 f"{'p95 ms':>8} {'max ms':>8} {'KB':>9}"
+        rows = [header]
+        for (stage, domain), m in sorted(self.stages.items(), key=lambda item: -item[1].latency.sum):
+            rows.append(f"{stage:<10} {domain:<22} {m.latency.count:>7} {m.failed:>6} {m.latency.sum:>9.2f} "
+                        f"{m.latency.percentile(0.5) * 1000:>8.1f} {m.latency.percentile(0.95) * 1000:>8.1f} "
+                        f"{m.latency.max * 1000:>8.1f} {m.bytes / 1024:>9.1f}")
+        return "\n".join(rows)
+
+    def log_summary(self):
+        if not self.enabled or not self.stages:
+            return
+        logging.info("run metrics:\n" + self.summary_table())
+        if self.dump_path:
+            self.dump(self.dump_path)
+
+    def dump(self, path: str):
+        # Prometheus text format for a .prom file, json otherwise
+        with open(path, "w") as f:
+            f.write(self.to_prometheus() if path.endswith(".prom") else self.to_json())
+
+
+# metrics of the current run
+run_metrics = Metrics()
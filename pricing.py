@@ -1,29 +1,122 @@
 from bs4 import BeautifulSoup
 from abc import ABCMeta, abstractmethod
-import requests
+import hashlib
 import re
+import sys
+from array import array
+from itertools import islice, repeat
+from typing import Iterable, Iterator, List, NamedTuple, Sequence
+from urllib.parse import urlsplit
 import json
 import lxml
 import cchardet
 
-from helper import human_price_to_integer
+from clients.http_client import HttpClient, HttpStatusError, parse_retry_after
+from links import TRACKING_PARAMS, canonicalize
+from metrics import run_metrics
+from price_extractor import PriceExtractor
+from price_parser import NO_PRICE, parse_price, require_price
 
 
 #env = 'test'
 env = 'prod'
 
-class Product:
+BROWSER_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 11_0_0) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/86.0.4240.198 Safari/537.36',
+    'accept': 'application/json, text/plain, */*',
+}
 
-    def __init__(self, original_price: float, sale_price: float, name: str = None, link: str = None):
-        self.name = name
-        self.original_price = original_price
-        self.sale_price = sale_price
-        self.link = link
+class Product(NamedTuple):
+
+    # immutable and without a per-instance __dict__, use _replace(link=...) for a copy with another link
+    original_price: float
+    sale_price: float
+    name: str = None
+    link: str = None
 
     def __str__(self):
         return "original_price: " + str(self.original_price ) + ", sale_price: " + str(self.sale_price)
 
 
+class ProductBatch:
+
+    # Columnar batch of products: prices in arrays of 64-bit integers, links and names interned so the rows of
+    # a product fanned out to duplicate links share their strings. Iterating yields Product records, rows()
+    # builds the BigQuery rows as tuples straight from the columns.
+    NULL_PRICE = -2 ** 63
+
+    __slots__ = ("original_prices", "sale_prices", "names", "links", "nulls")
+
+    def __init__(self, products: Iterable[Product] = ()):
+        self.original_prices = array("q")
+        self.sale_prices = array("q")
+        self.names = []
+        self.links = []
+        # number of NULL_PRICE values, the columns only need mapping back to None when there are some
+        self.nulls = 0
+        self.extend(products)
+
+    def _price(self, price) -> int:
+        if price is None:
+            self.nulls += 1
+            return self.NULL_PRICE
+        return int(price)
+
+    def append(self, product: Product):
+        self.original_prices.append(self._price(product.original_price))
+        self.sale_prices.append(self._price(product.sale_price))
+        self.names.append(None if product.name is None else sys.intern(product.name))
+        self.links.append(None if product.link is None else sys.intern(product.link))
+
+    def extend(self, products: Iterable[Product]):
+        if isinstance(products, ProductBatch):
+            self.original_prices.extend(products.original_prices)
+            self.sale_prices.extend(products.sale_prices)
+            self.names.extend(products.names)
+            self.links.extend(products.links)
+            self.nulls += products.nulls
+            return
+        for product in products:
+            self.append(product)
+
+    def __len__(self) -> int:
+        return len(self.links)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            batch = ProductBatch()
+            batch.original_prices = self.original_prices[index]
+            batch.sale_prices = self.sale_prices[index]
+            batch.names = self.names[index]
+            batch.links = self.links[index]
+            if self.nulls:
+                batch.nulls = batch.original_prices.count(self.NULL_PRICE) + batch.sale_prices.count(self.NULL_PRICE)
+            return batch
+        return Product(*self._prices(self.original_prices[index], self.sale_prices[index]), self.names[index],
+                       self.links[index])
+
+    def __iter__(self) -> Iterator[Product]:
+        for original_price, sale_price, name, link in zip(self.column("original_price"), self.column("sale_price"),
+                                                          self.names, self.links):
+            yield Product(original_price, sale_price, name, link)
+
+    def _prices(self, *prices) -> tuple:
+        return tuple(None if price == self.NULL_PRICE else price for price in prices)
+
+    def column(self, name: str) -> Sequence:
+        values = getattr(self, name + "s")
+        if self.nulls and name in ("original_price", "sale_price"):
+            return [None if price == self.NULL_PRICE else price for price in values]
+        return values
+
+    def rows(self, columns: Sequence[str], extra: dict) -> List[tuple]:
+        # one tuple per product with the values of `columns`, taken from `extra` (e.g. _date) or the batch
+        values = [repeat(extra[column]) if column in extra else
+                  self.column(column) if column in Product._fields else repeat(None)
+                  for column in columns]
+        return list(islice(zip(*values), len(self))) if values else [() for _ in self.links]
+
+
 class CrawlerListener():
 
     __metaclass__ = ABCMeta
@@ -35,34 +128,182 @@ class CrawlerListener():
     def onSuccess(self, product_link, product): raise NotImplementedError
 
 
-class TikiProductCrawler:
-    
+class ProductCrawler:
+
+    # key of the crawler in CrawlerGetter.CRAWLERS, used to apply per-shop limits
+    domain = None
+
+    HEADERS = None
+    # query parameters of the shop's links that do not change the product, on top of links.TRACKING_PARAMS
+    TRACKING_PARAMS = frozenset()
+    # whether the shop's canonical product paths end with a slash
+    TRAILING_SLASH = False
+    # whether parsing is worth sending to the ParserPool, cheap JSON/regex parsing stays on the event loop
+    OFFLOAD_PARSING = False
+
+    # all crawlers of a run share one pooled http client, parser pool, http cache and content store,
+    # see CrawlerGetter
+    def __init__(self, http_client: HttpClient = None, parser_pool=None, http_cache=None, content_store=None):
+        self.http_client = http_client if http_client is not None else HttpClient()
+        self.parser_pool = parser_pool
+        self.http_cache = http_cache
+        self.content_store = content_store
+
+    # fetching and parsing are split: get_url/HEADERS say what to download, parse_product turns the body into
+    # a Product without any I/O
+    def get_url(self, link: str) -> str:
+        return link
+
+    def canonical_link(self, link: str) -> str:
+        return canonicalize(link, TRACKING_PARAMS | self.TRACKING_PARAMS, self.TRAILING_SLASH)
+
     async def get_price(self, link: str) -> Product:
+        url = self.get_url(link)
+        entry = await self.http_cache.run(self.http_cache.get, url) if self.http_cache is not None else None
+        headers = self.HEADERS
+        if entry is not None:
+            headers = {**(self.HEADERS or {}), **entry.conditional_headers()}
+        r = await self.http_client.get(url, headers=headers, domain=self.domain)
+        if r.status_code == 304 and entry is not None:
+            # not modified since the cached response, skip parsing
+            await self.http_cache.run(self.http_cache.hit, self.domain, entry)
+            return entry.product(link)
+        if r.status_code not in (200, 201):
+            raise HttpStatusError(f"error getting {self.domain} product, status: {r.status_code}, link: {link}",
+                                  r.status_code, parse_retry_after(r.headers.get('Retry-After')))
+        product = None
+        if self.content_store is not None:
+            digest = self.content_digest(r.content)
+            # same content as the last time the page was parsed
+            product = await self.content_store.run(self.content_store.get, self.domain, url, digest, link)
+        if product is None:
+            if self.OFFLOAD_PARSING and self.parser_pool is not None:
+                # timed in the worker, see ParserPool.parse
+                product = await self.parser_pool.parse(self, r.content, r.encoding, link)
+            else:
+                with run_metrics.timer("parse", self.domain):
+                    product = self.parse_product(r.text, link)
+            if self.content_store is not None:
+                await self.content_store.run(self.content_store.put, url, digest, product)
+        if self.http_cache is not None:
+            await self.http_cache.run(self.http_cache.store, self.domain, url, r.headers, r.content, product)
+        return product
+
+    def content_digest(self, content: bytes) -> bytes:
+        return hashlib.blake2b(content, digest_size=16).digest()
+
+    def parse_product(self, text: str, link: str) -> Product:
+        raise NotImplementedError
+
+
+class HtmlProductCrawler(ProductCrawler):
+
+    # (name, attrs) of the elements holding the prices, only these regions of the page are turned into
+    # BeautifulSoup objects, see price_extractor
+    PRICE_ELEMENTS = []
+    OFFLOAD_PARSING = True
+    # bytes digested from the opening tag of each price element, see content_digest
+    CONTENT_WINDOW = 4096
+
+    def __init__(self, http_client: HttpClient = None, parser_pool=None, http_cache=None, content_store=None):
+        super().__init__(http_client, parser_pool, http_cache, content_store)
+        self.price_extractor = PriceExtractor(self.PRICE_ELEMENTS)
+
+    def content_digest(self, content: bytes) -> bytes:
+        # pages embed session tokens, timestamps, recommendations... that change on every request, only the
+        # bytes around the price elements are digested
+        slices = self.price_extractor.region_slices(content, self.CONTENT_WINDOW)
+        if not slices:
+            return super().content_digest(content)
+        digest = hashlib.blake2b(digest_size=16)
+        for region in slices:
+            digest.update(region)
+        return digest.digest()
+
+    def parse_html(self, text: str) -> BeautifulSoup:
+        return self.price_extractor.parse(text)
+
+    def parse_product(self, text: str, link: str) -> Product:
+        return self.extract_product(self.parse_html(text), link)
+
+    def extract_product(self, soup: BeautifulSoup, link: str) -> Product:
+        raise NotImplementedError
+
+
+class CrawlerGetter:
+
+    # shop domain -> crawler class, filled by the @CrawlerGetter.register decorator
+    CRAWLERS = {}
+
+    def __init__(self, http_client: HttpClient = None, registry: dict = None, parser_pool=None, http_cache=None,
+                 content_store=None, listeners: List[CrawlerListener] = None):
+        self.http_client = http_client if http_client is not None else HttpClient()
+        # told about the result of crawling each link, see StreamingService._crawl_link
+        self.listeners = list(listeners or ())
+        self.crawlers = {}
+        for domain, crawler_cls in (registry if registry is not None else self.CRAWLERS).items():
+            crawler = crawler_cls(self.http_client, parser_pool, http_cache, content_store)
+            crawler.domain = domain
+            self.crawlers[domain] = crawler
+
+    @classmethod
+    def register(cls, *domains: str):
+        def decorator(crawler_cls):
+            for domain in domains:
+                cls.CRAWLERS[domain] = crawler_cls
+            return crawler_cls
+        return decorator
+
+    def get_crawler(self, link: str):
+        host = get_host(link)
+        # try the host itself and then its parent domains, e.g. www.xtmobile.vn -> xtmobile.vn,
+        # watch.haloshop.vn -> haloshop.vn, so the cost only depends on the number of labels in the host
+        while host:
+            crawler = self.crawlers.get(host)
+            if crawler is not None:
+                return crawler
+            host = host.partition(".")[2]
+        raise Exception("not found suitable crawler for link {}".format(link))
+
+    def canonical_link(self, link: str) -> str:
+        try:
+            crawler = self.get_crawler(link)
+        except Exception:
+            return canonicalize(link)
+        return crawler.canonical_link(link)
+
+
+def get_host(link: str) -> str:
+    link = link.strip()
+    if "://" not in link:
+        link = "//" + link
+    return urlsplit(link).hostname or ""
+
+
+@CrawlerGetter.register("tiki.vn")
+class TikiProductCrawler(ProductCrawler):
+
+    HEADERS = BROWSER_HEADERS
+
+    def get_url(self, link: str) -> str:
         matcher = re.search("p(\d+)\.html", link)
         if not matcher:
-            for listener in self.listeners:
-                listener.onFailed(link, "Not found product_id pattern")
+            # reported to the listeners by the pipeline, like any other crawl error
             raise Exception("Couldn't get product id from link " + link)
         product_id = matcher.group(1)
-        p_link = f'https://tiki.vn/api/v2/products/{product_id}?platform=web'
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 11_0_0) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/86.0.4240.198 Safari/537.36',
-            'accept': 'application/json, text/plain, */*',
-        }
-        r = requests.get(p_link, headers=headers)
-        if r.status_code not in (200, 201):
-            raise Exception(f"error getting Tiki product: {product_id}, link: {link}")
-        res = r.json()
+        return f'https://tiki.vn/api/v2/products/{product_id}?platform=web'
+
+    def parse_product(self, text: str, link: str) -> Product:
+        res = json.loads(text)
         return Product(original_price=res["list_price"], sale_price=res["price"], name=res["name"], link=link)
-        
 
-class M24hProductCrawler:
 
-    async def get_price(self, link: str) -> Product:
-        r = requests.get(link)
-        if r.status_code not in (200, 201):
-            raise Exception("error getting 24h product " + link)
-        soup = BeautifulSoup(r.text, 'lxml')
+@CrawlerGetter.register("24hstore.vn")
+class M24hProductCrawler(HtmlProductCrawler):
+
+    PRICE_ELEMENTS = [("div", {"class": "price_ins"})]
+
+    def extract_product(self, soup: BeautifulSoup, link: str) -> Product:
         price_div = soup.find("div", {"class": "price_ins"})
         if not price_div:
             raise Exception(f"error getting m24 product, not found price_ins class, link: {link}")
@@ -70,55 +311,54 @@ class M24hProductCrawler:
         original_price_tag = price_div.find("span", {"class": "_price"})
         if not original_price_tag:
             raise Exception(f"error getting m24 product, not found span _price class, link: {link}")
-        original_price = human_price_to_integer(original_price_tag.text)
+        original_price = require_price(original_price_tag.text)
         sale_price_tag = price_div.find("span", {"class": "price_old"})
         sale_price = original_price
         if sale_price_tag:
-            sale_price = human_price_to_integer(sale_price_tag.text)
+            sale_price = require_price(sale_price_tag.text)
 
         return Product(original_price=original_price, sale_price=sale_price, link=link)
 
 
 # Dien thoai gia kho
-class DTGKProductCrawler:
+@CrawlerGetter.register("dienthoaigiakho.vn")
+class DTGKProductCrawler(ProductCrawler):
 
-    async def get_price(self, link: str) -> Product:
+    HEADERS = BROWSER_HEADERS
+
+    def get_url(self, link: str) -> str:
         last_part = link.split("/")[-1]
         last_part = last_part.split("?")[0]
-        p_link = f'https://api.dienthoaigiakho.vn/api/products/{last_part}'
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 11_0_0) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/86.0.4240.198 Safari/537.36',
-            'accept': 'application/json, text/plain, */*',
-        }
-        r = requests.get(p_link, headers=headers)
-        if r.status_code not in (200, 201):
-            raise Exception("error getting DTGK product " + p_link)
-        res = r.json()
+        return f'https://api.dienthoaigiakho.vn/api/products/{last_part}'
+
+    def parse_product(self, text: str, link: str) -> Product:
+        res = json.loads(text)
         return Product(original_price=res['price'], sale_price=res['salePrice'], name=res['name'], link=link)
 
 
-class BaoChauProductCrawler:
+@CrawlerGetter.register("baochauelec.com")
+class BaoChauProductCrawler(HtmlProductCrawler):
 
-    async def get_price(self, link: str) -> Product:
-        r = requests.get(link)
-        if r.status_code not in (200, 201):
-            raise Exception("error getting BaoChau product " + link)
-        soup = BeautifulSoup(r.text, 'lxml')
+    PRICE_ELEMENTS = [("div", {"class": "price_and_no"})]
+
+    def extract_product(self, soup: BeautifulSoup, link: str) -> Product:
         pricing_tag = soup.find("div", {"class": "price_and_no"})
         p_tags = pricing_tag.find_all("p")
-        current_price = human_price_to_integer(p_tags[0].strong.text)
+        current_price = require_price(p_tags[0].strong.text)
         origianl_price_tag = p_tags[1].find("del") if len(p_tags) >= 2 else None
         original_price = current_price
         if origianl_price_tag:
-            original_price = human_price_to_integer(origianl_price_tag.text)
+            original_price = require_price(origianl_price_tag.text)
 
         return Product(original_price=original_price, sale_price=current_price, link=link)
 
 
 
 # Antien antien.vn
-class AntienProductCrawler:
+@CrawlerGetter.register("antien.vn")
+class AntienProductCrawler(HtmlProductCrawler):
 
+    TRACKING_PARAMS = frozenset({"regid"})
 
     # Regular products, Products that on sale
     # <div class="product-detail-info">
@@ -128,22 +368,21 @@ class AntienProductCrawler:
     #   </div>
     # </div>
 
-    async def get_price(self, link: str) -> Product:
-        r = requests.get(link)
-        if r.status_code not in (200, 201):
-            raise Exception("error getting Antien product " + link)
-        soup = BeautifulSoup(r.text, 'lxml')
+    PRICE_ELEMENTS = [("div", {"class": "product-detail-info"})]
+
+    def extract_product(self, soup: BeautifulSoup, link: str) -> Product:
         product_tag = soup.find("div", {"class": "product-detail-info"})
         
         original_price_tag = product_tag.find("span", {"class": "price product-main-price"})
         sale_price_tag = product_tag.find("span", {"class": "old-price"})
-        original_price = human_price_to_integer(original_price_tag.text)
-        sale_price = human_price_to_integer(sale_price_tag.text if sale_price_tag is not None else original_price_tag.text)
+        original_price = require_price(original_price_tag.text)
+        sale_price = require_price(sale_price_tag.text if sale_price_tag is not None else original_price_tag.text)
         return Product(original_price=original_price, sale_price=sale_price, link=link)
 
 
 # Hoang Ha hoanghamobile.com
-class HoangHaProductCrawler:
+@CrawlerGetter.register("hoanghamobile.com")
+class HoangHaProductCrawler(HtmlProductCrawler):
 
     # Regular products
     # <p class="price current-product-price"><strong> 11,990,000 ₫ </strong>
@@ -154,58 +393,53 @@ class HoangHaProductCrawler:
     #  <i>Giá Niêm Yết: undefined
     #  <strike>3,990,000 ₫</strike>undefined</i>undefined
 
-    async def get_price(self, link: str) -> Product:
-        r = requests.get(link)
-        if r.status_code not in (200, 201):
-            raise Exception("error getting HoangHa product " + link)
-        soup = BeautifulSoup(r.text, 'lxml')
+    PRICE_ELEMENTS = [("p", {"class": "price current-product-price"})]
+
+    def extract_product(self, soup: BeautifulSoup, link: str) -> Product:
         pricing_div = soup.find("p", {"class": "price current-product-price"})
         sale_price_tags = pricing_div.strong
         original_price_tags = pricing_div.strike
         original_price = 0
         sale_price = 0
         if original_price_tags:
-            sale_price = human_price_to_integer(sale_price_tags.text)
-            original_price = human_price_to_integer(original_price_tags.text)
+            sale_price = require_price(sale_price_tags.text)
+            original_price = require_price(original_price_tags.text)
         else:
-            sale_price = human_price_to_integer(sale_price_tags.text)
+            sale_price = require_price(sale_price_tags.text)
             original_price = sale_price
         return Product(original_price=original_price, sale_price=sale_price, link=link)
 
 
 # Cellphone cellphones.com.vn
-class CellphoneProductCrawler:
+@CrawlerGetter.register("cellphones.com.vn")
+class CellphoneProductCrawler(HtmlProductCrawler):
 
     # <div class="box-info__box-price">
     #  <p class="product__price--show">590.000 ₫</p>
     #  <p class="product__price--through">699.000 ₫</p>
     # </div>
 
-    async def get_price(self, link: str) -> Product:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 11_0_0) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/86.0.4240.198 Safari/537.36',
-            'accept': 'application/json, text/plain, */*',
-        }
-        r = requests.get(link, headers = headers)
-        if r.status_code not in (200, 201):
-            raise Exception("error getting Cellphone product " + link)
-        soup = BeautifulSoup(r.text, 'lxml')
+    HEADERS = BROWSER_HEADERS
+    PRICE_ELEMENTS = [("div", {"class": "box-info__box-price"})]
+
+    def extract_product(self, soup: BeautifulSoup, link: str) -> Product:
         pricing_div = soup.find("div", {"class": "box-info__box-price"})
         sale_price_tag = pricing_div.find("p", {"class": "product__price--show"})
         original_price_tag = pricing_div.find("p", {"class": "product__price--through"})
         original_price = 0
         sale_price = 0
         if original_price_tag:
-            sale_price = human_price_to_integer(sale_price_tag.text)
-            original_price = human_price_to_integer(original_price_tag.text)
+            sale_price = require_price(sale_price_tag.text)
+            original_price = require_price(original_price_tag.text)
         else:
-            sale_price = human_price_to_integer(sale_price_tag.text)
+            sale_price = require_price(sale_price_tag.text)
             original_price = sale_price
         return Product(original_price=original_price, sale_price=original_price, link=link)
 
 
 # Linh Anh dientulinhanh.com
-class LinhAnhProductCrawler:
+@CrawlerGetter.register("dientulinhanh.com")
+class LinhAnhProductCrawler(HtmlProductCrawler):
 
     # Regular price
     # <div class="price">
@@ -214,38 +448,36 @@ class LinhAnhProductCrawler:
 
     # Not found any product that on sale 
 
-    async def get_price(self, link: str) -> Product:
-        r = requests.get(link)
-        if r.status_code not in (200, 201):
-            raise Exception("error getting LinhAnh product " + link)
-        soup = BeautifulSoup(r.text, 'lxml')
+    PRICE_ELEMENTS = [("div", {"class": "price"})]
+
+    def extract_product(self, soup: BeautifulSoup, link: str) -> Product:
         pricing_div = soup.find("div", {"class": "price"})
         price_tag = pricing_div.find("strong")
-        original_price = human_price_to_integer(price_tag.text)
+        original_price = require_price(price_tag.text)
         return Product(original_price=original_price, sale_price=original_price, link=link)
 
 
 # Viettablet viettablet.com
-class ViettabletProductCrawler:
+@CrawlerGetter.register("viettablet.com")
+class ViettabletProductCrawler(HtmlProductCrawler):
 
     # Regular price
     # <span class="price" id="line_discounted_price_3261"><span id="sec_discounted_price_3261" class="price-num">23.590.000</span><span class="price-num">đ</span></span>
 
     # Products that on sale
 
-    async def get_price(self, link: str) -> Product:
-        r = requests.get(link)
-        if r.status_code not in (200, 201):
-            raise Exception("error getting Viettablet product " + link)
-        soup = BeautifulSoup(r.text, 'lxml')
+    PRICE_ELEMENTS = [("span", {"class": "price-num"})]
+
+    def extract_product(self, soup: BeautifulSoup, link: str) -> Product:
         pricing_div = soup.find("span", {"class": "price-num"})
         # Not get original_price
-        sale_price = human_price_to_integer(pricing_div.text)
+        sale_price = require_price(pricing_div.text)
         return Product(original_price=sale_price, sale_price=sale_price, link=link)
 
 
 # CTmobile ctmobile.vn
-class CTMobileProductCrawler:
+@CrawlerGetter.register("ctmobile.vn")
+class CTMobileProductCrawler(HtmlProductCrawler):
 
     # <div class="price-group price-group-varible">
     #   <div class="variation-price">
@@ -254,18 +486,17 @@ class CTMobileProductCrawler:
     #   </div>
     # </div>
 
-    async def get_price(self, link: str) -> Product:
-        r = requests.get(link)
-        if r.status_code not in (200, 201):
-            raise Exception("error getting CTMobile product " + link)
-        soup = BeautifulSoup(r.text, 'lxml')
+    PRICE_ELEMENTS = [("span", {"class": "price"})]
+
+    def extract_product(self, soup: BeautifulSoup, link: str) -> Product:
         pricing_div = soup.find("span", {"class": "price"}) # get first
-        sale_price = human_price_to_integer(pricing_div.text)
+        sale_price = require_price(pricing_div.text)
         return Product(original_price=sale_price, sale_price=sale_price, link=link)
 
 
 # Haloshop haloshop.v
-class HaloshopProductCrawler:
+@CrawlerGetter.register("haloshop.vn")
+class HaloshopProductCrawler(HtmlProductCrawler):
 
     # Regular product
     # <div class="product-price-group">
@@ -287,24 +518,23 @@ class HaloshopProductCrawler:
     #   </div>
     # </div>
 
-    async def get_price(self, link: str) -> Product:
-        r = requests.get(link)
-        if r.status_code not in (200, 201):
-            raise Exception("error getting Halo product " + link)
-        soup = BeautifulSoup(r.text, 'lxml')
+    PRICE_ELEMENTS = [("div", {"class": "product-price"}), ("div", {"class": "product-price-new"}), ("div", {"class": "product-price-old"})]
+
+    def extract_product(self, soup: BeautifulSoup, link: str) -> Product:
         sale_price_tag = soup.find("div", {"class": "product-price"})
         if sale_price_tag:
-            sale_price = human_price_to_integer(sale_price_tag.text)
+            sale_price = require_price(sale_price_tag.text)
             return Product(sale_price=sale_price, original_price=sale_price, link=link)
 
         sale_price_tag = soup.find("div", {"class": "product-price-new"})
         original_price_tag = soup.find("div", {"class": "product-price-old"})
-        sale_price = human_price_to_integer(sale_price_tag.text)
-        original_price = human_price_to_integer(original_price_tag.text)
+        sale_price = require_price(sale_price_tag.text)
+        original_price = require_price(original_price_tag.text)
         return Product(original_price=original_price, sale_price=sale_price, link=link)
 
 
-class BachLongProductCrawler:
+@CrawlerGetter.register("bachlongmobile.com")
+class BachLongProductCrawler(HtmlProductCrawler):
 
     # Regular product
     # <div class="box-title-product">
@@ -329,26 +559,25 @@ class BachLongProductCrawler:
     #   <p class="is_vat"><i>(VAT 10%)</i></p>
     # </div>
 
-    async def get_price(self, link: str) -> Product:
-        r = requests.get(link)
-        if r.status_code not in (200, 201):
-            raise Exception("error getting Bach Long product " + link)
-        soup = BeautifulSoup(r.text, 'lxml')
+    PRICE_ELEMENTS = [("div", {"class": "box-title-product"}), ("span", {"class": "oldprice"})]
+
+    def extract_product(self, soup: BeautifulSoup, link: str) -> Product:
         price_div = soup.find("div", {"class": "box-title-product"})
         sale_price_tag = price_div.find("span", {"class": "price"})
         original_price_tag = soup.find("span", {"class": "oldprice"})
         original_price = 0
         sale_price = 0
         if original_price_tag:
-            sale_price = human_price_to_integer(sale_price_tag.text)
-            original_price = human_price_to_integer(original_price_tag.text)
+            sale_price = require_price(sale_price_tag.text)
+            original_price = require_price(original_price_tag.text)
         else:
-            sale_price = human_price_to_integer(sale_price_tag.text)
+            sale_price = require_price(sale_price_tag.text)
             original_price = sale_price
         return Product(original_price=original_price, sale_price=sale_price, link=link)
 
 
-class DidongvietProductCrawler:
+@CrawlerGetter.register("didongviet.vn")
+class DidongvietProductCrawler(HtmlProductCrawler):
 
     ### Original price from html tags
     # Regular product
@@ -376,34 +605,31 @@ class DidongvietProductCrawler:
     #    </script>
 
     PATTERN = re.compile(r"<script>\s*dataLayer\.push\(((.|\n)*?)\s*\);\s*</script>")
+    PRICE_ELEMENTS = [("span", {"class": "price-container price-final_price tax weee"}), ("span", {"class": "price-old"})]
 
     # sale prices are taken from <script>
     # original prices (market prices) are taken from html tags
-    async def get_price(self, link: str) -> Product:
-        r = requests.get(link)
-        if r.status_code not in (200, 201):
-            raise Exception("error getting di dong viet product " + link)
-        body = r.text
-        return self.get_original_price(body, body, link)
-        #sale_price = self.get_sale_price(body, link)
-        #product_in_html = self.get_original_price(body)
+    def parse_product(self, text: str, link: str) -> Product:
+        return self.get_original_price(text, link)
+        #sale_price = self.get_sale_price(text, link)
+        #product_in_html = self.get_original_price(text)
 
         # replace by sale_price from <script>
         #product_in_html.sale_price = sale_price
         #return product_in_html
 
     def get_original_price(self, text, link) -> Product:
-        soup = BeautifulSoup(text, 'lxml')
+        soup = self.parse_html(text)
         price_div = soup.find("span", {"class": "price-container price-final_price tax weee"})
         sale_price_tag = price_div.find("span", {"class": "price"})
         original_price_tag = soup.find("span", {"class": "price-old"})
         original_price = 0
         sale_price = 0
         if original_price_tag:
-            sale_price = human_price_to_integer(sale_price_tag.text)
-            original_price = human_price_to_integer(original_price_tag.text)
+            sale_price = require_price(sale_price_tag.text)
+            original_price = require_price(original_price_tag.text)
         else:
-            sale_price = human_price_to_integer(sale_price_tag.text)
+            sale_price = require_price(sale_price_tag.text)
             original_price = sale_price
 
         return Product(original_price=original_price, sale_price=sale_price, link=link)
@@ -423,7 +649,10 @@ class DidongvietProductCrawler:
         return product["dr_value"]
         
 
-class MinhTuanMobileProductCrawler:
+@CrawlerGetter.register("minhtuanmobile.com")
+class MinhTuanMobileProductCrawler(ProductCrawler):
+
+    TRAILING_SLASH = True
 
     ## Sale price
     # var price_current = 4990000;
@@ -434,11 +663,7 @@ class MinhTuanMobileProductCrawler:
     SALE_PRICE_PATTERN = re.compile(r"var\s+price_current\s+=\s*(\d+);")
     ORIGINAL_PRICE_PATTERN = re.compile(r"price:\s+'Giá thị trường:\s*(.*)',")
 
-    async def get_price(self, link: str) -> Product:
-        r = requests.get(link)
-        if r.status_code not in (200, 201):
-            raise Exception("error getting minhtuanmobile product " + link)
-        text = r.text
+    def parse_product(self, text: str, link: str) -> Product:
         sale_price_matcher = self.SALE_PRICE_PATTERN.search(text)
         original_price_matcher = self.ORIGINAL_PRICE_PATTERN.search(text)
 
@@ -446,28 +671,27 @@ class MinhTuanMobileProductCrawler:
             raise Exception("error getting MinhTuanMobile product, not found price. Link " + link)
 
         sale_price_text = sale_price_matcher.group(1).strip()
-        sale_price = human_price_to_integer(sale_price_text)
+        sale_price = require_price(sale_price_text)
         original_price = sale_price
         if original_price_matcher:
-            original_price = human_price_to_integer(original_price_matcher.group(1).strip())
+            original_price = require_price(original_price_matcher.group(1).strip())
         return Product(original_price=original_price, sale_price=sale_price, link=link)
 
 
-class DucHuyMobileProductCrawler:
+@CrawlerGetter.register("duchuymobile.com")
+class DucHuyMobileProductCrawler(HtmlProductCrawler):
 
     # <script> dataLayer = [{ 'ID': '4241', 'value': 1 }]; </script> // get product id
     # <span id="sec_discounted_price_4241" class="price-num">1.899.000</span>
 
     PATTERN = re.compile(r"<script>\s*dataLayer\s*=(.*?);\s*</script>")
+    PRICE_ELEMENTS = [("span", {"class": "price-num"})]
 
-    async def get_price(self, link: str) -> Product:
-        r = requests.get(link)
-        if r.status_code not in (200, 201):
-            raise Exception("error getting duc huy product " + link)
-        matcher = self.PATTERN.search(r.text)
+    def parse_product(self, text: str, link: str) -> Product:
+        matcher = self.PATTERN.search(text)
         if not matcher:
             raise Exception("error getting Cellphone product, not found pattern. Link" + link)
-        soup = BeautifulSoup(r.text, 'lxml')
+        soup = self.parse_html(text)
         jsonStr = matcher.group(1).strip()
         if jsonStr[-1] == ';':
             jsonStr = jsonStr[:-1]
@@ -477,11 +701,12 @@ class DucHuyMobileProductCrawler:
         sale_price_tag = soup.find(id=f"sec_discounted_price_{first_pid}")
         sale_price = 0
         if sale_price_tag:
-            sale_price = human_price_to_integer(sale_price_tag.text)
+            sale_price = require_price(sale_price_tag.text)
         return Product(sale_price=sale_price, original_price=sale_price, link=link)
 
 
-class HNamMobileProductCrawler:
+@CrawlerGetter.register("hnammobile.com")
+class HNamMobileProductCrawler(HtmlProductCrawler):
 
 
     # Regular
@@ -493,21 +718,20 @@ class HNamMobileProductCrawler:
     # <input type="hidden" name="price" class="product-item-value-price" value="4049000">
     # <input type="hidden" name="price-base" class="product-item-value-price-base" value="4490000">
 
-    async def get_price(self, link: str) -> Product:
-        r = requests.get(link)
-        if r.status_code not in (200, 201):
-            raise Exception("error getting Hnam product " + link)
-        soup = BeautifulSoup(r.text, 'lxml')
+    PRICE_ELEMENTS = [("input", {"class": "product-item-value-price"}), ("input", {"class": "product-item-value-price-base"})]
+
+    def extract_product(self, soup: BeautifulSoup, link: str) -> Product:
         sale_price_tag = soup.find("input", {"class": "product-item-value-price"})
         original_price_tag = soup.find("input", {"class": "product-item-value-price-base"})
-        sale_price = human_price_to_integer(sale_price_tag['value'])
-        original_price = human_price_to_integer(original_price_tag['value'])
+        sale_price = require_price(sale_price_tag['value'])
+        original_price = require_price(original_price_tag['value'])
         if original_price == 0:
             original_price = sale_price
         return Product(original_price=original_price, sale_price=sale_price, link=link)
 
 
-class XTMobileProductCrawler:
+@CrawlerGetter.register("xtmobile.vn")
+class XTMobileProductCrawler(HtmlProductCrawler):
 
     # Regular
     # <div class="prod_dt_price"><span class="price" id="price" itemprop="price" content="5290000">5.290.000đ</span></div>
@@ -516,21 +740,20 @@ class XTMobileProductCrawler:
     # <div class="prod_dt_price"><span class="price" id="price" itemprop="price" content="5290000">5.290.000đ</span><span class="price_old">6.490.000đ</span></div>
 
 
-    async def get_price(self, link: str) -> Product:
-        r = requests.get(link)
-        if r.status_code not in (200, 201):
-            raise Exception("error getting xtmobile product " + link)
-        soup = BeautifulSoup(r.text, 'lxml')
+    PRICE_ELEMENTS = [("span", {"itemprop": "price"}), ("span", {"class": "price_old"})]
+
+    def extract_product(self, soup: BeautifulSoup, link: str) -> Product:
         sale_price_tag = soup.find("span", {"itemprop": "price"})
         original_price_tag = soup.find("span", {"class": "price_old"})
-        sale_price = human_price_to_integer(sale_price_tag['content'])
+        sale_price = require_price(sale_price_tag['content'])
         original_price = sale_price
         if original_price_tag:
-            original_price = human_price_to_integer(original_price_tag.text)
+            original_price = require_price(original_price_tag.text)
         return Product(original_price=original_price, sale_price=sale_price, link=link)
 
 
-class SangMobileProductCrawler:
+@CrawlerGetter.register("sangmobile.com")
+class SangMobileProductCrawler(HtmlProductCrawler):
 
     # Regular
     # <span class="current-price ProductPrice">17,390,000₫</span>
@@ -540,11 +763,9 @@ class SangMobileProductCrawler:
     # <span class="original-price ComparePrice"><s>18,390,000₫</s></span>
 
 
-    async def get_price(self, link: str) -> Product:
-        r = requests.get(link)
-        if r.status_code not in (200, 201):
-            raise Exception("error getting xtmobile product " + link)
-        soup = BeautifulSoup(r.text, 'lxml')
+    PRICE_ELEMENTS = [("span", {"class": "current-price ProductPrice"}), ("span", {"class": "original-price ComparePrice"})]
+
+    def extract_product(self, soup: BeautifulSoup, link: str) -> Product:
         sale_price_tag = soup.find("span", {"class": "current-price ProductPrice"})
         original_price_tag = soup.find("span", {"class": "original-price ComparePrice"})
         sale_price, original_price = 0, 0
@@ -557,12 +778,13 @@ class SangMobileProductCrawler:
         return Product(original_price=original_price, sale_price=sale_price, link=link)
 
     def convert_to_price(self, text):
-        if text == "" or "Liên hệ" in text:
-            return 0
-        return human_price_to_integer(text)
+        # no price shown, e.g. "Liên hệ", is stored as 0
+        price = parse_price(text)
+        return price if price is not NO_PRICE else 0
 
 
-class PhucKhangProductCrawler:
+@CrawlerGetter.register("phuckhangmobile.com")
+class PhucKhangProductCrawler(HtmlProductCrawler):
 
     # Regular
     # <span class="price-buy">28.250.000 ₫</span>
@@ -572,11 +794,9 @@ class PhucKhangProductCrawler:
     # <span class="price-vmarket">31.990.000 ₫</span>
 
 
-    async def get_price(self, link: str) -> Product:
-        r = requests.get(link)
-        if r.status_code not in (200, 201):
-            raise Exception("error getting xtmobile product " + link)
-        soup = BeautifulSoup(r.text, 'lxml')
+    PRICE_ELEMENTS = [("span", {"class": "price-buy"}), ("span", {"class": "price-vmarket"})]
+
+    def extract_product(self, soup: BeautifulSoup, link: str) -> Product:
         sale_price_tag = soup.find("span", {"class": "price-buy"})
         original_price_tag = soup.find("span", {"class": "price-vmarket"})
         sale_price, original_price = 0, 0
@@ -587,71 +807,6 @@ class PhucKhangProductCrawler:
         return Product(original_price=original_price, sale_price=sale_price, link=link)
 
     def convert_to_price(self, text):
-        if text == "" or "Vui lòng gọi" in text:
-            return 0
-        return human_price_to_integer(text)
-
-
-class CrawlerGetter:
-    CRAWLERS = {
-                "tiki.vn": TikiProductCrawler(),
-                "24hstore.vn": M24hProductCrawler(),
-                "baochauelec.com": BaoChauProductCrawler(),
-                "haloshop.vn": HaloshopProductCrawler(),
-                "dienthoaigiakho.vn": DTGKProductCrawler(),
-                "antien.vn": AntienProductCrawler(),
-                "hoanghamobile.com": HoangHaProductCrawler(),
-                "cellphones.com.vn": CellphoneProductCrawler(),
-                "dientulinhanh.com": LinhAnhProductCrawler(),
-                "viettablet.com": ViettabletProductCrawler(),
-                "ctmobile.vn": CTMobileProductCrawler(),
-                "bachlongmobile.com": BachLongProductCrawler(),
-                "didongviet.vn": DidongvietProductCrawler(),
-                "minhtuanmobile.com": MinhTuanMobileProductCrawler(),
-                "duchuymobile.com": DucHuyMobileProductCrawler(),
-                "hnammobile.com": HNamMobileProductCrawler(),
-                "xtmobile.vn": XTMobileProductCrawler(),
-                "sangmobile.com": SangMobileProductCrawler(),
-                "phuckhangmobile.com": PhucKhangProductCrawler(),
-            }
-
-    def get_crawler(self, link: str):
-        if "tiki.vn" in link:
-            return self.CRAWLERS.get("tiki.vn")
-        if "24hstore.vn" in link:
-            return self.CRAWLERS.get("24hstore.vn")
-        if "baochauelec.com" in link:
-            return self.CRAWLERS.get("baochauelec.com")
-        if "haloshop.vn" in link:
-            return self.CRAWLERS.get("haloshop.vn")
-        if "dienthoaigiakho.vn" in link:
-            return self.CRAWLERS.get("dienthoaigiakho.vn")
-        if "antien.vn" in link:
-            return self.CRAWLERS.get("antien.vn")
-        if "hoanghamobile.com" in link:
-            return self.CRAWLERS.get("hoanghamobile.com")
-        if "cellphones.com.vn" in link:
-            return self.CRAWLERS.get("cellphones.com.vn")
-        if "dientulinhanh.com" in link:
-            return self.CRAWLERS.get("dientulinhanh.com")
-        if "viettablet.com" in link:
-            return self.CRAWLERS.get("viettablet.com")
-        if "ctmobile.vn" in link:
-            return self.CRAWLERS.get("ctmobile.vn")
-        if "bachlongmobile.com" in link:
-            return self.CRAWLERS.get("bachlongmobile.com")
-        if "didongviet.vn" in link:
-            return self.CRAWLERS.get("didongviet.vn")
-        if "minhtuanmobile.com" in link:
-            return self.CRAWLERS.get("minhtuanmobile.com")
-        if "duchuymobile.com" in link:
-            return self.CRAWLERS.get("duchuymobile.com")
-        if "hnammobile.com" in link:
-            return self.CRAWLERS.get("hnammobile.com")
-        if "xtmobile.vn" in link:
-            return self.CRAWLERS.get("xtmobile.vn")
-        if "sangmobile.com" in link:
-            return self.CRAWLERS.get("sangmobile.com")
-        if "phuckhangmobile.com" in link:
-            return self.CRAWLERS.get("phuckhangmobile.com")
-        raise Exception("not found suitable crawler for link {}".format(link))
+        # no price shown, e.g. "Vui lòng gọi", is stored as 0
+        price = parse_price(text)
+        return price if price is not NO_PRICE else 0
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+
+from services.resilience import CircuitBreaker, CircuitOpenError, RetryPolicy, classify
+
+
+class TokenBucket:
+
+    # `rate` tokens per second are added up to `capacity`; each request takes one token
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        # the lock keeps waiters in FIFO order
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+
+class DomainLimiter:
+
+    def __init__(self, domain: str, concurrency: int, rate: float, burst: float = None,
+                 breaker: CircuitBreaker = None):
+        self.domain = domain
+        self.concurrency = concurrency
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.queued = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        # error kind -> count, see resilience.classify
+        self.errors = Counter()
+        self.first_started_at = None
+        self.last_finished_at = None
+
+    def requests_per_second(self) -> float:
+        if self.first_started_at is None or self.last_finished_at is None:
+            return 0.0
+        elapsed = self.last_finished_at - self.first_started_at
+        done = self.completed + self.failed
+        return done / elapsed if elapsed > 0 else float(done)
+
+
+class DomainScheduler:
+
+    # Sits between StreamingService and the crawlers: every shop gets its own concurrency cap and token-bucket
+    # rate, so a backlog of links for a big shop waits on that shop's limiter only and links of other shops
+    # keep flowing through the shared HttpClient. Limits come from `[domain:<key>]` sections in app.ini.
+    # Failed calls are retried following `retry_policy`, and each shop has a circuit breaker so the links of a
+    # shop that is down fail fast instead of each one waiting for its own timeouts.
+    SECTION_PREFIX = "domain:"
+
+    def __init__(self, default_concurrency: int = 4, default_rate: float = 5, default_burst: float = None,
+                 limits: dict = None, retry_policy: RetryPolicy = None, breaker_threshold: int = 5,
+                 breaker_reset: float = 30):
+        self.default_concurrency = default_concurrency
+        self.default_rate = default_rate
+        self.default_burst = default_burst
+        self.limits = limits or {}
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy(max_retries=0)
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self.limiters = {}
+
+    @classmethod
+    def from_config(cls, config):
+        scheduler_config = config['SCHEDULER'] if config.has_section('SCHEDULER') else config['DEFAULT']
+        default_concurrency = scheduler_config.getint('DOMAIN_CONCURRENCY', 4)
+        default_rate = scheduler_config.getfloat('DOMAIN_RATE', 5)
+        default_burst = scheduler_config.getfloat('DOMAIN_BURST', None)
+        limits = {}
+        for section in config.sections():
+            if not section.startswith(cls.SECTION_PREFIX):
+                continue
+            domain_config = config[section]
+            limits[section[len(cls.SECTION_PREFIX):]] = {
+                "concurrency": domain_config.getint('CONCURRENCY', default_concurrency),
+                "rate": domain_config.getfloat('RATE', default_rate),
+                "burst": domain_config.getfloat('BURST', default_burst),
+            }
+        retry_policy = RetryPolicy(max_retries=scheduler_config.getint('MAX_RETRIES', 2),
+                                   base_delay=scheduler_config.getfloat('RETRY_BASE_DELAY', 0.5),
+                                   max_delay=scheduler_config.getfloat('RETRY_MAX_DELAY', 10),
+                                   max_retry_after=scheduler_config.getfloat('MAX_RETRY_AFTER', 60))
+        return cls(default_concurrency, default_rate, default_burst, limits, retry_policy,
+                   breaker_threshold=scheduler_config.getint('BREAKER_THRESHOLD', 5),
+                   breaker_reset=scheduler_config.getfloat('BREAKER_RESET', 30))
+
+    def get_limiter(self, domain: str) -> DomainLimiter:
+        limiter = self.limiters.get(domain)
+        if limiter is None:
+            limit = self.limits.get(domain, {})
+            limiter = DomainLimiter(domain,
+                                    concurrency=limit.get("concurrency", self.default_concurrency),
+                                    rate=limit.get("rate", self.default_rate),
+                                    burst=limit.get("burst", self.default_burst),
+                                    breaker=CircuitBreaker(self.breaker_threshold, self.breaker_reset))
+            self.limiters[domain] = limiter
+        return limiter
+
+    async def run(self, domain: str, func, *args, window: asyncio.Semaphore = None):
+        # `window` is a slot shared by all shops (the crawl window), taken once the shop itself may send the
+        # request so a shop at its limits does not hold a slot other shops could use
+        limiter = self.get_limiter(domain)
+        attempt = 0
+        while True:
+            try:
+                return await self._run_once(limiter, window, func, *args)
+            except Exception as e:
+                limiter.errors[classify(e)] += 1
+                delay = self.retry_policy.delay(attempt, e)
+                if delay is None:
+                    raise
+            # the backoff does not hold a slot of the shop
+            attempt += 1
+            limiter.retries += 1
+            await asyncio.sleep(delay)
+
+    async def _run_once(self, limiter: DomainLimiter, window: asyncio.Semaphore, func, *args):
+        limiter.queued += 1
+        started = False
+        try:
+            async with limiter.semaphore:
+                # checked once a slot is free, the breaker may have opened while waiting
+                if not limiter.breaker.allow():
+                    raise CircuitOpenError(f"circuit open for {limiter.domain}")
+                await limiter.bucket.acquire()
+                if window is not None:
+                    await window.acquire()
+                limiter.queued -= 1
+                limiter.in_flight += 1
+                started = True
+                if limiter.first_started_at is None:
+                    limiter.first_started_at = time.monotonic()
+                try:
+                    result = await func(*args)
+                    limiter.completed += 1
+                    limiter.breaker.record_success()
+                    return result
+                except Exception as e:
+                    limiter.failed += 1
+                    limiter.breaker.record_failure(e)
+                    raise
+                finally:
+                    limiter.in_flight -= 1
+                    limiter.last_finished_at = time.monotonic()
+                    if window is not None:
+                        window.release()
+        finally:
+            if not started:
+                limiter.queued -= 1
+
+    def queue_depth(self, domain: str) -> int:
+        limiter = self.limiters.get(domain)
+        return limiter.queued if limiter else 0
+
+    def stats(self) -> dict:
+        return {domain: {"queued": limiter.queued,
+                         "in_flight": limiter.in_flight,
+                         "completed": limiter.completed,
+                         "failed": limiter.failed,
+                         "retries": limiter.retries,
+                         "errors": dict(limiter.errors),
+                         "circuit": limiter.breaker.state,
+                         "requests_per_second": limiter.requests_per_second()}
+                for domain, limiter in self.limiters.items()}
+
+    def log_stats(self):
+        for domain, stat in sorted(self.stats().items()):
+            logging.info(f"{domain}: completed {stat['completed']}, failed {stat['failed']}, "
+                         f"retries {stat['retries']}, errors {stat['errors']}, circuit {stat['circuit']}, "
+                         f"queued {stat['queued']}, {stat['requests_per_second']:.2f} req/s")
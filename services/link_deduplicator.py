@@ -0,0 +1,48 @@
+from typing import List, Tuple
+
+from pricing import Product
+
+
+class LinkDeduplicator:
+
+    # Rows of the sheet often reference the same product through different links. Each canonical link is crawled
+    # once per run and its product fanned back out to the links of all the rows referencing it.
+    def __init__(self):
+        # canonical link -> (row index, link) of the rows waiting for its product
+        self.links = {}
+        # canonical link -> crawled product, None when crawling failed
+        self.products = {}
+        self.rows = 0
+
+    def add(self, canonical: str, link: str, row_index: int = None) -> bool:
+        # True when the canonical link has not been seen in this run and has to be crawled
+        self.rows += 1
+        is_new = canonical not in self.links and canonical not in self.products
+        self.links.setdefault(canonical, []).append((row_index, link))
+        return is_new
+
+    def resolve(self, canonical: str, product: Product) -> List[Tuple[int, Product]]:
+        # records the result of crawling the canonical link, returns (row index, product) per waiting row
+        self.products[canonical] = product
+        return self.ready(canonical)
+
+    def ready(self, canonical: str) -> List[Tuple[int, Product]]:
+        # (row index, product) of the rows whose canonical link has already been crawled
+        if canonical not in self.products:
+            return []
+        product = self.products[canonical]
+        rows = self.links.pop(canonical, [])
+        if product is None:
+            return []
+        return [(row_index, product._replace(link=link)) for row_index, link in rows]
+
+    @property
+    def unique(self) -> int:
+        return len(self.products) + sum(1 for canonical in self.links if canonical not in self.products)
+
+    def pending_rows(self) -> int:
+        # rows whose canonical link has not been crawled yet
+        return sum(len(links) for links in self.links.values())
+
+    def duplicate_ratio(self) -> float:
+        return 1 - self.unique / self.rows if self.rows else 0.0
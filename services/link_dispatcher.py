@@ -0,0 +1,51 @@
+import asyncio
+from typing import Callable, List
+
+
+class LinkDispatcher:
+
+    # Crawl stage of the pipeline: the links read from the sheet are queued per shop, and each shop's queue is
+    # drained by as many workers as the shop may have requests in flight (`concurrency_of(shop)`). A backlog of
+    # links of a big shop only occupies that shop's workers, the links of other shops are picked up by their own
+    # workers as soon as they are read. At most `max_pending` links wait in the queues, the reader waits beyond.
+    # `crawl(row_index, link)` is awaited for each link, the crawl window is enforced there.
+    def __init__(self, crawl, concurrency_of: Callable[[str], int], max_pending: int = 500):
+        self.crawl = crawl
+        self.concurrency_of = concurrency_of
+        self.pending = asyncio.Semaphore(max_pending)
+        # shop -> queue of (row_index, link)
+        self.queues = {}
+        # shop -> number of workers draining its queue
+        self.n_workers = {}
+        self.workers: List[asyncio.Task] = []
+
+    async def put(self, shop: str, row_index: int, link: str):
+        await self.pending.acquire()
+        queue = self.queues.get(shop)
+        if queue is None:
+            queue = self.queues[shop] = asyncio.Queue()
+            self.n_workers[shop] = max(self.concurrency_of(shop), 1)
+            self.workers.extend(asyncio.create_task(self._work(queue)) for _ in range(self.n_workers[shop]))
+        queue.put_nowait((row_index, link))
+
+    def close(self):
+        # no more links, the workers stop once their queue is drained
+        for shop, queue in self.queues.items():
+            for _ in range(self.n_workers[shop]):
+                queue.put_nowait(None)
+
+    async def join(self):
+        await asyncio.gather(*self.workers)
+
+    async def cancel(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+
+    async def _work(self, queue: asyncio.Queue):
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            self.pending.release()
+            await self.crawl(*item)
@@ -0,0 +1,71 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Tuple
+
+from metrics import run_metrics
+from pricing import Product
+
+# crawler class -> crawler instance, one per worker process
+_worker_crawlers = {}
+
+
+def parse_page(crawler_cls, domain: str, content: bytes, encoding: str, link: str) -> Tuple[Product, Exception, float]:
+    # (product, error, seconds spent decoding and parsing), timed in the worker so the wait for a free worker is
+    # not counted
+    start = time.perf_counter()
+    crawler = _worker_crawlers.get(crawler_cls)
+    if crawler is None:
+        crawler = crawler_cls()
+        crawler.domain = domain
+        _worker_crawlers[crawler_cls] = crawler
+    try:
+        return crawler.parse_product(content.decode(encoding, errors="replace"), link), None, \
+            time.perf_counter() - start
+    except Exception as e:
+        return None, e, time.perf_counter() - start
+
+
+class ParserPool:
+
+    # Crawlers fetch on the event loop and hand the raw body to a process pool for decoding and parsing,
+    # so a page being parsed never stalls the other in-flight requests and parsing scales across cores.
+    def __init__(self, workers: int = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = None
+
+    @classmethod
+    def from_config(cls, config):
+        parsing_config = config['PARSING'] if config.has_section('PARSING') else config['DEFAULT']
+        return cls(workers=parsing_config.getint('WORKERS', 0))
+
+    def start(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    async def parse(self, crawler, content: bytes, encoding: str, link: str) -> Product:
+        # recorded as the parse stage, the time spent in the pool's queue and pickling as parse_wait
+        self.start()
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        product, error, seconds = await loop.run_in_executor(self.executor, parse_page, type(crawler), crawler.domain,
+                                                             content, encoding, link)
+        run_metrics.observe("parse_wait", crawler.domain, max(time.perf_counter() - start - seconds, 0.0))
+        run_metrics.observe("parse", crawler.domain, seconds, ok=error is None)
+        if error is not None:
+            raise error
+        return product
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown()
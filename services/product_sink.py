@@ -0,0 +1,229 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+
+from clients.bq_client import chunk_products
+from clients.price_store import PriceStore
+from metrics import run_metrics
+from pricing import Product, ProductBatch
+
+
+class ProductSink:
+
+    # sink stage of the crawl pipeline, with a price store only the products whose prices changed are written
+    flush_interval = 30
+
+    def __init__(self, price_store: PriceStore = None):
+        self.price_store = price_store
+        self.last_flush_at = time.monotonic()
+        self.inserted = 0
+        self.failed = 0
+
+    async def consume(self, product_queue: asyncio.Queue):
+        # a None item ends the stream
+        while True:
+            timeout = max(0.0, self.flush_interval - (time.monotonic() - self.last_flush_at))
+            try:
+                product = await asyncio.wait_for(product_queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                await self.flush()
+                continue
+            if product is None:
+                break
+            if self.price_store is not None and not self.price_store.should_write(product):
+                continue
+            await self.add(product)
+        await self.close()
+
+    async def add(self, product: Product):
+        raise NotImplementedError
+
+    async def flush(self):
+        self.last_flush_at = time.monotonic()
+
+    async def close(self):
+        await self.flush()
+
+
+def sink_from_config(bq_client, config, price_store: PriceStore = None) -> ProductSink:
+    sink_config = config['SINK'] if config.has_section('SINK') else config['DEFAULT']
+    mode = sink_config.get('MODE', 'streaming')
+    if mode == 'load':
+        return LoadJobProductSink.from_config(bq_client, config, price_store)
+    if mode == 'streaming':
+        return BQProductSink.from_config(bq_client, config, price_store)
+    raise ValueError(f"unknown sink mode {mode}")
+
+
+class BQProductSink(ProductSink):
+
+    # Buffers crawled products and streams them to BigQuery every `flush_rows` products or `flush_interval`
+    # seconds, so memory stays flat whatever the sheet size and a crash only loses the current buffer.
+    # BQClient splits a flush into insert requests of at most `chunk_rows` rows / `chunk_bytes` bytes,
+    # the chunks that failed are retried.
+
+    def __init__(self, bq_client, dataset: str = "pre_sync", table_name: str = "competitor_price",
+                 flush_rows: int = 500, flush_interval: float = 30, chunk_rows: int = 500,
+                 chunk_bytes: int = 5 * 1024 * 1024, max_retries: int = 3, retry_delay: float = 1,
+                 price_store: PriceStore = None):
+        super().__init__(price_store)
+        self.bq_client = bq_client
+        self.dataset = dataset
+        self.table_name = table_name
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.chunk_rows = chunk_rows
+        self.chunk_bytes = chunk_bytes
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.buffer = ProductBatch()
+        self.max_buffered = 0
+
+    @classmethod
+    def from_config(cls, bq_client, config, price_store: PriceStore = None):
+        sink_config = config['SINK'] if config.has_section('SINK') else config['DEFAULT']
+        return cls(bq_client,
+                   flush_rows=sink_config.getint('FLUSH_ROWS', 500),
+                   flush_interval=sink_config.getfloat('FLUSH_INTERVAL', 30),
+                   chunk_rows=sink_config.getint('CHUNK_ROWS', 500),
+                   chunk_bytes=sink_config.getint('CHUNK_BYTES', 5 * 1024 * 1024),
+                   max_retries=sink_config.getint('MAX_RETRIES', 3),
+                   retry_delay=sink_config.getfloat('RETRY_DELAY', 1),
+                   price_store=price_store)
+
+    async def add(self, product: Product):
+        self.buffer.append(product)
+        self.max_buffered = max(self.max_buffered, len(self.buffer))
+        if len(self.buffer) >= self.flush_rows or time.monotonic() - self.last_flush_at >= self.flush_interval:
+            await self.flush()
+
+    async def flush(self):
+        products, self.buffer = self.buffer, ProductBatch()
+        self.last_flush_at = time.monotonic()
+        if not products:
+            return
+        pending = products
+        for attempt in range(self.max_retries + 1):
+            failed = await self._insert(pending)
+            failed_products = ProductBatch()
+            for chunk, _ in failed:
+                failed_products.extend(chunk)
+            self.inserted += len(pending) - len(failed_products)
+            if self.price_store is not None:
+                failed_links = set(failed_products.links)
+                self.price_store.record(product for product in pending if product.link not in failed_links)
+            if not failed_products:
+                return
+            logging.warning(f"inserting {len(failed_products)} rows failed (attempt {attempt + 1})")
+            pending = failed_products
+            if attempt < self.max_retries:
+                await asyncio.sleep(self.retry_delay * 2 ** attempt * (1 + random.random()))
+        logging.error(f"giving up inserting {len(pending)} rows after {self.max_retries + 1} attempts")
+        self.failed += len(pending)
+
+    async def _insert(self, products: ProductBatch):
+        start = time.perf_counter()
+        try:
+            failed = await asyncio.to_thread(self.bq_client.insert_products, self.dataset, self.table_name, products,
+                                             self.chunk_rows, self.chunk_bytes)
+            run_metrics.observe("bq_insert", None, time.perf_counter() - start, ok=not failed)
+            return failed
+        except Exception as e:
+            run_metrics.observe("bq_insert", None, time.perf_counter() - start, ok=False)
+            # e.g. the table metadata could not be fetched
+            return [(chunk, [str(e)]) for chunk in chunk_products(products, self.chunk_rows, self.chunk_bytes)]
+
+
+class LoadJobProductSink(ProductSink):
+
+    # Writes the run's rows to a gzipped newline delimited json file as they arrive and loads the file into
+    # today's partition with a load job every `file_rows` rows and when the stream ends. Load jobs are free,
+    # streaming inserts are billed per row (1KB minimum), and loaded rows are visible to merge_product right away.
+
+    def __init__(self, bq_client, dataset: str = "pre_sync", table_name: str = "competitor_price",
+                 directory: str = None, flush_interval: float = 30, file_rows: int = 100_000, max_retries: int = 3,
+                 retry_delay: float = 1, price_store: PriceStore = None):
+        super().__init__(price_store)
+        self.bq_client = bq_client
+        self.dataset = dataset
+        self.table_name = table_name
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.file_rows = file_rows
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.path = None
+        self.file = None
+        # rows of the current file
+        self.rows = 0
+        # products of the file, recorded in the price store once loaded
+        self.written = ProductBatch()
+        self.today = None
+
+    @classmethod
+    def from_config(cls, bq_client, config, price_store: PriceStore = None):
+        sink_config = config['SINK'] if config.has_section('SINK') else config['DEFAULT']
+        return cls(bq_client,
+                   directory=sink_config.get('LOAD_DIRECTORY', None) or None,
+                   flush_interval=sink_config.getfloat('FLUSH_INTERVAL', 30),
+                   file_rows=sink_config.getint('LOAD_FILE_ROWS', 100_000),
+                   max_retries=sink_config.getint('MAX_RETRIES', 3),
+                   retry_delay=sink_config.getfloat('RETRY_DELAY', 1),
+                   price_store=price_store)
+
+    def _open(self):
+        fd, self.path = tempfile.mkstemp(prefix=f"{self.dataset}.{self.table_name}.", suffix=".json.gz",
+                                         dir=self.directory)
+        self.file = gzip.open(os.fdopen(fd, "wb"), "wt", encoding="utf-8")
+        self.today = self.bq_client.now().date()
+
+    async def add(self, product: Product):
+        if self.file is None:
+            self._open()
+        row = self.bq_client.to_row(product, self.today, self.bq_client.now())
+        self.file.write(json.dumps(row, default=str, ensure_ascii=False))
+        self.file.write("\n")
+        self.rows += 1
+        if self.price_store is not None:
+            self.written.append(product)
+        if self.rows >= self.file_rows:
+            await self._load()
+
+    async def flush(self):
+        await super().flush()
+        if self.file is not None:
+            self.file.flush()
+
+    async def close(self):
+        await self._load()
+
+    async def _load(self):
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        rows, self.rows = self.rows, 0
+        written, self.written = self.written, ProductBatch()
+        for attempt in range(self.max_retries + 1):
+            try:
+                with run_metrics.timer("bq_insert"):
+                    await asyncio.to_thread(self.bq_client.load_file, self.dataset, self.table_name, self.path,
+                                            self.today)
+            except Exception as e:
+                logging.warning(f"loading {self.path} failed (attempt {attempt + 1}): {e}")
+            else:
+                self.inserted += rows
+                if self.price_store is not None:
+                    self.price_store.record(written)
+                os.remove(self.path)
+                return
+            if attempt < self.max_retries:
+                await asyncio.sleep(self.retry_delay * 2 ** attempt * (1 + random.random()))
+        # the file is kept so the rows can be loaded by hand
+        logging.error(f"giving up loading {rows} rows of {self.path} after {self.max_retries + 1} attempts")
+        self.failed += rows
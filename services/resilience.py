@@ -0,0 +1,103 @@
+import asyncio
+import random
+import time
+
+import aiohttp
+
+from clients.http_client import HttpStatusError
+
+TIMEOUT = "timeout"
+CONNECTION = "connection"
+RATE_LIMITED = "rate_limited"
+SERVER = "server"
+CLIENT = "client"
+PARSE = "parse"
+CIRCUIT_OPEN = "circuit_open"
+
+# errors worth another attempt
+RETRYABLE = {TIMEOUT, CONNECTION, RATE_LIMITED, SERVER}
+# errors telling that the shop itself is down; a 429 or a page we cannot parse means the shop is up
+SHOP_DOWN = {TIMEOUT, CONNECTION, SERVER}
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+def classify(e: Exception) -> str:
+    if isinstance(e, CircuitOpenError):
+        return CIRCUIT_OPEN
+    if isinstance(e, HttpStatusError):
+        if e.status_code == 429:
+            return RATE_LIMITED
+        return SERVER if e.status_code >= 500 else CLIENT
+    if isinstance(e, asyncio.TimeoutError):
+        return TIMEOUT
+    if isinstance(e, (aiohttp.ClientError, OSError)):
+        return CONNECTION
+    # anything else raised by a crawler comes from reading the page
+    return PARSE
+
+
+class RetryPolicy:
+
+    # Exponential backoff with full jitter: attempt n waits a random time in [0, base_delay * 2^n], at most
+    # max_delay. A Retry-After sent by the shop is honoured when it is not longer than max_retry_after,
+    # otherwise the link is given up.
+    def __init__(self, max_retries: int = 2, base_delay: float = 0.5, max_delay: float = 10,
+                 max_retry_after: float = 60):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+
+    def delay(self, attempt: int, e: Exception) -> float:
+        # None when the error should not be retried
+        if attempt >= self.max_retries or classify(e) not in RETRYABLE:
+            return None
+        retry_after = getattr(e, "retry_after", None)
+        if retry_after is not None:
+            return retry_after if retry_after <= self.max_retry_after else None
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+
+    # Opens after `failure_threshold` consecutive shop-down errors: calls fail fast with CircuitOpenError for
+    # `reset_timeout` seconds, then a single trial call is let through (half open), its success closes the
+    # circuit, its failure opens it again.
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            return True
+        # open, or half open with the trial call in flight
+        return False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self, e: Exception):
+        if classify(e) not in SHOP_DOWN:
+            if self.state == self.HALF_OPEN:
+                self.record_success()
+            return
+        self.failures += 1
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.times_opened += 1
@@ -0,0 +1,80 @@
+import configparser
+import hashlib
+import math
+import multiprocessing
+import os
+from typing import List
+
+from services.domain_scheduler import DomainScheduler
+
+
+class Shard:
+
+    # One of `count` workers of a sharded run. Every worker reads the whole link column and crawls the rows
+    # whose canonical link it owns, so the rows of a product stay on one worker and are still deduplicated.
+    # Links are assigned by rendezvous hashing: the owner of a link is the shard with the highest hash of
+    # (shard, link), stable across runs and machines, and changing the shard count only moves the links of the
+    # added or removed shards.
+    def __init__(self, index: int, count: int):
+        if not 0 <= index < count:
+            raise ValueError(f"shard index {index} is not in [0, {count})")
+        self.index = index
+        self.count = count
+
+    def __str__(self):
+        return f"shard {self.index + 1}/{self.count}"
+
+    @staticmethod
+    def owner(canonical: str, count: int) -> int:
+        key = canonical.encode()
+        return max(range(count), key=lambda shard: hashlib.blake2b(key, digest_size=8,
+                                                                   salt=shard.to_bytes(8, "little")).digest())
+
+    def owns(self, canonical: str) -> bool:
+        return self.count == 1 or self.owner(canonical, self.count) == self.index
+
+    def path(self, path: str) -> str:
+        # local files of the worker, shards running on the same machine must not share a sqlite file
+        root, ext = os.path.splitext(path)
+        return f"{root}.shard{self.index}{ext}"
+
+    def config(self, config: configparser.ConfigParser) -> configparser.ConfigParser:
+        # copy of the configuration for this worker: every *_PATH points to a file of its own and, unless
+        # [SHARDING] SPLIT_DOMAIN_LIMITS is false, the per-shop limits are divided among the shards so a shop
+        # sees the same load as from a single worker
+        sharded = configparser.ConfigParser()
+        sharded.read_dict({"DEFAULT": config.defaults()})
+        sharded.read_dict({section: dict(config.items(section, raw=True)) for section in config.sections()})
+        for section in [configparser.DEFAULTSECT] + sharded.sections():
+            for key, value in list(sharded[section].items()):
+                if key.endswith("path") and value:
+                    sharded[section][key] = self.path(config[section][key])
+        sharding_config = config['SHARDING'] if config.has_section('SHARDING') else config['DEFAULT']
+        if sharding_config.getboolean('SPLIT_DOMAIN_LIMITS', True):
+            self._split_limits(sharded)
+        return sharded
+
+    def _split_limits(self, config: configparser.ConfigParser):
+        limits = [('SCHEDULER', 'DOMAIN_')] if config.has_section('SCHEDULER') else []
+        limits += [(section, '') for section in config.sections()
+                   if section.startswith(DomainScheduler.SECTION_PREFIX)]
+        for section, prefix in limits:
+            values = config[section]
+            if prefix + 'CONCURRENCY' in values:
+                values[prefix + 'CONCURRENCY'] = str(math.ceil(values.getint(prefix + 'CONCURRENCY') / self.count))
+            if prefix + 'RATE' in values:
+                values[prefix + 'RATE'] = str(values.getfloat(prefix + 'RATE') / self.count)
+            if prefix + 'BURST' in values:
+                values[prefix + 'BURST'] = str(max(values.getfloat(prefix + 'BURST') / self.count, 1))
+
+
+def run_shards(target, count: int, *args) -> List[int]:
+    # runs target(Shard(i, count), *args) in `count` local processes, returns their exit codes
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=target, args=(Shard(index, count), *args), name=f"shard-{index}")
+                 for index in range(count)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return [process.exitcode for process in processes]
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import logging
+import re
+import time
+from typing import List, Tuple
+
+from clients.gsheet_client import GSheetClient
+
+
+class SheetPriceWriter:
+
+    # Write-back stage of the crawl pipeline: collects the crawled prices by row index and writes them to the
+    # pricing columns of the sheet every `flush_rows` results or `flush_interval` seconds. The rows of a flush are
+    # coalesced into ranges of consecutive rows, gaps of at most `max_gap` rows (empty or failed rows) are bridged
+    # with empty rows, which the Sheets API leaves untouched, and all ranges go in a single values.batchUpdate,
+    # split only when its payload would exceed `max_request_bytes`.
+    RANGE_PATTERN = re.compile(r"^(.+)!([A-Z]+)\{\}:([A-Z]+)\{\}$")
+    # product fields written to the columns of the range, in order
+    COLUMNS = ("sale_price", "original_price")
+
+    def __init__(self, gsheet_client: GSheetClient, range_format: str, flush_rows: int = 5000,
+                 flush_interval: float = 60, max_gap: int = 3, max_request_bytes: int = 2 * 1024 * 1024):
+        if not self.RANGE_PATTERN.match(range_format):
+            raise ValueError(f"unsupported range format {range_format}")
+        self.gsheet_client = gsheet_client
+        self.range_format = range_format
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.max_gap = max_gap
+        self.max_request_bytes = max_request_bytes
+        # row index -> values of the pricing columns
+        self.buffer = {}
+        self.last_flush_at = time.monotonic()
+        self.written = 0
+        self.failed = 0
+        self.requests = 0
+
+    @classmethod
+    def from_config(cls, gsheet_client: GSheetClient, config):
+        # None when writing back is disabled
+        if not config.has_section('SHEET_WRITE') or not config['SHEET_WRITE'].getboolean('ENABLED', False):
+            return None
+        write_config = config['SHEET_WRITE']
+        return cls(gsheet_client, config['DEFAULT']['PRICING_RANGE_FORMAT'],
+                   flush_rows=write_config.getint('FLUSH_ROWS', 5000),
+                   flush_interval=write_config.getfloat('FLUSH_INTERVAL', 60),
+                   max_gap=write_config.getint('MAX_GAP', 3),
+                   max_request_bytes=write_config.getint('MAX_REQUEST_BYTES', 2 * 1024 * 1024))
+
+    async def consume(self, result_queue: asyncio.Queue):
+        # (row_index, product) items, a None item ends the stream
+        while True:
+            timeout = max(0.0, self.flush_interval - (time.monotonic() - self.last_flush_at))
+            try:
+                item = await asyncio.wait_for(result_queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                await self.flush()
+                continue
+            if item is None:
+                break
+            row_index, product = item
+            self.buffer[row_index] = [getattr(product, column) for column in self.COLUMNS]
+            if len(self.buffer) >= self.flush_rows:
+                await self.flush()
+        await self.flush()
+
+    def ranges(self, rows: dict) -> List[Tuple[str, list]]:
+        # (range, values) of the given row index -> values, one range per run of rows
+        ranges = []
+        first, values = None, []
+        for row_index in sorted(rows):
+            if first is not None and row_index - (first + len(values)) > self.max_gap:
+                ranges.append((self.range_format.format(first, first + len(values) - 1), values))
+                first, values = None, []
+            if first is None:
+                first = row_index
+            values.extend([] for _ in range(row_index - first - len(values)))
+            values.append(rows[row_index])
+        if values:
+            ranges.append((self.range_format.format(first, first + len(values) - 1), values))
+        return ranges
+
+    def requests_of(self, ranges: List[Tuple[str, list]]) -> List[List[Tuple[str, list]]]:
+        # ranges grouped into batchUpdate requests of at most max_request_bytes of json
+        requests, request, request_bytes = [], [], 0
+        for range_name, values in ranges:
+            size = len(range_name) + len(json.dumps(values)) + 32
+            if request and request_bytes + size > self.max_request_bytes:
+                requests.append(request)
+                request, request_bytes = [], 0
+            request.append((range_name, values))
+            request_bytes += size
+        if request:
+            requests.append(request)
+        return requests
+
+    async def flush(self):
+        rows, self.buffer = self.buffer, {}
+        self.last_flush_at = time.monotonic()
+        if not rows:
+            return
+        for request in self.requests_of(self.ranges(rows)):
+            # bridged rows are not counted
+            n_rows = sum(1 for _, values in request for row in values if row)
+            self.requests += 1
+            try:
+                await asyncio.to_thread(self.gsheet_client.batch_update, request)
+                self.written += n_rows
+            except Exception:
+                # the prices are written again by the next run
+                logging.exception(f"error writing {n_rows} rows of prices to the sheet")
+                self.failed += n_rows
+
+    def log_stats(self):
+        logging.info(f"prices written to the sheet: {self.written} rows in {self.requests} requests, "
+                     f"failed {self.failed}")
@@ -1,22 +1,45 @@
 import asyncio
 import concurrent
+import json
 import logging
+import os
 import time
+from datetime import datetime
 
-from typing import List
+from typing import List, Tuple
 
 from clients.bq_client import BQClient
+from clients.content_store import ContentStore
+from clients.crawl_checkpoint import CrawlCheckpoint
 from clients.gsheet_client import GSheetClient
+from clients.http_cache import HttpCache
+from clients.http_client import HttpClient
+from clients.price_store import PriceStore
 from configurations import configuration
-from pricing import CrawlerGetter, Product
+from metrics import run_metrics
+from pricing import CrawlerGetter, CrawlerListener, Product
+from services.domain_scheduler import DomainScheduler
+from services.link_deduplicator import LinkDeduplicator
+from services.link_dispatcher import LinkDispatcher
+from services.parser_pool import ParserPool
+from services.product_sink import ProductSink, sink_from_config
+from services.resilience import classify
+from services.sheet_reader import SheetLinkReader
+from services.sharding import Shard
+from services.sheet_writer import SheetPriceWriter
 
 
 class StreamingService:
 
-    def __init__(self, bq_client: BQClient, gsheet_client: GSheetClient):
+    def __init__(self, bq_client: BQClient, gsheet_client: GSheetClient, listeners: List[CrawlerListener] = None,
+                 shard: Shard = None):
         self.bq_client = bq_client
         self.gsheet_client = gsheet_client
-        self.config = configuration.config
+        # told about each crawled link, e.g. the SheetLogger of failures
+        self.listeners = list(listeners or ())
+        # with a shard, only the rows of the shard are crawled, see Shard
+        self.shard = shard
+        self.config = shard.config(configuration.config) if shard is not None else configuration.config
 
     """
     Standard tables require columns:
@@ -26,29 +49,30 @@ class StreamingService:
     """
 
     def _get_merge_query(self, source_table, dest_table, id_columns: List[str], columns_update: List[str],
-                         columns_insert: List[str]) -> str:
+                         columns_insert: List[str], since: datetime = None, until: datetime = None) -> str:
+        # Only today's partition of the source is read, and of it only the rows created in (since, until] when
+        # given, the last row of each id wins. The target is pruned to today's partition when _date is an id.
         id_columns_select = ",".join(id_columns)
         ids_matching_stmt = " AND ".join(map(lambda col: f"T.{col} = S.{col}", id_columns))
+        if "_date" in id_columns:
+            ids_matching_stmt = f'T._date = CURRENT_DATE("+7") AND {ids_matching_stmt}'
         columns_update_stmt = ",".join(map(lambda col: f"T.{col} = S.{col}", columns_update))
         columns_insert_stmt = ",".join(columns_insert)
         columns_insert_assigment_stmt = ",".join(map(lambda col: f"S.{col}", columns_insert))
+        created_at_filter = ""
+        if since is not None:
+            created_at_filter += f' AND _created_at > TIMESTAMP("{since.isoformat(sep=" ")}")'
+        if until is not None:
+            created_at_filter += f' AND _created_at <= TIMESTAMP("{until.isoformat(sep=" ")}")'
         merge_sql = f"""
         MERGE {dest_table} T
                 USING (SELECT
-                agg.table.*
-                FROM (
-                SELECT
-                {id_columns_select},
-                ARRAY_AGG(STRUCT(table)
-                ORDER BY
-                _created_at DESC)[SAFE_OFFSET(0)] agg
+                *
                 FROM
-                {source_table} table
+                {source_table}
                 WHERE
-                _date = CURRENT_DATE("+7")
-                GROUP BY
-                {id_columns_select},
-                _date)) S
+                _date = CURRENT_DATE("+7"){created_at_filter}
+                QUALIFY ROW_NUMBER() OVER (PARTITION BY {id_columns_select} ORDER BY _created_at DESC) = 1) S
                 ON {ids_matching_stmt}
                 WHEN MATCHED THEN
             UPDATE SET {columns_update_stmt}, T._updated_at = CURRENT_TIMESTAMP()
@@ -57,78 +81,265 @@ class StreamingService:
         """
         return merge_sql
 
-    async def populate_prices(self):
-        LINK_RANGE_FORMART = self.config['DEFAULT']['LINK_RANGE_FORMART']
+    async def populate_prices(self, http_client: HttpClient = None, merge: bool = True):
+        # the workers of a sharded run do not merge, the coordinator merges once they are all done
+        run_metrics.configure(self.config)
+        run_metrics.reset()
+        scheduler = DomainScheduler.from_config(self.config)
+        http_cache = HttpCache.from_config(self.config)
+        content_store = ContentStore.from_config(self.config)
+        price_store = PriceStore.from_config(self.config, self.bq_client.now().date())
+        checkpoint = CrawlCheckpoint.from_config(self.config, self.bq_client.now().date())
+        # a given client is closed at the end of the run too
+        http_client = http_client if http_client is not None else HttpClient.from_config(self.config)
+        try:
+            with ParserPool.from_config(self.config) as parser_pool:
+                async with http_client:
+                    crawler_getter = CrawlerGetter(http_client, parser_pool=parser_pool, http_cache=http_cache,
+                                                   content_store=content_store, listeners=self.listeners)
+                    sink = sink_from_config(self.bq_client, self.config, price_store)
+                    sheet_writer = SheetPriceWriter.from_config(self.gsheet_client, self.config)
+                    completed = await self._crawl_prices(crawler_getter, scheduler, sink, sheet_writer, checkpoint)
+            if checkpoint is not None and completed and not sink.failed:
+                checkpoint.finish()
+        finally:
+            for store in (http_cache, content_store, price_store, checkpoint):
+                if store is not None:
+                    store.close()
+        scheduler.log_stats()
+        if sheet_writer is not None:
+            sheet_writer.log_stats()
+        for store in (http_cache, content_store, price_store, checkpoint):
+            if store is not None:
+                store.log_stats()
+        logging.info(f"products have been inserted to BQ, number of products {sink.inserted}, failed {sink.failed}")
+
+        try:
+            if merge and sink.inserted:
+                with run_metrics.timer("merge"):
+                    self.merge_product()
+        except Exception:
+            logging.exception("error during merging products")
+        run_metrics.log_summary()
+
+    # The crawl runs as a pipeline of three stages connected by bounded queues, so a slow page only holds one
+    # slot of the crawl window instead of a whole batch, and sheet reads, crawls and the sink overlap:
+    #   sheet reader --(row, link)--> per shop queues --> crawl window --product--> sink
+    #                                                                 --(row, product)--> sheet writer, when
+    #                                                                                     writing back prices
+    # A link takes a slot of the crawl window only once its shop may send the request, see LinkDispatcher.
+    # Returns whether every row of the sheet was read and crawled. With a checkpoint, the rows crawled by an
+    # interrupted run are taken from it and the crawled rows are journaled.
+    async def _crawl_prices(self, crawler_getter: CrawlerGetter, scheduler: DomainScheduler, sink: ProductSink,
+                            sheet_writer: SheetPriceWriter = None, checkpoint: CrawlCheckpoint = None) -> bool:
+        pipeline_config = self.config['PIPELINE'] if self.config.has_section('PIPELINE') else self.config['DEFAULT']
+        crawl_window = pipeline_config.getint('CRAWL_WINDOW', 100)
+        product_queue = asyncio.Queue(maxsize=pipeline_config.getint('PRODUCT_QUEUE_SIZE', 500))
+        result_queue = asyncio.Queue(maxsize=pipeline_config.getint('PRODUCT_QUEUE_SIZE', 500)) \
+            if sheet_writer is not None else None
+        # seconds the sheet reader and crawl window may run, the sink is still flushed afterwards, 0 = no deadline
+        run_deadline = pipeline_config.getfloat('RUN_DEADLINE', 0) or None
+
+        deduplicator = LinkDeduplicator()
+        window = asyncio.Semaphore(crawl_window)
+
+        async def crawl(row_index: int, link: str):
+            product = await self._crawl_link(row_index, link, crawler_getter, scheduler, window)
+            await self._put_results(deduplicator.resolve(link, product), product_queue, result_queue, checkpoint)
+
+        def concurrency_of(shop: str) -> int:
+            # links without a crawler fail right away, one worker is enough
+            return min(scheduler.get_limiter(shop).concurrency, crawl_window) if shop is not None else 1
+
+        dispatcher = LinkDispatcher(crawl, concurrency_of, pipeline_config.getint('LINK_QUEUE_SIZE', 500))
+
+        async def read_and_crawl() -> bool:
+            completed = await self._read_links(dispatcher, product_queue, result_queue, crawler_getter, deduplicator,
+                                               checkpoint)
+            await dispatcher.join()
+            return completed
+
+        start = time.time()
+        sink_stage = asyncio.create_task(sink.consume(product_queue))
+        writer_stage = asyncio.create_task(sheet_writer.consume(result_queue)) if sheet_writer is not None else None
+        consumers = [stage for stage in (sink_stage, writer_stage) if stage is not None]
+        crawl_stage = asyncio.create_task(read_and_crawl())
+        completed = False
+        try:
+            # a consumer that died no longer drains its queue, the crawlers would wait on it forever
+            done, _ = await asyncio.wait([crawl_stage, *consumers], timeout=run_deadline,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if crawl_stage in done:
+                completed = crawl_stage.result()
+            elif not done:
+                # the reader and crawlers are cancelled, the products collected so far go on to the sink
+                logging.warning(f"run deadline of {run_deadline}s reached, {deduplicator.pending_rows()} read rows "
+                                f"were not crawled")
+            else:
+                logging.error(f"the {'sink' if sink_stage in done else 'sheet writer'} stopped, crawling is "
+                              f"stopped with {deduplicator.pending_rows()} read rows not crawled")
+        finally:
+            crawl_stage.cancel()
+            await asyncio.wait([crawl_stage])
+            await dispatcher.cancel()
+            await self._end_stage(sink_stage, product_queue)
+            if writer_stage is not None:
+                await self._end_stage(writer_stage, result_queue)
+        # raises the error of a consumer that died
+        for stage in consumers:
+            stage.result()
+        logging.info(f"crawling took {time.time() - start}s")
+        logging.info(f"read {deduplicator.rows} links, {deduplicator.unique} unique, "
+                     f"duplicate ratio {deduplicator.duplicate_ratio():.1%}")
+        return completed
 
-        crawler_getter = CrawlerGetter()
-        start_index = 2
-        STEPS = 100
-        valid_products = []
+    @staticmethod
+    async def _end_stage(stage: asyncio.Task, queue: asyncio.Queue):
+        # ends the stream of a consumer stage and waits for it, unless it already stopped
+        if not stage.done():
+            end = asyncio.create_task(queue.put(None))
+            await asyncio.wait([end, stage], return_when=asyncio.FIRST_COMPLETED)
+            end.cancel()
+        await asyncio.wait([stage])
 
+    async def _read_links(self, dispatcher: LinkDispatcher, product_queue: asyncio.Queue, result_queue: asyncio.Queue,
+                          crawler_getter: CrawlerGetter, deduplicator: LinkDeduplicator,
+                          checkpoint: CrawlCheckpoint = None) -> bool:
+        # True when the whole sheet was read
+        batches = SheetLinkReader.from_config(self.gsheet_client, self.config).iter_batches()
+        completed = False
         try:
             while True:
-                link_range = LINK_RANGE_FORMART.format(start_index, start_index + STEPS)
-                result = self.gsheet_client.get(link_range)
-                if not result: # if all rows are empty, we will consider the reading sheet as ended
+                # each batch is one values.batchGet request, read off the event loop
+                with run_metrics.timer("sheet_read"):
+                    batch = await asyncio.to_thread(next, batches, None)
+                if batch is None:
                     break
-
-                tasks = []
-                for row in result:
-                    if len(row) == 0:
-                        # append empty task to make sure len(tasks) = len(result)
-                        tasks.append(asyncio.create_task(self.empty()))
+                for row_index, row in batch:
+                    if not row or not row[0]:
                         continue
-                    link = row[0]
-                    if not link:
-                        # skip empty
+                    canonical = crawler_getter.canonical_link(row[0])
+                    if self.shard is not None and not self.shard.owns(canonical):
                         continue
-
-                    try:
-                        crawler = crawler_getter.get_crawler(link)
-                        tasks.append(asyncio.create_task(crawler.get_price(link)))
-                    except Exception as e:
-                        logging.exception(f"error getting crawler for link {link}")
-
-                start = time.time()
-                products = await asyncio.gather(*tasks, return_exceptions=True)
-                end = time.time()
-                logging.info(f"parsing html took {end - start}s")
-                for product in products:
-                    if product is None:
-                        pass
-                    elif isinstance(product, Product):
-                        valid_products.append(product)
+                    restored = checkpoint.get(row_index, row[0]) if checkpoint is not None else None
+                    if deduplicator.add(canonical, row[0], row_index):
+                        if restored is not None:
+                            # crawled by the interrupted run, also fanned out to the rows of the same product
+                            await self._put_results(deduplicator.resolve(canonical, restored), product_queue,
+                                                    result_queue, checkpoint)
+                        else:
+                            await dispatcher.put(self._shop_of(crawler_getter, canonical), row_index, canonical)
                     else:
-                        logging.warning(f"product is not recognized {product}")
+                        # already crawled in this run, or being crawled and fanned out when done
+                        await self._put_results(deduplicator.ready(canonical), product_queue, result_queue,
+                                                checkpoint)
+            completed = True
+        except Exception:
+            logging.exception("error while reading links")
+        finally:
+            dispatcher.close()
+        return completed
 
-                start_index += STEPS
+    @staticmethod
+    def _shop_of(crawler_getter: CrawlerGetter, link: str) -> str:
+        # DomainScheduler key of the link, None when no crawler handles it
+        try:
+            return crawler_getter.get_crawler(link).domain
         except Exception:
-            logging.exception("error while crawling price")
+            return None
+
+    @staticmethod
+    async def _put_results(results: List[Tuple[int, Product]], product_queue: asyncio.Queue,
+                           result_queue: asyncio.Queue, checkpoint: CrawlCheckpoint = None):
+        for row_index, product in results:
+            if checkpoint is not None:
+                checkpoint.record(row_index, product)
+            await product_queue.put(product)
+            if result_queue is not None:
+                await result_queue.put((row_index, product))
 
+    async def _crawl_link(self, row_index: int, link: str, crawler_getter: CrawlerGetter,
+                          scheduler: DomainScheduler, window: asyncio.Semaphore = None) -> Product:
+        try:
+            crawler = crawler_getter.get_crawler(link)
+        except Exception as e:
+            logging.exception(f"error getting crawler for link {link}")
+            self._notify_failed(crawler_getter, link, f"no crawler: {e}")
+            return None
         try:
-            if valid_products:
-                self.bq_client.insert_product(dataset="pre_sync", table_name="competitor_price", products=valid_products)
-                self.merge_product()
+            product = await scheduler.run(crawler.domain, crawler.get_price, link, window=window)
+        except Exception as e:
+            logging.warning(f"error crawling row {row_index}, link {link} ({classify(e)}): {e}")
+            self._notify_failed(crawler_getter, link, f"{classify(e)}: {e}")
+            return None
+        if not isinstance(product, Product):
+            logging.warning(f"product is not recognized {product}")
+            self._notify_failed(crawler_getter, link, f"product is not recognized {product}")
+            return None
+        for listener in crawler_getter.listeners:
+            listener.onSuccess(link, product)
+        return product
 
-            logging.info(f"products have been inserted to BQ, number of products {len(valid_products)}")
-        except Exception:
-            logging.exception("error during inserting and merging products")
+    @staticmethod
+    def _notify_failed(crawler_getter: CrawlerGetter, link: str, err: str):
+        for listener in crawler_getter.listeners:
+            try:
+                listener.onFailed(link, err)
+            except Exception:
+                logging.exception(f"error reporting the failure of link {link}")
 
-    def merge_product(self):
+    def merge_product(self, dry_run: bool = None) -> int:
+        # MERGEs the rows inserted since the last successful merge, the watermark of each source table is kept in
+        # WATERMARK_PATH. A dry run only logs and returns the bytes the MERGE would process.
+        merge_config = self.config['MERGE'] if self.config.has_section('MERGE') else self.config['DEFAULT']
+        dry_run = merge_config.getboolean('DRY_RUN', False) if dry_run is None else dry_run
+        watermarks = MergeWatermarks(merge_config.get('WATERMARK_PATH', 'merge_watermarks.json'))
+        source_table = "`pre_sync.competitor_price`"
         id_columns = ["link", "_date"]
         columns_update = ["original_price", "sale_price"]
         columns_insert = ["link", "original_price", "sale_price", "_date"]
+        until = self.bq_client.now()
         sql = self._get_merge_query(dest_table="`staging.competitor_price`",
-                                    source_table="`pre_sync.competitor_price`", id_columns=id_columns,
-                                    columns_update=columns_update, columns_insert=columns_insert)
+                                    source_table=source_table, id_columns=id_columns,
+                                    columns_update=columns_update, columns_insert=columns_insert,
+                                    since=watermarks.get(source_table), until=until)
+        if dry_run:
+            job = self.bq_client.query(sql, dry_run=True)
+            logging.info(f"merge would process {job.total_bytes_processed} bytes")
+            return job.total_bytes_processed
         job = self.bq_client.query(sql)
         logging.info(f"job_id: {job.job_id}")
         try:
             ignored = job.result(timeout=5*60) # wait for 5 mins
-            logging.info("merging done")
+            logging.info(f"merging done, {job.total_bytes_processed} bytes processed")
+            watermarks.set(source_table, until)
         except concurrent.futures.TimeoutError:
+            # the next run merges the same rows again, which MERGE makes harmless
             logging.warning("getting merge result timed out after 5min")
+        return job.total_bytes_processed
+
+
+class MergeWatermarks:
+
+    # source table -> _created_at of the last row merged from it, in a json file kept across runs
+    def __init__(self, path: str):
+        self.path = path
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
 
-    async def empty(self):
-        return None
+    def get(self, table: str) -> datetime:
+        watermark = self._load().get(table)
+        return datetime.fromisoformat(watermark) if watermark else None
 
+    def set(self, table: str, watermark: datetime):
+        watermarks = self._load()
+        watermarks[table] = watermark.isoformat()
+        # written next to the file and renamed, a crash does not leave half a file
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(watermarks, f, indent=2, sort_keys=True)
+        os.replace(self.path + ".tmp", self.path)
@@ -0,0 +1,110 @@
+import time
+import unittest
+
+from google.cloud import bigquery
+
+from clients.bq_client import BQClient, chunk_products
+from pricing import Product, ProductBatch
+
+SCHEMA = [
+    bigquery.SchemaField("_date", "DATE", mode="REQUIRED"),
+    bigquery.SchemaField("_created_at", "TIMESTAMP", mode="REQUIRED"),
+    bigquery.SchemaField("link", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("sale_price", "INT64"),
+    bigquery.SchemaField("original_price", "INT64"),
+]
+
+
+class FakeBigQuery:
+
+    # stand-in for google.cloud.bigquery.Client
+    def __init__(self):
+        self.calls = []
+        self.rows = []
+
+    def get_table(self, table_ref):
+        self.calls.append(("get_table", table_ref.table_id))
+        return bigquery.Table(table_ref, schema=SCHEMA)
+
+    def insert_rows(self, table, rows):
+        self.calls.append(("insert_rows", len(rows)))
+        self.rows.extend(rows)
+        return []
+
+
+def make_products(n):
+    for i in range(n):
+        yield Product(original_price=i + 1, sale_price=i, link=f"https://tiki.vn/p{i}.html")
+
+
+class BQClientTest(unittest.TestCase):
+
+    def test_table_metadata_is_fetched_once_per_run(self):
+        fake = FakeBigQuery()
+        bq_client = BQClient("project", client=fake)
+        for _ in range(5):
+            self.assertEqual([], bq_client.insert_products("pre_sync", "competitor_price", make_products(10)))
+        self.assertEqual(1, bq_client.api_calls["get_table"])
+        self.assertEqual(5, bq_client.api_calls["insert_rows"])
+
+    def test_table_cache_expires(self):
+        fake = FakeBigQuery()
+        bq_client = BQClient("project", table_cache_ttl=0.01, client=fake)
+        bq_client.get_table("pre_sync", "competitor_price")
+        bq_client.get_table("pre_sync", "competitor_price")
+        time.sleep(0.02)
+        bq_client.get_table("pre_sync", "competitor_price")
+        bq_client.get_table("staging", "competitor_price")
+        self.assertEqual(3, bq_client.api_calls["get_table"])
+
+    def test_insert_products_streams_chunks(self):
+        fake = FakeBigQuery()
+        bq_client = BQClient("project", client=fake)
+        bq_client.insert_products("pre_sync", "competitor_price", make_products(1234), chunk_rows=500)
+        self.assertEqual([500, 500, 234], [n for call, n in fake.calls if call == "insert_rows"])
+
+    def test_failed_chunks_are_returned(self):
+        fake = FakeBigQuery()
+        fake.insert_rows = lambda table, rows: [{"index": 0, "errors": ["invalid"]}] if len(rows) == 2 else []
+        bq_client = BQClient("project", client=fake)
+        failed = bq_client.insert_products("pre_sync", "competitor_price", make_products(6), chunk_rows=4)
+        self.assertEqual(1, len(failed))
+        self.assertEqual(["https://tiki.vn/p4.html", "https://tiki.vn/p5.html"], [p.link for p in failed[0][0]])
+
+    def test_rows_follow_the_table_columns(self):
+        fake = FakeBigQuery()
+        bq_client = BQClient("project", client=fake)
+        bq_client.insert_products("pre_sync", "competitor_price", ProductBatch(make_products(2)))
+        _date, created_at, link, sale_price, original_price = fake.rows[1]
+        self.assertEqual(created_at.date(), _date)
+        self.assertEqual(("https://tiki.vn/p1.html", 1, 2), (link, sale_price, original_price))
+
+
+class ProductBatchTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        products = list(make_products(5)) + [Product(None, 100, name="no list price", link="https://tiki.vn/p.html")]
+        batch = ProductBatch(products)
+        self.assertEqual(products, list(batch))
+        self.assertEqual(products[2], batch[2])
+        self.assertEqual(products[4:], list(batch[4:]))
+        self.assertEqual(0, batch[:5].nulls)
+        self.assertEqual([(None, "https://tiki.vn/p.html")], batch[5:].rows(["original_price", "link"], {}))
+
+    def test_links_are_interned(self):
+        product = Product(200, 100, link="".join(["https://tiki.vn/", "p1.html"]))
+        batch = ProductBatch([product, product._replace(link="".join(["https://tiki.vn/", "p1.html"]))])
+        self.assertIs(batch.links[0], batch.links[1])
+
+    def test_chunks_of_a_batch(self):
+        batch = ProductBatch(make_products(1234))
+        chunks = list(chunk_products(batch, chunk_rows=500))
+        self.assertEqual([500, 500, 234], [len(chunk) for chunk in chunks])
+        self.assertEqual(list(batch), [product for chunk in chunks for product in chunk])
+        # the byte limit cuts a batch where it cuts a stream of products
+        self.assertEqual([len(chunk) for chunk in chunk_products(iter(list(batch)), chunk_bytes=10000)],
+                         [len(chunk) for chunk in chunk_products(batch, chunk_bytes=10000)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from clients.content_store import ContentStore
+from pricing import CrawlerGetter, HtmlProductCrawler, Product
+from tests.fixtures import PAGES, load_page
+from tests.http_stub import StubServer
+
+
+class ContentStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".sqlite")
+        os.close(fd)
+        self.crawler_getter = CrawlerGetter()
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_price_regions_are_digested(self):
+        for domain, (link, sale_price, original_price) in PAGES.items():
+            crawler = self.crawler_getter.get_crawler(link)
+            if not isinstance(crawler, HtmlProductCrawler):
+                continue
+            with self.subTest(domain=domain):
+                page = load_page(domain)
+                regions = b"".join(crawler.price_extractor.region_slices(page, crawler.CONTENT_WINDOW))
+                for price in (sale_price, original_price):
+                    formats = [f"{price:,}".replace(",", ".").encode(), f"{price:,}".encode(), str(price).encode()]
+                    self.assertTrue(any(f in regions for f in formats if f in page))
+
+    def test_digest_ignores_changes_outside_price_regions(self):
+        crawler = self.crawler_getter.get_crawler(PAGES["antien.vn"][0])
+        page = load_page("antien.vn")
+        with_token = page.replace(b"<head>", b"<head><meta name=\"csrf-token\" content=\"8f2a1c\">")
+        self.assertNotEqual(page, with_token)
+        self.assertEqual(crawler.content_digest(page), crawler.content_digest(with_token))
+        self.assertNotEqual(crawler.content_digest(page),
+                            crawler.content_digest(page.replace(b"2.190.000", b"2.090.000")))
+
+    def test_digest_covers_attributes_before_the_marker(self):
+        crawler = self.crawler_getter.get_crawler(PAGES["hnammobile.com"][0])
+        page = load_page("hnammobile.com").replace(
+            b'<input type="hidden" name="price" class="product-item-value-price" value="4049000">',
+            b'<input value="4049000" type="hidden" name="price" class="product-item-value-price">')
+        self.assertNotEqual(crawler.content_digest(page),
+                            crawler.content_digest(page.replace(b'<input value="4049000"', b'<input value="3990000"')))
+
+    def test_unchanged_page_is_not_parsed(self):
+        pages = {"/p": load_page("antien.vn")}
+        with StubServer({"/p": lambda handler: (200, {}, pages["/p"])}) as server, \
+                ContentStore(self.path) as content_store:
+            async def crawl():
+                crawler_getter = CrawlerGetter(content_store=content_store)
+                crawler = crawler_getter.get_crawler(PAGES["antien.vn"][0])
+                parse_product = crawler.parse_product
+                parsed = []
+                crawler.parse_product = lambda text, link: parsed.append(link) or parse_product(text, link)
+                product = await crawler.get_price(server.url("/p"))
+                await crawler_getter.http_client.close()
+                return product, parsed
+
+            _, parsed = asyncio.run(crawl())
+            self.assertEqual(1, len(parsed))
+            product, parsed = asyncio.run(crawl())
+            self.assertEqual([], parsed)
+            self.assertEqual((2190000, server.url("/p")), (product.sale_price, product.link))
+
+            pages["/p"] = load_page("antien.vn").replace(b"2.190.000", b"2.090.000")
+            product, parsed = asyncio.run(crawl())
+            self.assertEqual(1, len(parsed))
+            self.assertEqual(2090000, product.sale_price)
+            self.assertEqual({"requests": 3, "hits": 1, "hit_rate": 1 / 3}, content_store.stats()["antien.vn"])
+
+    def test_old_products_are_parsed_again(self):
+        with ContentStore(self.path, max_age=3600, commit_every=1) as content_store:
+            content_store.put("/p0", b"d", Product(100, 90))
+            self.assertIsNotNone(content_store.get("shop.vn", "/p0", b"d", "/p0"))
+            content_store.connection.execute("UPDATE content_store SET stored_at = stored_at - 7200")
+
+            self.assertIsNone(content_store.get("shop.vn", "/p0", b"d", "/p0"))
+
+    def test_store_of_a_previous_version_is_upgraded(self):
+        connection = sqlite3.connect(self.path)
+        connection.execute("CREATE TABLE content_store (url TEXT PRIMARY KEY, digest BLOB, name TEXT, "
+                           "sale_price INTEGER, original_price INTEGER, used_at INTEGER)")
+        connection.execute("INSERT INTO content_store VALUES ('/p0', X'64', NULL, 90, 100, 1)")
+        connection.commit()
+        connection.close()
+
+        with ContentStore(self.path) as content_store:
+            self.assertIsNone(content_store.get("shop.vn", "/p0", b"d", "/p0"))
+            content_store.put("/p0", b"d", Product(100, 90))
+            self.assertIsNotNone(content_store.get("shop.vn", "/p0", b"d", "/p0"))
+
+    def test_least_recently_used_urls_are_evicted(self):
+        with ContentStore(self.path, max_entries=3, commit_every=1) as content_store:
+            for i in range(3):
+                content_store.put(f"/p{i}", b"d", Product(100, 90))
+            self.assertIsNotNone(content_store.get("shop.vn", "/p0", b"d", "/p0"))
+            content_store.put("/p3", b"d", Product(100, 90))
+
+            self.assertEqual(3, len(content_store))
+            self.assertIsNone(content_store.get("shop.vn", "/p1", b"d", "/p1"))
+            self.assertIsNotNone(content_store.get("shop.vn", "/p0", b"d", "/p0"))
+            # replacing a stored url does not grow the store
+            content_store.put("/p0", b"e", Product(100, 80))
+            self.assertEqual(3, len(content_store))
+        with ContentStore(self.path, max_entries=3) as content_store:
+            self.assertEqual(3, len(content_store))
+            self.assertEqual(80, content_store.get("shop.vn", "/p0", b"e", "/p0").sale_price)
+
+
+if __name__ == '__main__':
+    unittest.main()
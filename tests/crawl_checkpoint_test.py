@@ -0,0 +1,82 @@
+import asyncio
+import configparser
+import os
+import tempfile
+import unittest
+from datetime import date
+
+from clients.crawl_checkpoint import CrawlCheckpoint
+from clients.gsheet_client import GSheetClient
+from pricing import Product
+from services.domain_scheduler import DomainScheduler
+from services.product_sink import BQProductSink
+from services.streaming_service import StreamingService
+from tests.fakes import FakeBQClient, FakeCrawler, FakeCrawlerGetter, FakeSheetsService
+
+TODAY = date(2020, 11, 20)
+
+
+class CrawlCheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "checkpoint.sqlite")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_writes_are_batched(self):
+        with CrawlCheckpoint(self.path, TODAY, commit_rows=100, commit_interval=60) as checkpoint:
+            for i in range(250):
+                checkpoint.record(i + 2, Product(200, 100 + i, link=f"https://shop.vn/p{i}"))
+            self.assertEqual(2, checkpoint.commits)
+        with CrawlCheckpoint(self.path, TODAY) as checkpoint:
+            self.assertEqual(250, len(checkpoint.restored))
+            self.assertEqual(Product(200, 105, link="https://shop.vn/p5"), checkpoint.get(7, "https://shop.vn/p5"))
+            # the row now holds another link
+            self.assertIsNone(checkpoint.get(8, "https://shop.vn/other"))
+            checkpoint.finish()
+        with CrawlCheckpoint(self.path, TODAY) as checkpoint:
+            self.assertEqual({}, checkpoint.restored)
+
+    def test_journal_of_another_day_is_discarded(self):
+        with CrawlCheckpoint(self.path, TODAY) as checkpoint:
+            checkpoint.record(2, Product(200, 100, link="https://shop.vn/p1"))
+        with CrawlCheckpoint(self.path, date(2020, 11, 21)) as checkpoint:
+            self.assertEqual({}, checkpoint.restored)
+            self.assertEqual(0, len(checkpoint))
+
+    def test_interrupted_run_is_resumed(self):
+        links = ["link"] + [f"https://shop.vn/p{i % 150}" for i in range(200)]
+        gsheet_client = GSheetClient("spreadsheet", None,
+                                     service=FakeSheetsService({"Sheet1": [["", "", "", link] for link in links]}))
+
+        def crawl(crawler, run_deadline):
+            bq_client = FakeBQClient()
+            s = StreamingService(bq_client, gsheet_client)
+            s.config = configparser.ConfigParser()
+            s.config.read_dict({"DEFAULT": {"LINK_RANGE_FORMART": "Sheet1!D{}:D{}"},
+                                "PIPELINE": {"RUN_DEADLINE": str(run_deadline), "CRAWL_WINDOW": "10"}})
+            scheduler = DomainScheduler(default_concurrency=10, default_rate=0)
+            with CrawlCheckpoint(self.path, TODAY, commit_rows=20) as checkpoint:
+                completed = asyncio.run(s._crawl_prices(FakeCrawlerGetter(crawler), scheduler,
+                                                        BQProductSink(bq_client), checkpoint=checkpoint))
+            return completed, bq_client.rows
+
+        # the first run is cut off while the products past p99 are being crawled
+        slow_links = {f"https://shop.vn/p{i}" for i in range(100, 150)}
+        with self.assertLogs(level="WARNING"):
+            completed, rows = crawl(FakeCrawler("shop.vn", slow_links=slow_links, slow_latency=5), run_deadline=0.5)
+        self.assertFalse(completed)
+        self.assertEqual(150, len(rows))
+
+        crawler = FakeCrawler("shop.vn")
+        completed, rows = crawl(crawler, run_deadline=0)
+        self.assertTrue(completed)
+        self.assertEqual(sorted(slow_links), sorted(crawler.links))
+        # the rows of the first run are written again, the price store and the MERGE drop them
+        self.assertEqual(sorted(links[1:]), sorted(row["link"] for row in rows))
+
+
+if __name__ == '__main__':
+    unittest.main()
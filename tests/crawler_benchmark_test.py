@@ -0,0 +1,22 @@
+import unittest
+
+from benchmarks.crawler_benchmark import compare
+
+
+class CompareTest(unittest.TestCase):
+
+    def test_regressions_beyond_threshold(self):
+        baseline = {"environment": {"cpus": 8},
+                    "shops": {"tiki.vn": {"pages_per_s": 100.0, "parse_p95_ms": 10.0, "peak_kb": 40.0}},
+                    "end_to_end": {"rows": 1000, "seconds": 10.0, "rows_per_s": 100.0}}
+        results = {"environment": {"cpus": 1},
+                   "shops": {"tiki.vn": {"pages_per_s": 70.0, "parse_p95_ms": 11.0, "peak_kb": 60.0}},
+                   "end_to_end": {"rows": 2000, "seconds": 9.0, "rows_per_s": 222.0}}
+        self.assertEqual(["shops/tiki.vn/pages_per_s: 100.00 -> 70.00 (30% worse)",
+                          "shops/tiki.vn/peak_kb: 40.00 -> 60.00 (50% worse)"],
+                         compare(baseline, results, threshold=0.2))
+        self.assertEqual([], compare(baseline, baseline, threshold=0.2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+
+from pricing import (CrawlerGetter, HaloshopProductCrawler, M24hProductCrawler, TikiProductCrawler,
+                     ViettabletProductCrawler)
+
+
+class CrawlerGetterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.crawler_getter = CrawlerGetter()
+
+    def test_routes_by_host(self):
+        self.assertIsInstance(self.crawler_getter.get_crawler("https://tiki.vn/dien-thoai-p123.html"), TikiProductCrawler)
+        self.assertIsInstance(self.crawler_getter.get_crawler("https://www.viettablet.com/apple-watch-1"),
+                              ViettabletProductCrawler)
+        self.assertIsInstance(self.crawler_getter.get_crawler("https://watch.haloshop.vn/apple-watch-s6"),
+                              HaloshopProductCrawler)
+        self.assertIsInstance(self.crawler_getter.get_crawler(" HTTPS://24hstore.vn:443/iphone-14-p6625 "),
+                              M24hProductCrawler)
+
+    def test_query_string_does_not_misroute(self):
+        crawler = self.crawler_getter.get_crawler("https://24hstore.vn/iphone-14-p6625?ref=tiki.vn")
+        self.assertIsInstance(crawler, M24hProductCrawler)
+        self.assertEqual("24hstore.vn", crawler.domain)
+
+    def test_every_registered_domain_is_routed(self):
+        for domain, crawler_cls in CrawlerGetter.CRAWLERS.items():
+            self.assertIsInstance(self.crawler_getter.get_crawler(f"https://{domain}/product"), crawler_cls)
+
+    def test_unknown_host(self):
+        with self.assertRaises(Exception):
+            self.crawler_getter.get_crawler("https://shopee.vn/product?site=tiki.vn")
+        with self.assertRaises(Exception):
+            self.crawler_getter.get_crawler("https://nottiki.vn/product")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+
+from bs4 import BeautifulSoup
+
+from pricing import CrawlerGetter, HtmlProductCrawler
+from price_extractor import PriceExtractor, element_xpath
+from tests.fixtures import PAGES, load_page, pad_page
+
+
+class CrawlerParseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.crawler_getter = CrawlerGetter()
+
+    def test_every_crawler_has_a_saved_page(self):
+        self.assertEqual(set(CrawlerGetter.CRAWLERS), set(PAGES))
+
+    def test_parse_saved_pages(self):
+        for domain, (link, sale_price, original_price) in PAGES.items():
+            with self.subTest(domain=domain):
+                crawler = self.crawler_getter.get_crawler(link)
+                product = crawler.parse_product(pad_page(load_page(domain), 64 * 1024).decode("utf-8"), link)
+                self.assertEqual(sale_price, product.sale_price)
+                self.assertEqual(original_price, product.original_price)
+                self.assertEqual(link, product.link)
+
+    def test_partial_parse_matches_full_tree(self):
+        for domain, (link, _, _) in PAGES.items():
+            crawler = self.crawler_getter.get_crawler(link)
+            if not isinstance(crawler, HtmlProductCrawler) or type(crawler).parse_product is not HtmlProductCrawler.parse_product:
+                continue
+            with self.subTest(domain=domain):
+                text = pad_page(load_page(domain), 64 * 1024).decode("utf-8")
+                full = crawler.extract_product(BeautifulSoup(text, 'lxml'), link)
+                partial = crawler.parse_product(text, link)
+                self.assertEqual((full.sale_price, full.original_price), (partial.sale_price, partial.original_price))
+
+
+class PriceExtractorTest(unittest.TestCase):
+
+    def test_element_xpath(self):
+        self.assertEqual("//span[contains(concat(' ', normalize-space(@class), ' '), ' price ')]",
+                         element_xpath("span", {"class": "price"}))
+        self.assertEqual("//span[@itemprop='price']", element_xpath("span", {"itemprop": "price"}))
+
+    def test_nested_regions_are_kept_once(self):
+        extractor = PriceExtractor([("div", {"class": "box"}), ("span", {"class": "price"})])
+        soup = extractor.parse('<div class="box"><span class="price">1</span></div><span class="price">2</span>')
+        self.assertEqual(["1", "2"], [tag.text for tag in soup.find_all("span", {"class": "price"})])
+
+    def test_class_is_matched_by_token(self):
+        extractor = PriceExtractor([("div", {"class": "product-price"})])
+        soup = extractor.parse('<div class="product-price-new">1</div><div class="a product-price">2</div>')
+        self.assertEqual("2", soup.find("div", {"class": "product-price"}).text)
+
+    def test_empty_and_declared_documents(self):
+        extractor = PriceExtractor([("span", {"class": "price"})])
+        self.assertIsNone(extractor.parse("").find("span"))
+        soup = extractor.parse('<?xml version="1.0" encoding="utf-8"?><html><body><span class="price">5</span></body></html>')
+        self.assertEqual("5", soup.find("span").text)
+
+
+if __name__ == '__main__':
+    unittest.main()
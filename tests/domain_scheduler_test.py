@@ -0,0 +1,106 @@
+import asyncio
+import time
+import unittest
+
+from services.domain_scheduler import DomainScheduler
+
+
+class DomainSchedulerTest(unittest.TestCase):
+
+    def test_concurrency_cap_per_domain(self):
+        scheduler = DomainScheduler(default_concurrency=2, default_rate=0,
+                                    limits={"tiki.vn": {"concurrency": 3, "rate": 0}})
+        in_flight = {"tiki.vn": 0, "xtmobile.vn": 0}
+        peak = {"tiki.vn": 0, "xtmobile.vn": 0}
+
+        async def fetch(domain):
+            in_flight[domain] += 1
+            peak[domain] = max(peak[domain], in_flight[domain])
+            await asyncio.sleep(0.01)
+            in_flight[domain] -= 1
+            return domain
+
+        async def run():
+            tasks = [scheduler.run(d, fetch, d) for d in ["tiki.vn"] * 20 + ["xtmobile.vn"] * 5]
+            return await asyncio.gather(*tasks)
+
+        results = asyncio.run(run())
+        self.assertEqual(25, len(results))
+        self.assertEqual(3, peak["tiki.vn"])
+        self.assertEqual(2, peak["xtmobile.vn"])
+        stats = scheduler.stats()
+        self.assertEqual(20, stats["tiki.vn"]["completed"])
+        self.assertEqual(0, stats["tiki.vn"]["queued"])
+
+    def test_rate_limit(self):
+        scheduler = DomainScheduler(default_concurrency=10, default_rate=20, default_burst=1)
+
+        async def fetch():
+            return None
+
+        async def run():
+            await asyncio.gather(*[scheduler.run("tiki.vn", fetch) for _ in range(11)])
+
+        start = time.monotonic()
+        asyncio.run(run())
+        elapsed = time.monotonic() - start
+        # first token is free, the next 10 take 1/20s each
+        self.assertGreaterEqual(elapsed, 0.45)
+        self.assertLessEqual(scheduler.stats()["tiki.vn"]["requests_per_second"], 25)
+
+    def test_small_domain_not_blocked_by_big_backlog(self):
+        scheduler = DomainScheduler(default_concurrency=1, default_rate=0)
+        finished_at = {}
+
+        async def fetch(domain, i):
+            await asyncio.sleep(0.02)
+            finished_at[(domain, i)] = time.monotonic()
+
+        async def run():
+            tasks = [asyncio.create_task(scheduler.run("tiki.vn", fetch, "tiki.vn", i)) for i in range(20)]
+            tasks.append(asyncio.create_task(scheduler.run("xtmobile.vn", fetch, "xtmobile.vn", 0)))
+            await asyncio.sleep(0.01)
+            depth = scheduler.queue_depth("tiki.vn")
+            await asyncio.gather(*tasks)
+            return depth
+
+        start = time.monotonic()
+        depth = asyncio.run(run())
+        self.assertEqual(19, depth)
+        self.assertLess(finished_at[("xtmobile.vn", 0)] - start, 0.1)
+
+    def test_window_is_shared_by_shops(self):
+        scheduler = DomainScheduler(default_concurrency=3, default_rate=0)
+        window = asyncio.Semaphore(4)
+        in_flight = []
+        peak = []
+
+        async def fetch():
+            in_flight.append(1)
+            peak.append(len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.pop()
+
+        async def run():
+            await asyncio.gather(*[scheduler.run(d, fetch, window=window) for d in ["tiki.vn", "xtmobile.vn"] * 6])
+
+        asyncio.run(run())
+        self.assertEqual(4, max(peak))
+        self.assertEqual(6, scheduler.stats()["tiki.vn"]["completed"])
+
+    def test_failures_are_counted(self):
+        scheduler = DomainScheduler(default_rate=0)
+
+        async def fail():
+            raise ValueError("boom")
+
+        async def run():
+            return await asyncio.gather(scheduler.run("antien.vn", fail), return_exceptions=True)
+
+        results = asyncio.run(run())
+        self.assertIsInstance(results[0], ValueError)
+        self.assertEqual(1, scheduler.stats()["antien.vn"]["failed"])
+
+
+if __name__ == '__main__':
+    unittest.main()
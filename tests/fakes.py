@@ -0,0 +1,194 @@
+import asyncio
+import gzip
+import json
+import re
+import time
+from datetime import datetime
+
+from clients.bq_client import BQClient, chunk_products
+from links import canonicalize
+from pricing import Product, ProductCrawler, get_host
+
+
+def column_index(letters: str) -> int:
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord("A") + 1
+    return index - 1
+
+
+class FakeSheetsService:
+
+    # In-memory stand-in for the Sheets v4 service used by GSheetClient(service=...). `sheets` maps a sheet title
+    # to its rows, row 1 first, each row a list of cells from column A. Every executed request is recorded.
+    RANGE_PATTERN = re.compile(r"^(?:(.+)!)?([A-Z]+)(\d+)(?::([A-Z]+)(\d+))?$")
+
+    def __init__(self, sheets: dict, row_count: int = None):
+        self.sheets = sheets
+        self.row_count = row_count
+        self.requests = []
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def _parse(self, range_name):
+        title, first_col, first_row, last_col, last_row = self.RANGE_PATTERN.match(range_name).groups()
+        title = title or next(iter(self.sheets))
+        last_col, last_row = last_col or first_col, last_row or first_row
+        return title, column_index(first_col), int(first_row), column_index(last_col), int(last_row)
+
+    def _read(self, range_name):
+        title, first_col, first_row, last_col, last_row = self._parse(range_name)
+        rows = self.sheets.get(title, [])
+        values = []
+        for row in rows[first_row - 1:last_row]:
+            cells = list(row[first_col:last_col + 1])
+            while cells and cells[-1] in ("", None):
+                cells.pop()
+            values.append(cells)
+        while values and not values[-1]:
+            values.pop()
+        return {"range": range_name, "values": values} if values else {"range": range_name}
+
+    def _write(self, range_name, values):
+        title, first_col, first_row, _, _ = self._parse(range_name)
+        rows = self.sheets.setdefault(title, [])
+        for i, value_row in enumerate(values):
+            row_index = first_row - 1 + i
+            while len(rows) <= row_index:
+                rows.append([])
+            row = rows[row_index]
+            while len(row) < first_col + len(value_row):
+                row.append("")
+            row[first_col:first_col + len(value_row)] = value_row
+
+    def get(self, spreadsheetId, range=None, ranges=None, fields=None):
+        if range is not None:
+            return FakeRequest(self, ("values.get", range), lambda: self._read(range))
+        grid_rows = self.row_count or max((len(rows) for rows in self.sheets.values()), default=0)
+        result = {"sheets": [{"properties": {"title": title, "gridProperties": {"rowCount": grid_rows}}}
+                             for title in self.sheets]}
+        return FakeRequest(self, ("get", tuple(ranges or ())), lambda: result)
+
+    def batchGet(self, spreadsheetId, ranges):
+        return FakeRequest(self, ("values.batchGet", tuple(ranges)),
+                           lambda: {"valueRanges": [self._read(r) for r in ranges]})
+
+    def update(self, spreadsheetId, range, valueInputOption, body):
+        return FakeRequest(self, ("values.update", range), lambda: self._write(range, body["values"]))
+
+    def batchUpdate(self, spreadsheetId, body):
+        def execute():
+            for value_range in body["data"]:
+                self._write(value_range["range"], value_range["values"])
+            return {"totalUpdatedRows": sum(len(d["values"]) for d in body["data"])}
+        return FakeRequest(self, ("values.batchUpdate", tuple(d["range"] for d in body["data"])), execute)
+
+
+class FakeRequest:
+
+    def __init__(self, service, request, execute):
+        self.service = service
+        self.request = request
+        self._execute = execute
+
+    def execute(self):
+        self.service.requests.append(self.request)
+        return self._execute()
+
+
+class FakeCrawler:
+
+    def __init__(self, domain, latency=0.0, slow_links=(), slow_latency=0.0):
+        self.domain = domain
+        self.latency = latency
+        self.slow_links = set(slow_links)
+        self.slow_latency = slow_latency
+        self.links = []
+        self.finished_at = []
+
+    async def get_price(self, link):
+        self.links.append(link)
+        await asyncio.sleep(self.slow_latency if link in self.slow_links else self.latency)
+        self.finished_at.append(time.monotonic())
+        return Product(original_price=200, sale_price=100, link=link)
+
+
+class PlainPriceCrawler(ProductCrawler):
+
+    # real fetching through HttpClient, the page body is the price
+    def parse_product(self, text: str, link: str) -> Product:
+        return Product(original_price=int(text), sale_price=int(text), link=link)
+
+
+class FakeCrawlerGetter:
+
+    # `crawler` is the crawler of every link, or a dict host -> crawler
+    def __init__(self, crawler, listeners=None):
+        self.crawler = crawler
+        self.listeners = list(listeners or ())
+
+    def get_crawler(self, link):
+        if "unknown" in link:
+            raise Exception("not found suitable crawler for link {}".format(link))
+        if isinstance(self.crawler, dict):
+            return self.crawler[get_host(link)]
+        return self.crawler
+
+    def canonical_link(self, link):
+        return canonicalize(link)
+
+
+class FakeBQClient:
+
+    # In-memory stand-in for BQClient. The first `failures` insert requests fail.
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.rows = []
+        self.insert_requests = []
+        self.load_requests = []
+        self.queries = []
+
+    def insert_products(self, dataset, table_name, products, chunk_rows=500, chunk_bytes=5 * 1024 * 1024):
+        failed = []
+        for chunk in chunk_products(products, chunk_rows, chunk_bytes):
+            self.insert_requests.append(len(chunk))
+            if self.failures > 0:
+                self.failures -= 1
+                failed.append((chunk, [{"index": 0, "errors": ["backendError"]}]))
+                continue
+            for p in chunk:
+                self.rows.append({"link": p.link, "original_price": p.original_price, "sale_price": p.sale_price})
+        return failed
+
+    to_row = staticmethod(BQClient.to_row)
+
+    def now(self):
+        return datetime.now()
+
+    def load_file(self, dataset, table_name, path, partition=None):
+        self.load_requests.append((dataset, table_name, partition))
+        if self.failures > 0:
+            self.failures -= 1
+            raise Exception("backendError")
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f]
+        self.rows.extend({"link": r["link"], "original_price": r["original_price"], "sale_price": r["sale_price"]}
+                         for r in rows)
+        return len(rows)
+
+    def query(self, sql, dry_run=False):
+        self.queries.append(sql)
+        return FakeQueryJob()
+
+
+class FakeQueryJob:
+
+    job_id = "fake-job"
+    total_bytes_processed = 1024
+
+    def result(self, timeout=None):
+        return []
@@ -0,0 +1,62 @@
+import os
+
+FIXTURES_DIR = os.path.dirname(__file__)
+PAGES_DIR = os.path.join(FIXTURES_DIR, "pages")
+
+# shop domain -> (product link, expected sale_price, expected original_price) for the saved page in pages/
+PAGES = {
+    "tiki.vn": ("https://tiki.vn/apple-iphone-12-p123.html", 18990000, 22990000),
+    "dienthoaigiakho.vn": ("https://dienthoaigiakho.vn/iphone-11-64gb", 10490000, 11990000),
+    "24hstore.vn": ("https://24hstore.vn/iphone-14-pro-moi/iphone-14-pro-512gb-p6625", 37990000, 33990000),
+    "baochauelec.com": ("https://baochauelec.com/loa-bluetooth-jbl-charge-4", 3290000, 4490000),
+    "antien.vn": ("https://antien.vn/loa-mini/loa-jbl-flip-5.html", 2190000, 1700000),
+    "hoanghamobile.com": ("https://hoanghamobile.com/apple-iphone-12-128gb-chinh-hang-vna-p19301.html", 3350000, 3990000),
+    "cellphones.com.vn": ("https://cellphones.com.vn/loa-bluetooth-jbl-go-2.html", 699000, 699000),
+    "dientulinhanh.com": ("https://dientulinhanh.com/jbl-pulse-4", 1050000, 1050000),
+    "viettablet.com": ("https://www.viettablet.com/iphone-11-pro-64gb-chua-active-tbh", 23590000, 23590000),
+    "ctmobile.vn": ("https://ctmobile.vn/iphone-se2-128gb-new", 23600000, 23600000),
+    "haloshop.vn": ("https://haloshop.vn/iphone-12-pro/iphone-12-pro-gold-128gb", 23300000, 24900000),
+    "bachlongmobile.com": ("https://bachlongmobile.com/iphone-7-plus-32gb-moi-99.html", 6290000, 6990000),
+    "didongviet.vn": ("https://didongviet.vn/ipad-air-2020-256gb", 8990000, 10790000),
+    "minhtuanmobile.com": ("https://minhtuanmobile.com/iphone-11-2019-64gb-vn-a/", 4990000, 5990000),
+    "duchuymobile.com": ("https://www.duchuymobile.com/samsung-galaxy-note-10", 1899000, 1899000),
+    "hnammobile.com": ("https://www.hnammobile.com/dien-thoai/samsung-galaxy-s20-fe-g780.20730.html", 4049000, 4490000),
+    "xtmobile.vn": ("https://www.xtmobile.vn/loa-bluetooth-jbl-clip-3", 5290000, 6490000),
+    "sangmobile.com": ("https://www.sangmobile.com/products/iphone-11-pro-max-64gb-99", 17390000, 18390000),
+    "phuckhangmobile.com": ("https://phuckhangmobile.com/airpods-pro-likenew-99-4937.html", 28250000, 31990000),
+}
+
+
+def page_path(domain: str) -> str:
+    for extension in (".html", ".json"):
+        path = os.path.join(PAGES_DIR, domain + extension)
+        if os.path.exists(path):
+            return path
+    raise FileNotFoundError(f"no saved page for {domain}")
+
+
+def load_page(domain: str) -> bytes:
+    with open(page_path(domain), "rb") as f:
+        return f.read()
+
+
+def pad_page(page: bytes, size: int = 500 * 1024) -> bytes:
+    # Surround the price markup of a saved page with product-listing-like markup until it reaches `size`,
+    # real product pages are 300-800KB of menus, related products and scripts around one or two price spans.
+    if not page.lstrip().startswith(b"<"):
+        return page
+    items = []
+    length = 0
+    i = 0
+    while length < size:
+        item = (f'<div class="product-item" data-id="{i}"><a href="/san-pham-{i}.html" title="Sản phẩm {i}">'
+                f'<img src="/img/{i}.jpg" alt="Sản phẩm {i}"><h3>Sản phẩm {i}</h3></a>'
+                f'<div class="item-price"><span class="item-sale">{i * 1000:,}₫</span></div>'
+                f'<ul class="specs"><li>RAM 8GB</li><li>ROM 128GB</li><li>Màu đen</li></ul></div>\n').encode("utf-8")
+        items.append(item)
+        length += len(item)
+        i += 1
+    half = len(items) // 2
+    before = b'<div class="related">' + b"".join(items[:half]) + b"</div>\n"
+    after = b'<div class="related">' + b"".join(items[half:]) + b"</div>\n"
+    return page.replace(b"<body>\n", b"<body>\n" + before, 1).replace(b"</body>", after + b"</body>", 1)
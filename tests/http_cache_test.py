@@ -0,0 +1,112 @@
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+
+from clients.http_cache import HttpCache
+from pricing import CrawlerGetter
+from tests.fixtures import PAGES, load_page
+from tests.http_stub import StubServer
+
+
+def validating_route(body: bytes, etag: str = None, last_modified: str = None):
+    # answers 304 when the request carries the current validators
+    def route(handler):
+        headers = {}
+        if etag:
+            headers["ETag"] = etag
+        if last_modified:
+            headers["Last-Modified"] = last_modified
+        if (etag and handler.headers.get("If-None-Match") == etag) or \
+                (not etag and last_modified and handler.headers.get("If-Modified-Since") == last_modified):
+            return 304, headers, b""
+        return 200, headers, body
+    return route
+
+
+class HttpCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".sqlite")
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def _crawl(self, links, http_cache):
+        async def run():
+            crawler_getter = CrawlerGetter(http_cache=http_cache)
+            products = [await crawler_getter.get_crawler(PAGES["antien.vn"][0]).get_price(link) for link in links]
+            await crawler_getter.http_client.close()
+            return products
+        return asyncio.run(run())
+
+    def test_not_modified_is_served_from_cache(self):
+        link, sale_price, original_price = PAGES["antien.vn"]
+        page = load_page("antien.vn")
+        routes = {
+            "/etag": validating_route(page, etag='"v1"'),
+            "/last-modified": validating_route(page, last_modified="Wed, 01 Jul 2020 10:00:00 GMT"),
+            "/no-validators": validating_route(page),
+        }
+        with StubServer(routes) as server:
+            links = [server.url(path) for path in routes]
+            # first run fills the cache, the second one is answered with 304s
+            for _ in range(2):
+                with HttpCache(self.path) as http_cache:
+                    products = self._crawl(links, http_cache)
+                    self.assertEqual([(sale_price, original_price)] * 3,
+                                     [(p.sale_price, p.original_price) for p in products])
+                    self.assertEqual(links, [p.link for p in products])
+            stats = http_cache.stats()["antien.vn"]
+            validators = [headers.get("If-None-Match") or headers.get("If-Modified-Since")
+                        for _, headers in server.requests[3:]]
+
+        self.assertEqual(['"v1"', "Wed, 01 Jul 2020 10:00:00 GMT", None], validators)
+        self.assertEqual(3, stats["requests"])
+        self.assertEqual(2, stats["hits"])
+        self.assertEqual(1, stats["uncacheable"])
+        self.assertEqual(2 * len(page), stats["bytes_saved"])
+        self.assertEqual(len(page), stats["bytes_downloaded"])
+
+    def test_sqlite_runs_off_the_event_loop(self):
+        page = load_page("antien.vn")
+        threads = set()
+        with StubServer({"/p": validating_route(page, etag='"v1"')}) as server, HttpCache(self.path) as http_cache:
+            for method in ("get", "store"):
+                def traced(*args, method=getattr(http_cache, method)):
+                    threads.add(threading.current_thread().name)
+                    return method(*args)
+                setattr(http_cache, method, traced)
+            self._crawl([server.url("/p")], http_cache)
+
+        self.assertEqual(1, len(threads))
+        self.assertNotEqual(threading.main_thread().name, threads.pop())
+
+    def test_changed_page_is_parsed_again(self):
+        versions = {"etag": '"v1"', "body": load_page("antien.vn")}
+
+        def route(handler):
+            if handler.headers.get("If-None-Match") == versions["etag"]:
+                return 304, {"ETag": versions["etag"]}, b""
+            return 200, {"ETag": versions["etag"]}, versions["body"]
+
+        with StubServer({"/p": route}) as server, HttpCache(self.path) as http_cache:
+            self._crawl([server.url("/p")], http_cache)
+            versions["etag"], versions["body"] = '"v2"', load_page("antien.vn").replace(b"2.190.000", b"2.090.000")
+            product = self._crawl([server.url("/p")], http_cache)[0]
+            stats = http_cache.stats()["antien.vn"]
+
+        self.assertEqual(2090000, product.sale_price)
+        self.assertEqual(0, stats["hits"])
+
+    def test_expired_entries_are_not_revalidated(self):
+        with StubServer({"/p": validating_route(load_page("antien.vn"), etag='"v1"')}) as server:
+            with HttpCache(self.path, max_age=-1) as http_cache:
+                self._crawl([server.url("/p")] * 2, http_cache)
+            self.assertEqual([None, None], [headers.get("If-None-Match") for _, headers in server.requests])
+
+
+if __name__ == '__main__':
+    unittest.main()
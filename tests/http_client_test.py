@@ -0,0 +1,65 @@
+import asyncio
+import math
+import time
+import unittest
+
+from clients.http_client import HttpClient
+from tests.http_stub import StubServer
+
+
+class HttpClientTest(unittest.TestCase):
+
+    LATENCY = 0.2
+
+    def _fetch_all(self, server, links, concurrency):
+        async def fetch():
+            async with HttpClient(concurrency=concurrency) as http_client:
+                return await asyncio.gather(*[http_client.get(link) for link in links])
+
+        start = time.time()
+        responses = asyncio.run(fetch())
+        return responses, time.time() - start
+
+    def test_get(self):
+        with StubServer(default_body="1.700.000 ₫".encode("utf-8")) as server:
+            responses, _ = self._fetch_all(server, [server.url("/p1.html")], concurrency=1)
+        self.assertEqual(200, responses[0].status_code)
+        self.assertEqual("1.700.000 ₫", responses[0].text)
+
+    def test_batch_overlaps_network_waits(self):
+        n, concurrency = 12, 4
+        with StubServer(latency=self.LATENCY) as server:
+            links = [server.url(f"/p{i}.html") for i in range(n)]
+            responses, elapsed = self._fetch_all(server, links, concurrency)
+
+        self.assertEqual([200] * n, [r.status_code for r in responses])
+        expected = self.LATENCY * math.ceil(n / concurrency)
+        print(f"{n} links, latency {self.LATENCY}s, concurrency {concurrency}: {elapsed:.2f}s "
+              f"(serial would be {n * self.LATENCY:.2f}s, expected ~{expected:.2f}s)")
+        self.assertGreaterEqual(elapsed, expected * 0.9)
+        self.assertLess(elapsed, expected + n * self.LATENCY / 4)
+
+
+    def test_stalled_response_times_out(self):
+        def stall(handler):
+            time.sleep(2)
+            return 200, {}, b"late"
+
+        async def fetch(http_client, link, domain=None):
+            async with http_client:
+                start = time.monotonic()
+                with self.assertRaises(asyncio.TimeoutError):
+                    await http_client.get(link, domain=domain)
+                return time.monotonic() - start
+
+        with StubServer({"/stall": stall}) as server:
+            elapsed = asyncio.run(fetch(HttpClient(read_timeout=0.2), server.url("/stall")))
+            self.assertLess(elapsed, 1)
+            # per shop override
+            http_client = HttpClient(read_timeout=10, domain_timeouts={"slow.vn": {"read": 0.2}})
+            elapsed = asyncio.run(fetch(http_client, server.url("/stall"), domain="slow.vn"))
+            self.assertLess(elapsed, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
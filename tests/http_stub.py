@@ -0,0 +1,104 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from clients.http_client import HttpClient
+
+
+class _Server(ThreadingHTTPServer):
+
+    daemon_threads = True
+    # the default backlog of 5 drops connections opened together, they are retried by the client 1s later
+    request_queue_size = 128
+
+
+class StubServer:
+
+    # Local HTTP server for tests and benchmarks. `routes` maps a path (without query string) to a
+    # function(handler) -> (status, headers, body); unknown paths are answered with 200 and `default_body`.
+    def __init__(self, routes: dict = None, latency: float = 0, default_body: bytes = b"ok"):
+        self.routes = routes or {}
+        self.latency = latency
+        self.default_body = default_body
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = _Server(("127.0.0.1", 0), self._handler_class())
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def url(self, path: str) -> str:
+        return self.base_url + path
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body are written separately, with Nagle's algorithm each keep-alive response
+            # would wait for the client's delayed ACK
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests.append((self.path, dict(self.headers)))
+                if stub.latency:
+                    time.sleep(stub.latency)
+                route = stub.routes.get(self.path.split("?")[0])
+                if route is None:
+                    status, headers, body = 200, {}, stub.default_body
+                else:
+                    status, headers, body = route(self)
+                try:
+                    self.send_response(status)
+                    for key, value in headers.items():
+                        self.send_header(key, value)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+class LocalHttpClient(HttpClient):
+
+    # HttpClient sending every request to a StubServer instead of the real shop: https://tiki.vn/api/p?x=1 is
+    # fetched from <server>/tiki.vn/api/p?x=1, so crawlers run unchanged against recorded pages.
+    def __init__(self, server: StubServer, **kwargs):
+        super().__init__(**kwargs)
+        self.server = server
+
+    @staticmethod
+    def local_path(url: str) -> str:
+        parts = urlsplit(url)
+        return f"/{parts.hostname}{parts.path}"
+
+    async def get(self, url: str, headers: dict = None, domain: str = None):
+        query = urlsplit(url).query
+        local_url = self.server.url(self.local_path(url) + (f"?{query}" if query else ""))
+        return await super().get(local_url, headers=headers, domain=domain)
+
@@ -0,0 +1,36 @@
+import unittest
+
+from links import canonicalize
+from pricing import CrawlerGetter
+
+
+class CanonicalizeTest(unittest.TestCase):
+
+    def test_tracking_params_are_removed(self):
+        self.assertEqual("https://baochauelec.com/loa-bluetooth-jbl-xtreme-2",
+                         canonicalize("https://baochauelec.com/loa-bluetooth-jbl-xtreme-2?gclid=Cj0KCQjwreT8BRDTARIsAJL"
+                                      "&utm_source=google&utm_medium=cpc"))
+        self.assertEqual("https://tiki.vn/p/123.html?spid=456",
+                         canonicalize("https://tiki.vn/p/123.html?utm_campaign=x&spid=456&fbclid=abc"))
+
+    def test_host_scheme_and_path_are_normalised(self):
+        for link in ["https://ctmobile.vn/iphone-se2-128gb-new", "HTTPS://CTMobile.vn/iphone-se2-128gb-new/",
+                     "https://ctmobile.vn:443/iphone-se2-128gb-new#specs", "ctmobile.vn/iphone-se2-128gb-new",
+                     " https://ctmobile.vn/iphone-se2-128gb-new? "]:
+            with self.subTest(link=link):
+                self.assertEqual("https://ctmobile.vn/iphone-se2-128gb-new", canonicalize(link))
+        self.assertEqual("https://ctmobile.vn/", canonicalize("https://ctmobile.vn"))
+        self.assertEqual("http://127.0.0.1:8080/p?a=1&b=2", canonicalize("http://127.0.0.1:8080/p?b=2&a=1"))
+
+    def test_shop_rules(self):
+        crawler_getter = CrawlerGetter()
+        self.assertEqual("https://antien.vn/tai-nghe/airpods-2.html",
+                         crawler_getter.canonical_link("https://antien.vn/tai-nghe/airpods-2.html?gclid=Cj0KCQjwuL"
+                                                       "&regid=12260648591603298072"))
+        self.assertEqual("https://minhtuanmobile.com/iphone-11-2019-64gb-vn-a/",
+                         crawler_getter.canonical_link("https://minhtuanmobile.com/iphone-11-2019-64gb-vn-a"))
+        self.assertEqual("https://unknown.vn/p", crawler_getter.canonical_link("https://unknown.vn/p/?utm_source=x"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+
+from clients.gsheet_client import GSheetClient
+from logger import SheetLogger
+from services.domain_scheduler import DomainScheduler
+from services.product_sink import BQProductSink
+from services.streaming_service import StreamingService
+from tests.fakes import FakeBQClient, FakeCrawler, FakeCrawlerGetter, FakeSheetsService
+
+
+class FailingSheetsService(FakeSheetsService):
+
+    def batchUpdate(self, spreadsheetId, body):
+        raise Exception("quota exceeded")
+
+
+class SheetLoggerTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.fallback_path = tempfile.mkstemp(suffix=".log")
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.fallback_path)
+
+    def make_logger(self, sheets_service, **kwargs):
+        return SheetLogger(GSheetClient("log", None, service=sheets_service), "Log!I2:I2", "Log!A{}:C{}",
+                           fallback_path=self.fallback_path, **kwargs)
+
+    def test_failures_are_written_in_batches(self):
+        sheets_service = FakeSheetsService({"Log": [[], ["", "", "", "", "", "", "", "", "5"]]})
+        sheet_logger = self.make_logger(sheets_service, flush_size=500)
+        for i in range(2000):
+            sheet_logger.onFailed(f"https://shop.vn/p{i}", "timeout: ")
+        sheet_logger.onFailed("https://shop.vn/last", "server: 503")
+        sheet_logger.close()
+
+        rows = sheets_service.sheets["Log"]
+        self.assertEqual("https://shop.vn/p0", rows[4][0])
+        self.assertEqual(["https://shop.vn/last", "server: 503"], rows[2004][:2])
+        self.assertEqual(2006, rows[1][8])
+        # one metadata read, then rows and metadata cell together in one request per flush
+        self.assertEqual(["values.get"] + ["values.batchUpdate"] * 5, [r[0] for r in sheets_service.requests])
+        self.assertEqual(("Log!A2005:C2005", "Log!I2:I2"), sheets_service.requests[-1][1])
+        self.assertEqual(2001, sheet_logger.written)
+
+    def test_flush_on_interval(self):
+        sheets_service = FakeSheetsService({"Log": [[], ["", "", "", "", "", "", "", "", "2"]]})
+        sheet_logger = self.make_logger(sheets_service, flush_size=500, flush_interval=0)
+        sheet_logger.onFailed("https://shop.vn/p1", "timeout: ")
+        sheet_logger.flush()
+        self.assertEqual("https://shop.vn/p1", sheets_service.sheets["Log"][1][0])
+        sheet_logger.close()
+
+    def test_flush_when_no_failure_follows(self):
+        sheets_service = FakeSheetsService({"Log": [[], ["", "", "", "", "", "", "", "", "2"]]})
+        sheet_logger = self.make_logger(sheets_service, flush_size=500, flush_interval=0.1)
+        sheet_logger.onFailed("https://shop.vn/p1", "timeout: ")
+        sheet_logger.onFailed("https://shop.vn/p2", "timeout: ")
+        time.sleep(0.5)
+        self.assertEqual(["https://shop.vn/p1", "https://shop.vn/p2"],
+                         [row[0] for row in sheets_service.sheets["Log"][1:3]])
+        self.assertEqual(["values.get", "values.batchUpdate"], [r[0] for r in sheets_service.requests])
+        sheet_logger.close()
+
+    def test_flush_by_size_rearms_the_timer(self):
+        sheets_service = FakeSheetsService({"Log": [[], ["", "", "", "", "", "", "", "", "2"]]})
+        sheet_logger = self.make_logger(sheets_service, flush_size=2, flush_interval=0.3)
+        sheet_logger.onFailed("https://shop.vn/p1", "timeout: ")
+        time.sleep(0.2)
+        # flushed by size, the timer armed by p1 must not write p3 0.1s later
+        sheet_logger.onFailed("https://shop.vn/p2", "timeout: ")
+        sheet_logger.onFailed("https://shop.vn/p3", "timeout: ")
+        time.sleep(0.15)
+        self.assertEqual(["values.get", "values.batchUpdate"], [r[0] for r in sheets_service.requests])
+        time.sleep(0.4)
+        self.assertEqual(["values.get"] + ["values.batchUpdate"] * 2, [r[0] for r in sheets_service.requests])
+        sheet_logger.close()
+
+    def test_close_while_the_timer_fires(self):
+        for _ in range(20):
+            sheet_logger = self.make_logger(FakeSheetsService({"Log": [[], ["", "", "", "", "", "", "", "", "2"]]}),
+                                            flush_interval=0.01)
+            sheet_logger.onFailed("https://shop.vn/p1", "timeout: ")
+            time.sleep(0.01)
+            sheet_logger.close()
+            self.assertEqual(1, sheet_logger.written)
+
+    def test_fallback_file(self):
+        sheets_service = FailingSheetsService({"Log": [[], ["", "", "", "", "", "", "", "", "2"]]})
+        sheet_logger = self.make_logger(sheets_service, flush_size=2)
+        with self.assertLogs(level="ERROR"):
+            for i in range(3):
+                sheet_logger.onFailed(f"https://shop.vn/p{i}", "client: 404\nnot found")
+            sheet_logger.close()
+        with open(self.fallback_path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        self.assertEqual(3, len(lines))
+        self.assertEqual(["https://shop.vn/p2", "client: 404 not found"], lines[2].split("\t")[:2])
+
+    def test_crawl_failures_reach_the_logger(self):
+        links = ["link"] + [f"https://shop.vn/p{i}" for i in range(100)] + ["https://unknown.vn/p"]
+        gsheet_client = GSheetClient("spreadsheet", None,
+                                     service=FakeSheetsService({"Sheet1": [["", "", "", link] for link in links]}))
+        sheets_service = FakeSheetsService({"Log": [[], ["", "", "", "", "", "", "", "", "2"]]})
+        sheet_logger = self.make_logger(sheets_service, flush_size=20)
+        crawler = FakeCrawler("shop.vn")
+
+        async def get_price(link):
+            if int(link.rpartition("p")[2]) % 2:
+                raise Exception("error getting shop.vn product, status: 404")
+            return await FakeCrawler.get_price(crawler, link)
+        crawler.get_price = get_price
+
+        s = StreamingService(FakeBQClient(), gsheet_client)
+        scheduler = DomainScheduler(default_concurrency=10, default_rate=0)
+        with self.assertLogs(level="WARNING"):
+            asyncio.run(s._crawl_prices(FakeCrawlerGetter(crawler, listeners=[sheet_logger]), scheduler,
+                                        BQProductSink(s.bq_client)))
+        sheet_logger.close()
+
+        logged = sheets_service.sheets["Log"][1:52]
+        self.assertEqual(51, len(logged))
+        self.assertIn(["https://unknown.vn/p", "no crawler: not found suitable crawler for link https://unknown.vn/p"],
+                      [row[:2] for row in logged])
+        self.assertEqual(3, sum(r[0] == "values.batchUpdate" for r in sheets_service.requests))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import asyncio
+import json
+import unittest
+
+from helper import execution_time
+from metrics import Metrics, run_metrics
+from tests.fakes import PlainPriceCrawler
+from tests.http_stub import StubServer
+
+
+class MetricsTest(unittest.TestCase):
+
+    def tearDown(self):
+        run_metrics.enabled = False
+        run_metrics.reset()
+
+    def test_disabled_metrics_record_nothing(self):
+        metrics = Metrics(enabled=False)
+        metrics.observe("download", "tiki.vn", 0.1)
+        with metrics.timer("parse", "tiki.vn"):
+            pass
+        self.assertEqual({}, dict(metrics.stages))
+
+    def test_histogram_and_exports(self):
+        metrics = Metrics(enabled=True)
+        for seconds in [0.004] * 90 + [0.3] * 9 + [4.2]:
+            metrics.observe("download", "tiki.vn", seconds, n_bytes=1000)
+        with self.assertRaises(ValueError):
+            with metrics.timer("parse", "tiki.vn"):
+                raise ValueError()
+
+        stats = metrics.to_dict()
+        self.assertEqual(0.005, stats["download"]["tiki.vn"]["p50"])
+        self.assertEqual(0.5, stats["download"]["tiki.vn"]["p95"])
+        self.assertEqual(4.2, stats["download"]["tiki.vn"]["max"])
+        self.assertEqual(100000, stats["download"]["tiki.vn"]["bytes"])
+        self.assertEqual(1, stats["parse"]["tiki.vn"]["failed"])
+        self.assertEqual(stats, json.loads(metrics.to_json()))
+
+        prometheus = metrics.to_prometheus()
+        self.assertIn('crawler_stage_seconds_bucket{stage="download",domain="tiki.vn",le="0.005"} 90', prometheus)
+        self.assertIn('crawler_stage_seconds_bucket{stage="download",domain="tiki.vn",le="+Inf"} 100', prometheus)
+        self.assertIn('crawler_stage_total{stage="parse",domain="tiki.vn",result="failed"} 1', prometheus)
+        self.assertEqual("download", metrics.summary_table().splitlines()[1].split()[0])
+
+    def test_prometheus_families_are_contiguous(self):
+        metrics = Metrics(enabled=True)
+        metrics.observe("download", "tiki.vn", 0.1, n_bytes=1000)
+        metrics.observe("parse", "tiki.vn", 0.01)
+        families = []
+        for line in metrics.to_prometheus().splitlines():
+            family = line.split()[2] if line.startswith("# TYPE") else \
+                line.split("{")[0].rsplit("_bucket", 1)[0].rsplit("_sum", 1)[0].rsplit("_count", 1)[0]
+            if not families or families[-1] != family:
+                families.append(family)
+        self.assertEqual(["crawler_stage_seconds", "crawler_stage_bytes_total", "crawler_stage_total"], families)
+
+    def test_crawl_is_instrumented(self):
+        run_metrics.enabled = True
+        run_metrics.reset()
+        crawler = PlainPriceCrawler()
+        crawler.domain = "shop.vn"
+
+        async def crawl(links):
+            products = [await crawler.get_price(link) for link in links]
+            await crawler.http_client.close()
+            return products
+
+        with StubServer(default_body=b"1790000") as server:
+            asyncio.run(crawl([server.url(f"/p{i}") for i in range(3)]))
+
+        stats = run_metrics.to_dict()
+        self.assertEqual(3, stats["download"]["shop.vn"]["ok"])
+        self.assertEqual(3 * len(b"1790000"), stats["download"]["shop.vn"]["bytes"])
+        self.assertEqual(3, stats["parse"]["shop.vn"]["ok"])
+        # pooled connection: connected once
+        self.assertEqual(1, stats["connect"]["shop.vn"]["count"])
+
+    def test_execution_time_calls_the_function(self):
+        self.assertEqual(3, execution_time("sum", sum, [1, 2]))
+
+
+if __name__ == '__main__':
+    unittest.main()
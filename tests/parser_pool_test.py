@@ -0,0 +1,79 @@
+import asyncio
+import unittest
+
+from metrics import run_metrics
+from pricing import CrawlerGetter
+from services.parser_pool import ParserPool
+from tests.fixtures import PAGES, load_page, pad_page
+from tests.http_stub import StubServer
+
+
+class ParserPoolTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.parser_pool = ParserPool(workers=2).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.parser_pool.shutdown()
+
+    def test_parse_in_worker(self):
+        link, sale_price, original_price = PAGES["hoanghamobile.com"]
+        crawler = CrawlerGetter().get_crawler(link)
+        product = asyncio.run(self.parser_pool.parse(crawler, load_page("hoanghamobile.com"), "utf-8", link))
+        self.assertEqual((sale_price, original_price, link), (product.sale_price, product.original_price, product.link))
+
+    def test_event_loop_keeps_running_while_parsing(self):
+        page = pad_page(load_page("antien.vn"), 500 * 1024)
+        link = PAGES["antien.vn"][0]
+        crawler = CrawlerGetter().get_crawler(link)
+
+        async def run():
+            ticks = 0
+            parsing = asyncio.gather(*[self.parser_pool.parse(crawler, page, "utf-8", link) for _ in range(4)])
+            while not parsing.done():
+                ticks += 1
+                await asyncio.sleep(0.005)
+            return ticks, await parsing
+
+        ticks, products = asyncio.run(run())
+        self.assertEqual([PAGES["antien.vn"][1]] * 4, [p.sale_price for p in products])
+        self.assertGreater(ticks, 5)
+
+    def test_get_price_offloads_html_crawlers(self):
+        with StubServer(default_body=load_page("xtmobile.vn")) as server:
+            async def run():
+                crawler_getter = CrawlerGetter(parser_pool=self.parser_pool)
+                crawler = crawler_getter.get_crawler(PAGES["xtmobile.vn"][0])
+                product = await crawler.get_price(server.url("/loa-bluetooth-jbl-clip-3"))
+                await crawler_getter.http_client.close()
+                return product
+
+            product = asyncio.run(run())
+        self.assertEqual(PAGES["xtmobile.vn"][1:], (product.sale_price, product.original_price))
+
+    def test_parse_time_excludes_the_wait_for_a_worker(self):
+        page = pad_page(load_page("antien.vn"), 500 * 1024)
+        link = PAGES["antien.vn"][0]
+        crawler = CrawlerGetter().get_crawler(link)
+        run_metrics.enabled = True
+        run_metrics.reset()
+
+        async def run():
+            await asyncio.gather(*[self.parser_pool.parse(crawler, page, "utf-8", link) for _ in range(8)])
+
+        try:
+            asyncio.run(run())
+            stats = run_metrics.to_dict()
+        finally:
+            run_metrics.enabled = False
+            run_metrics.reset()
+        parse, parse_wait = stats["parse"]["antien.vn"], stats["parse_wait"]["antien.vn"]
+        self.assertEqual((8, 8), (parse["ok"], parse_wait["count"]))
+        # 8 pages on 2 workers: most pages wait for the ones before them
+        self.assertGreater(parse_wait["max"], parse["max"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import random
+import unittest
+
+from price_parser import NO_PRICE, NoPriceError, parse_price, parse_prices, require_price
+
+SEPARATORS = [".", ",", " ", " "]
+TEMPLATES = ["{}", "{} ₫", "{}₫", "{}đ", "{} đ", "{} vnđ", "{} VND", "Giá: {}", "Giá {} vnđ (2 năm)",
+             "\n    {} ₫\n  ", "Chỉ còn {}đ", "{},00 đ", "{}.00"]
+
+
+def group(price: int, separator: str) -> str:
+    return f"{price:,}".replace(",", separator)
+
+
+class PriceParserTest(unittest.TestCase):
+
+    def test_examples(self):
+        examples = {
+            "1.700.000 ₫": 1700000,
+            "11,990,000 ₫": 11990000,
+            "23.590.000đ": 23590000,
+            "Giá 5,990,000 vnđ (2 năm)": 5990000,
+            "4049000": 4049000,
+            "4049000.00": 4049000,
+            "699.000 ₫ 799.000 ₫": 699000,
+            "Liên hệ": NO_PRICE,
+            "Hết hàng": NO_PRICE,
+            "": NO_PRICE,
+            # non-ASCII digits are not prices
+            "١٢٣": NO_PRICE,
+            "²": NO_PRICE,
+        }
+        for text, price in examples.items():
+            with self.subTest(text=text):
+                self.assertEqual(price, parse_price(text))
+
+    def test_generated_corpus(self):
+        # every price printed in every format shops use parses back to itself
+        rnd = random.Random(20201118)
+        prices = [rnd.choice([rnd.randint(1, 999), rnd.randint(1, 999) * 1000, rnd.randint(1000, 99999) * 1000,
+                              rnd.randint(1000, 999999999)]) for _ in range(500)]
+        texts, expected = [], []
+        for price in prices:
+            for separator in SEPARATORS:
+                for template in TEMPLATES:
+                    if template.endswith(",00 đ") and separator == ",":
+                        continue
+                    texts.append(template.format(group(price, separator)))
+                    expected.append(price)
+            texts.append(rnd.choice(TEMPLATES).format(price))
+            expected.append(price)
+        for text, price in zip(texts, expected):
+            self.assertEqual(price, parse_price(text), text)
+        self.assertEqual(expected, parse_prices(texts))
+
+    def test_require_price(self):
+        self.assertEqual(1700000, require_price("1.700.000 ₫"))
+        with self.assertRaises(NoPriceError):
+            require_price("Liên hệ")
+        # crawlers raising ValueError before keep working
+        self.assertTrue(issubclass(NoPriceError, ValueError))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+
+from clients.price_store import PriceStore
+from pricing import Product
+from services.product_sink import BQProductSink, LoadJobProductSink
+from tests.fakes import FakeBQClient
+from tests.product_sink_test import consume, make_products
+
+TODAY = date(2020, 11, 20)
+
+
+class PriceStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".sqlite")
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_classify(self):
+        product = Product(200, 100, link="https://tiki.vn/p1.html")
+        with PriceStore(self.path, TODAY) as store:
+            self.assertEqual(PriceStore.NEW, store.classify(product))
+            store.record([product])
+            self.assertEqual(PriceStore.UNCHANGED, store.classify(product))
+            self.assertEqual(PriceStore.CHANGED, store.classify(product._replace(sale_price=90)))
+            self.assertEqual(PriceStore.CHANGED, store.classify(product._replace(original_price=210)))
+        # written yesterday, today's partition needs a row of the link
+        with PriceStore(self.path, date(2020, 11, 21)) as store:
+            self.assertEqual(PriceStore.REFRESHED, store.classify(product))
+            self.assertEqual({"new": 0, "changed": 0, "refreshed": 1, "unchanged": 0, "written": 1,
+                              "skipped_ratio": 0.0}, store.stats())
+
+    def test_runs_only_write_changed_prices(self):
+        products = make_products(1000)
+        for sink_class in (BQProductSink, LoadJobProductSink):
+            with self.subTest(sink=sink_class.__name__):
+                os.remove(self.path)
+                bq_client = FakeBQClient()
+                with PriceStore(self.path, TODAY) as store:
+                    consume(sink_class(bq_client, price_store=store), products)
+                self.assertEqual(1000, len(bq_client.rows))
+
+                # 10 prices changed since the first run
+                changed = [p._replace(sale_price=p.sale_price - 1) if i % 100 == 0 else p
+                           for i, p in enumerate(products)]
+                bq_client = FakeBQClient()
+                with PriceStore(self.path, TODAY) as store:
+                    sink = sink_class(bq_client, price_store=store)
+                    consume(sink, changed)
+                    self.assertEqual(10, sink.inserted)
+                    self.assertEqual(990, store.stats()["unchanged"])
+                self.assertEqual([changed[i].link for i in range(0, 1000, 100)], [r["link"] for r in bq_client.rows])
+
+    def test_failed_inserts_are_written_again(self):
+        bq_client = FakeBQClient(failures=1)
+        with PriceStore(self.path, TODAY) as store:
+            consume(BQProductSink(bq_client, chunk_rows=50, max_retries=0, price_store=store), make_products(100))
+            self.assertEqual(50, len(store))
+        with PriceStore(self.path, TODAY) as store:
+            consume(BQProductSink(FakeBQClient(), price_store=store), make_products(100))
+            stats = store.stats()
+            self.assertEqual((50, 50), (stats["new"], stats["unchanged"]))
+
+
+    def test_loaded_files_are_recorded(self):
+        # the first file is given up, the products of the next ones are recorded once loaded
+        with tempfile.TemporaryDirectory() as directory, PriceStore(self.path, TODAY) as store:
+            sink = LoadJobProductSink(FakeBQClient(failures=2), directory=directory, file_rows=400, max_retries=1,
+                                      retry_delay=0.001, price_store=store)
+            consume(sink, make_products(1000))
+            self.assertEqual((600, 400), (sink.inserted, sink.failed))
+            self.assertEqual(600, len(store))
+            self.assertEqual(0, len(sink.written))
+
+if __name__ == '__main__':
+    unittest.main()
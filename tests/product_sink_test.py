@@ -0,0 +1,114 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from clients.bq_client import ROW_OVERHEAD_BYTES
+from pricing import Product
+from services.product_sink import BQProductSink, LoadJobProductSink
+from tests.fakes import FakeBQClient
+
+
+def make_products(n):
+    return [Product(original_price=i + 1, sale_price=i, link=f"https://tiki.vn/p{i}.html") for i in range(n)]
+
+
+def consume(sink, products):
+    async def run():
+        queue = asyncio.Queue(maxsize=10)
+        consumer = asyncio.create_task(sink.consume(queue))
+        for product in products:
+            await queue.put(product)
+        await queue.put(None)
+        await consumer
+
+    asyncio.run(run())
+
+
+class BQProductSinkTest(unittest.TestCase):
+
+    def test_memory_stays_flat(self):
+        for n in (1000, 20000):
+            bq_client = FakeBQClient()
+            sink = BQProductSink(bq_client, flush_rows=200, chunk_rows=100)
+            consume(sink, make_products(n))
+            self.assertEqual(n, len(bq_client.rows))
+            self.assertEqual(n, sink.inserted)
+            self.assertLessEqual(sink.max_buffered, 200)
+            self.assertLessEqual(max(bq_client.insert_requests), 100)
+
+    def test_chunks_respect_payload_size(self):
+        bq_client = FakeBQClient()
+        sink = BQProductSink(bq_client, flush_rows=1000, chunk_rows=500, chunk_bytes=10 * 1024)
+        consume(sink, make_products(1000))
+        row_size = len("https://tiki.vn/p999.html") + ROW_OVERHEAD_BYTES
+        self.assertLessEqual(max(bq_client.insert_requests), 10 * 1024 // row_size + 1)
+        self.assertEqual(1000, len(bq_client.rows))
+
+    def test_flush_on_interval(self):
+        bq_client = FakeBQClient()
+        sink = BQProductSink(bq_client, flush_rows=1000, flush_interval=0.05)
+
+        async def run():
+            queue = asyncio.Queue()
+            consumer = asyncio.create_task(sink.consume(queue))
+            await queue.put(make_products(1)[0])
+            await asyncio.sleep(0.2)
+            flushed = len(bq_client.rows)
+            await queue.put(None)
+            await consumer
+            return flushed
+
+        self.assertEqual(1, asyncio.run(run()))
+
+    def test_failed_chunks_are_retried(self):
+        bq_client = FakeBQClient(failures=2)
+        sink = BQProductSink(bq_client, chunk_rows=50, max_retries=3, retry_delay=0.001)
+        consume(sink, make_products(100))
+        self.assertEqual(100, len(bq_client.rows))
+        self.assertEqual(0, sink.failed)
+
+        bq_client = FakeBQClient(failures=10)
+        sink = BQProductSink(bq_client, chunk_rows=50, max_retries=1, retry_delay=0.001)
+        consume(sink, make_products(100))
+        self.assertEqual(100, sink.failed)
+
+
+class LoadJobProductSinkTest(unittest.TestCase):
+
+    def test_single_load_job(self):
+        with tempfile.TemporaryDirectory() as directory:
+            bq_client = FakeBQClient()
+            sink = LoadJobProductSink(bq_client, directory=directory)
+            consume(sink, make_products(5000))
+            self.assertEqual(1, len(bq_client.load_requests))
+            self.assertEqual(5000, sink.inserted)
+            self.assertEqual([{"link": "https://tiki.vn/p0.html", "original_price": 1, "sale_price": 0}], bq_client.rows[:1])
+            self.assertEqual([], os.listdir(directory))
+
+    def test_load_job_every_file_rows(self):
+        with tempfile.TemporaryDirectory() as directory:
+            bq_client = FakeBQClient()
+            sink = LoadJobProductSink(bq_client, directory=directory, file_rows=2000)
+            consume(sink, make_products(5000))
+            self.assertEqual(3, len(bq_client.load_requests))
+            self.assertEqual(5000, sink.inserted)
+            self.assertEqual(5000, len({row["link"] for row in bq_client.rows}))
+            self.assertEqual([], os.listdir(directory))
+
+    def test_failed_load_keeps_the_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            bq_client = FakeBQClient(failures=5)
+            sink = LoadJobProductSink(bq_client, directory=directory, max_retries=1, retry_delay=0.001)
+            consume(sink, make_products(10))
+            self.assertEqual(10, sink.failed)
+            self.assertEqual(1, len(os.listdir(directory)))
+
+    def test_nothing_to_load(self):
+        bq_client = FakeBQClient()
+        consume(LoadJobProductSink(bq_client), [])
+        self.assertEqual([], bq_client.load_requests)
+
+
+if __name__ == '__main__':
+    unittest.main()
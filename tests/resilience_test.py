@@ -0,0 +1,114 @@
+import asyncio
+import time
+import unittest
+
+from clients.http_client import HttpStatusError, parse_retry_after
+from services.domain_scheduler import DomainScheduler
+from services.resilience import CircuitBreaker, CircuitOpenError, RetryPolicy, classify
+from tests.fakes import PlainPriceCrawler
+from tests.http_stub import StubServer
+
+
+class ResilienceTest(unittest.TestCase):
+
+    def test_classify(self):
+        self.assertEqual("rate_limited", classify(HttpStatusError("", 429)))
+        self.assertEqual("server", classify(HttpStatusError("", 503)))
+        self.assertEqual("client", classify(HttpStatusError("", 404)))
+        self.assertEqual("timeout", classify(asyncio.TimeoutError()))
+        self.assertEqual("connection", classify(ConnectionRefusedError()))
+        self.assertEqual("parse", classify(ValueError("invalid literal for int()")))
+        self.assertEqual("circuit_open", classify(CircuitOpenError()))
+
+    def test_retry_policy(self):
+        policy = RetryPolicy(max_retries=2, base_delay=1, max_delay=3, max_retry_after=60)
+        self.assertIsNone(policy.delay(0, HttpStatusError("", 404)))
+        self.assertIsNone(policy.delay(0, ValueError()))
+        self.assertIsNone(policy.delay(2, HttpStatusError("", 503)))
+        self.assertTrue(all(0 <= policy.delay(1, HttpStatusError("", 503)) <= 2 for _ in range(100)))
+        self.assertEqual(7, policy.delay(0, HttpStatusError("", 429, retry_after=7)))
+        self.assertIsNone(policy.delay(0, HttpStatusError("", 429, retry_after=3600)))
+        self.assertEqual(120, parse_retry_after("120"))
+        self.assertEqual(0, parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"))
+        self.assertIsNone(parse_retry_after("soon"))
+
+    def test_circuit_breaker(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure(HttpStatusError("", 404))
+        breaker.record_failure(HttpStatusError("", 503))
+        self.assertTrue(breaker.allow())
+        breaker.record_failure(asyncio.TimeoutError())
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        # half open: one trial call
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_failure(HttpStatusError("", 503))
+        self.assertEqual("open", breaker.state)
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual("closed", breaker.state)
+        self.assertEqual(2, breaker.times_opened)
+
+    def test_retry_after_is_honoured(self):
+        calls = []
+
+        def throttled(handler):
+            calls.append(time.monotonic())
+            if len(calls) == 1:
+                return 429, {"Retry-After": "1"}, b""
+            return 200, {}, b"1790000"
+
+        with StubServer({"/p": throttled}) as server:
+            product = self._crawl(DomainScheduler(default_rate=0, retry_policy=RetryPolicy(max_retries=1)),
+                                  [("shop.vn", server.url("/p"))])[0]
+        self.assertEqual(1790000, product.sale_price)
+        self.assertGreaterEqual(calls[1] - calls[0], 1.0)
+
+    def test_run_with_one_shop_down(self):
+        # 30 links of a shop answering 503 after 0.1s, 30 links of a healthy shop
+        def run(breaker_threshold):
+            with StubServer({"/p": lambda handler: (503, {}, b"")}, latency=0.1) as down, \
+                    StubServer(default_body=b"1790000") as up:
+                links = [("down.vn", down.url("/p")) for _ in range(30)] + [("up.vn", up.url("/p")) for _ in range(30)]
+                scheduler = DomainScheduler(default_concurrency=4, default_rate=0,
+                                            retry_policy=RetryPolicy(max_retries=2, base_delay=0.05),
+                                            breaker_threshold=breaker_threshold, breaker_reset=60)
+                start = time.monotonic()
+                results = self._crawl(scheduler, links)
+                elapsed = time.monotonic() - start
+                return results, elapsed, len(down.requests), scheduler.stats()
+
+        results, elapsed_without_breaker, requests_without_breaker, _ = run(breaker_threshold=10 ** 6)
+        self.assertEqual(90, requests_without_breaker)
+        results, elapsed, requests, stats = run(breaker_threshold=3)
+        print(f"one shop down: {elapsed:.2f}s, {requests} requests with the breaker, "
+              f"{elapsed_without_breaker:.2f}s, {requests_without_breaker} requests without")
+
+        self.assertEqual([1790000] * 30, [p.sale_price for p in results[30:]])
+        self.assertTrue(all(isinstance(e, Exception) for e in results[:30]))
+        self.assertEqual("open", stats["down.vn"]["circuit"])
+        self.assertGreater(stats["down.vn"]["errors"]["circuit_open"], 0)
+        self.assertLessEqual(requests, 12)
+        self.assertLess(elapsed, elapsed_without_breaker / 2)
+
+    @staticmethod
+    def _crawl(scheduler, links):
+        async def run():
+            crawlers = {}
+            for domain, _ in links:
+                if domain not in crawlers:
+                    crawlers[domain] = PlainPriceCrawler()
+                    crawlers[domain].domain = domain
+            try:
+                return await asyncio.gather(*[scheduler.run(domain, crawlers[domain].get_price, link)
+                                              for domain, link in links], return_exceptions=True)
+            finally:
+                for crawler in crawlers.values():
+                    await crawler.http_client.close()
+        return asyncio.run(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import asyncio
+import configparser
+import multiprocessing
+import time
+import unittest
+from collections import Counter
+
+from clients.gsheet_client import GSheetClient
+from clients.http_client import HttpClient
+from pricing import CrawlerGetter
+from services.domain_scheduler import DomainScheduler
+from services.product_sink import BQProductSink
+from services.sharding import Shard
+from services.streaming_service import StreamingService
+from tests.fakes import FakeBQClient, FakeSheetsService, PlainPriceCrawler
+from tests.http_stub import StubServer
+
+
+def crawl_shard(shard: Shard, base_url: str, n_links: int, barrier, results):
+    # worker process of test_shards_crawl_in_parallel, crawls its rows of the sheet and reports the links
+    links = ["link"] + [f"{base_url}/p{i}" for i in range(n_links)]
+    gsheet_client = GSheetClient("spreadsheet", None,
+                                 service=FakeSheetsService({"Sheet1": [["", "", "", link] for link in links]}))
+    bq_client = FakeBQClient()
+    s = StreamingService(bq_client, gsheet_client)
+    config = configparser.ConfigParser()
+    config.read_dict({"DEFAULT": {"LINK_RANGE_FORMART": "Sheet1!D{}:D{}"}, "PIPELINE": {"CRAWL_WINDOW": "10"}})
+    s.shard, s.config = shard, shard.config(config)
+    scheduler = DomainScheduler(default_concurrency=10, default_rate=0)
+
+    async def run():
+        async with HttpClient(concurrency=10) as http_client:
+            crawler_getter = CrawlerGetter(http_client, registry={"127.0.0.1": PlainPriceCrawler})
+            await s._crawl_prices(crawler_getter, scheduler, BQProductSink(bq_client))
+
+    barrier.wait()
+    start = time.monotonic()
+    asyncio.run(run())
+    results.put((shard.index, time.monotonic() - start, [row["link"] for row in bq_client.rows]))
+
+
+class ShardTest(unittest.TestCase):
+
+    def test_links_have_one_owner(self):
+        links = [f"https://shop.vn/p{i}" for i in range(4000)]
+        shards = [Shard(index, 4) for index in range(4)]
+        owners = [[shard.index for shard in shards if shard.owns(link)] for link in links]
+
+        self.assertTrue(all(len(owner) == 1 for owner in owners))
+        sizes = Counter(owner[0] for owner in owners)
+        self.assertTrue(all(800 < size < 1200 for size in sizes.values()), sizes)
+        # growing to 5 shards only moves links to the new shard
+        moved = [link for link, owner in zip(links, owners) if Shard.owner(link, 5) != owner[0]]
+        self.assertTrue(all(Shard.owner(link, 5) == 4 for link in moved))
+        self.assertTrue(Shard(0, 1).owns(links[0]))
+        with self.assertRaises(ValueError):
+            Shard(4, 4)
+
+    def test_config_of_a_shard(self):
+        config = configparser.ConfigParser()
+        config.read_dict({"DEFAULT": {"LINK_RANGE_FORMART": "Sheet1!D{}:D{}"},
+                          "CHECKPOINT": {"PATH": "crawl_checkpoint.sqlite"},
+                          "MERGE": {"WATERMARK_PATH": "merge_watermarks.json"},
+                          "SINK": {"LOAD_DIRECTORY": ""},
+                          "SCHEDULER": {"DOMAIN_CONCURRENCY": "4", "DOMAIN_RATE": "5", "DOMAIN_BURST": "5"},
+                          "domain:tiki.vn": {"CONCURRENCY": "8", "RATE": "10", "BURST": "2"}})
+
+        sharded = Shard(1, 3).config(config)
+
+        self.assertEqual("crawl_checkpoint.shard1.sqlite", sharded["CHECKPOINT"]["PATH"])
+        self.assertEqual("merge_watermarks.shard1.json", sharded["MERGE"]["WATERMARK_PATH"])
+        self.assertEqual("Sheet1!D{}:D{}", sharded["DEFAULT"]["LINK_RANGE_FORMART"])
+        self.assertEqual(2, sharded["SCHEDULER"].getint("DOMAIN_CONCURRENCY"))
+        self.assertAlmostEqual(5 / 3, sharded["SCHEDULER"].getfloat("DOMAIN_RATE"))
+        self.assertEqual(3, sharded["domain:tiki.vn"].getint("CONCURRENCY"))
+        self.assertEqual(1, sharded["domain:tiki.vn"].getfloat("BURST"))
+        # the configuration of the process is left as it is
+        self.assertEqual("crawl_checkpoint.sqlite", config["CHECKPOINT"]["PATH"])
+
+        config.read_dict({"SHARDING": {"SPLIT_DOMAIN_LIMITS": "false"}})
+        self.assertEqual(8, Shard(1, 3).config(config)["domain:tiki.vn"].getint("CONCURRENCY"))
+
+    def _crawl(self, base_url: str, n_links: int, n_shards: int):
+        # (longest crawl of a shard, links crawled by each shard)
+        context = multiprocessing.get_context("spawn")
+        barrier, results = context.Barrier(n_shards), context.Queue()
+        processes = [context.Process(target=crawl_shard, args=(Shard(index, n_shards), base_url, n_links,
+                                                               barrier, results))
+                     for index in range(n_shards)]
+        for process in processes:
+            process.start()
+        shard_results = [results.get(timeout=60) for _ in processes]
+        for process in processes:
+            process.join()
+        return max(elapsed for _, elapsed, _ in shard_results), [links for _, _, links in shard_results]
+
+    def test_shards_crawl_in_parallel(self):
+        # each shard crawls 10 links at a time from a shop answering in 0.1s
+        with StubServer(latency=0.1, default_body=b"1790000") as server:
+            single_elapsed, _ = self._crawl(server.base_url, 160, 1)
+            sharded_elapsed, shard_links = self._crawl(server.base_url, 160, 4)
+
+        crawled = [link for links in shard_links for link in links]
+        self.assertEqual(160, len(crawled))
+        self.assertEqual({f"{server.base_url}/p{i}" for i in range(160)}, set(crawled))
+        self.assertGreater(single_elapsed / sharded_elapsed, 2, (single_elapsed, sharded_elapsed))
@@ -0,0 +1,55 @@
+import unittest
+
+from clients.gsheet_client import GSheetClient
+from services.sheet_reader import SheetLinkReader
+from tests.fakes import FakeSheetsService
+
+
+class SheetLinkReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        rows = [["", "", "", "link"]] + [["", "", "", f"https://shop.vn/p{i}"] for i in range(20000)]
+        self.sheets_service = FakeSheetsService({"Sheet1": rows}, row_count=21000)
+        self.gsheet_client = GSheetClient("spreadsheet", None, service=self.sheets_service)
+
+    def test_reads_every_row_once(self):
+        reader = SheetLinkReader(self.gsheet_client, "Sheet1!D{}:D{}", chunk_rows=3000, ranges_per_request=2)
+        rows = list(reader)
+        self.assertEqual(20000, len(rows))
+        self.assertEqual((2, ["https://shop.vn/p0"]), rows[0])
+        self.assertEqual((20001, ["https://shop.vn/p19999"]), rows[-1])
+        self.assertEqual(list(range(2, 20002)), [row_index for row_index, _ in rows])
+
+    def test_request_count(self):
+        # 20k rows: 1 metadata request + 2 batchGets, against 200 values.get calls at 100 rows per call
+        list(SheetLinkReader(self.gsheet_client, "Sheet1!D{}:D{}", chunk_rows=5000, ranges_per_request=4))
+        self.assertEqual(3, len(self.sheets_service.requests))
+        self.assertEqual(("get", ("Sheet1",)), self.sheets_service.requests[0])
+        self.assertEqual(("values.batchGet", ("Sheet1!D2:D5001", "Sheet1!D5002:D10001", "Sheet1!D10002:D15001",
+                                              "Sheet1!D15002:D20001")), self.sheets_service.requests[1])
+        self.assertEqual(("values.batchGet", ("Sheet1!D20002:D21000",)), self.sheets_service.requests[2])
+
+    def test_batches_are_fetched_lazily(self):
+        batches = SheetLinkReader(self.gsheet_client, "Sheet1!D{}:D{}", chunk_rows=5000,
+                                  ranges_per_request=1).iter_batches()
+        next(batches)
+        self.assertEqual(2, len(self.sheets_service.requests))
+
+    def test_quoted_sheet_title(self):
+        sheets_service = FakeSheetsService({"Bob's links": [["link"], ["https://shop.vn/p0"]]})
+        gsheet_client = GSheetClient("spreadsheet", None, service=sheets_service)
+        self.assertEqual(2, gsheet_client.get_row_count("'Bob''s links'"))
+        self.assertEqual(2, gsheet_client.get_row_count("Bob's links"))
+
+    def test_missing_sheet_is_an_error(self):
+        reader = SheetLinkReader(self.gsheet_client, "Sheet2!D{}:D{}")
+        with self.assertRaisesRegex(ValueError, "sheet 'Sheet2' not found"):
+            list(reader)
+
+    def test_unsupported_range(self):
+        with self.assertRaises(ValueError):
+            SheetLinkReader(self.gsheet_client, "Sheet1!D2:D100")
+
+
+if __name__ == '__main__':
+    unittest.main()
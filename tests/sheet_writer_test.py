@@ -0,0 +1,72 @@
+import asyncio
+import unittest
+
+from clients.gsheet_client import GSheetClient
+from pricing import Product
+from services.domain_scheduler import DomainScheduler
+from services.product_sink import BQProductSink
+from services.sheet_writer import SheetPriceWriter
+from services.streaming_service import StreamingService
+from tests.fakes import FakeBQClient, FakeCrawler, FakeCrawlerGetter, FakeSheetsService
+
+
+def write(writer, results):
+    async def run():
+        queue = asyncio.Queue(maxsize=10)
+        consumer = asyncio.create_task(writer.consume(queue))
+        for row_index, product in results:
+            await queue.put((row_index, product))
+        await queue.put(None)
+        await consumer
+
+    asyncio.run(run())
+
+
+class SheetPriceWriterTest(unittest.TestCase):
+
+    def test_rows_are_coalesced(self):
+        writer = SheetPriceWriter(None, "Sheet1!E{}:F{}", max_gap=2)
+        rows = {i: [i, i + 1] for i in [2, 3, 4, 7, 8, 12, 5]}
+        self.assertEqual([("Sheet1!E2:F8", [[2, 3], [3, 4], [4, 5], [5, 6], [], [7, 8], [8, 9]]),
+                          ("Sheet1!E12:F12", [[12, 13]])], writer.ranges(rows))
+
+    def test_requests_are_bounded_by_payload(self):
+        writer = SheetPriceWriter(None, "Sheet1!E{}:F{}", max_gap=0, max_request_bytes=1000)
+        ranges = writer.ranges({i: [1790000, 1990000] for i in range(2, 200, 2)})
+        requests = writer.requests_of(ranges)
+        self.assertGreater(len(requests), 1)
+        self.assertEqual(ranges, [r for request in requests for r in request])
+
+    def test_row_alignment(self):
+        sheet = [["", "", "", "link"], ["", "", "", "a", "old", "old"], ["", "", "", "b", "1", "2"], ["", "", "", "c"]]
+        sheets_service = FakeSheetsService({"Sheet1": sheet})
+        writer = SheetPriceWriter(GSheetClient("spreadsheet", None, service=sheets_service), "Sheet1!E{}:F{}")
+        write(writer, [(4, Product(200, 100)), (2, Product(400, 300))])
+        # row 3 failed to crawl and keeps its values
+        self.assertEqual([["", "", "", "a", 300, 400], ["", "", "", "b", "1", "2"], ["", "", "", "c", 100, 200]],
+                         sheet[1:])
+        self.assertEqual([("values.batchUpdate", ("Sheet1!E2:F4",))], sheets_service.requests)
+        self.assertEqual(2, writer.written)
+
+    def test_crawl_writes_prices_back_in_a_few_requests(self):
+        # 10k rows with empty and duplicate links
+        links = ["link"] + ["" if i % 50 == 7 else f"https://shop.vn/p{i % 9000}" for i in range(10000)]
+        sheet = [["", "", "", link] for link in links]
+        sheets_service = FakeSheetsService({"Sheet1": sheet})
+        gsheet_client = GSheetClient("spreadsheet", None, service=sheets_service)
+        s = StreamingService(FakeBQClient(), gsheet_client)
+        crawler_getter = FakeCrawlerGetter(FakeCrawler("shop.vn"))
+        scheduler = DomainScheduler(default_concurrency=100, default_rate=0)
+        writer = SheetPriceWriter(gsheet_client, "Sheet1!E{}:F{}", flush_rows=5000)
+
+        asyncio.run(s._crawl_prices(crawler_getter, scheduler, BQProductSink(s.bq_client), writer))
+
+        for row in sheet[1:]:
+            self.assertEqual([100, 200] if row[3] else [], row[4:6])
+        updates = [request for request in sheets_service.requests if request[0] == "values.batchUpdate"]
+        self.assertLessEqual(len(updates), 3)
+        self.assertEqual(9800, writer.written)
+
+
+if __name__ == '__main__':
+    unittest.main()
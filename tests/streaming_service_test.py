@@ -1,5 +1,24 @@
+import asyncio
+import configparser
+import os
+import re
+import tempfile
+import time
 import unittest
+from datetime import datetime
+
+from pytz import timezone
+
+from clients.gsheet_client import GSheetClient
+from clients.http_client import HttpClient
+from pricing import CrawlerGetter
+from services.domain_scheduler import DomainScheduler
+from services.product_sink import BQProductSink
 from services.streaming_service import StreamingService
+from tests.fakes import FakeBQClient, FakeCrawler, FakeCrawlerGetter, FakeSheetsService, PlainPriceCrawler
+from tests.http_stub import StubServer
+
+HCM = timezone("Etc/GMT-7")
 
 
 class StreamingServiceTest(unittest.TestCase):
@@ -9,5 +28,172 @@ class StreamingServiceTest(unittest.TestCase):
         id_columns = ["link", "_date"]
         columns_update = ["original_price", "sale_price"]
         columns_insert = ["link", "original_price", "sale_price", "_date"]
-        merge_stmt = s._get_merge_query(dest_table="`staging.competitor_price`", source_table="`pre_sync.competitor_price`", id_columns=id_columns, columns_update=columns_update, columns_insert=columns_insert)
-        print(merge_stmt)
\ No newline at end of file
+        merge_stmt = s._get_merge_query(dest_table="`staging.competitor_price`", source_table="`pre_sync.competitor_price`", id_columns=id_columns, columns_update=columns_update, columns_insert=columns_insert,
+                                        since=datetime(2020, 11, 20, 8, 0, tzinfo=HCM),
+                                        until=datetime(2020, 11, 20, 9, 30, 15, tzinfo=HCM))
+        self.assertEqual(
+            'MERGE `staging.competitor_price` T '
+            'USING (SELECT * FROM `pre_sync.competitor_price` '
+            'WHERE _date = CURRENT_DATE("+7") '
+            'AND _created_at > TIMESTAMP("2020-11-20 08:00:00+07:00") '
+            'AND _created_at <= TIMESTAMP("2020-11-20 09:30:15+07:00") '
+            'QUALIFY ROW_NUMBER() OVER (PARTITION BY link,_date ORDER BY _created_at DESC) = 1) S '
+            'ON T._date = CURRENT_DATE("+7") AND T.link = S.link AND T._date = S._date '
+            'WHEN MATCHED THEN UPDATE SET T.original_price = S.original_price,T.sale_price = S.sale_price, '
+            'T._updated_at = CURRENT_TIMESTAMP() '
+            'WHEN NOT MATCHED THEN INSERT (link,original_price,sale_price,_date, _updated_at) '
+            'VALUES (S.link,S.original_price,S.sale_price,S._date, CURRENT_TIMESTAMP())',
+            " ".join(merge_stmt.split()))
+        # the first merge reads the whole partition, the target is only pruned when _date is an id
+        merge_stmt = " ".join(s._get_merge_query("`pre_sync.t`", "`staging.t`", ["link"], ["sale_price"],
+                                                 ["link", "sale_price"]).split())
+        self.assertIn('WHERE _date = CURRENT_DATE("+7") QUALIFY', merge_stmt)
+        self.assertIn("ON T.link = S.link WHEN", merge_stmt)
+
+    def test_merge_advances_the_watermark(self):
+        with tempfile.TemporaryDirectory() as directory:
+            bq_client = FakeBQClient()
+            s = StreamingService(bq_client, None)
+            s.config = configparser.ConfigParser()
+            s.config.read_dict({"MERGE": {"WATERMARK_PATH": os.path.join(directory, "watermarks.json")}})
+
+            self.assertEqual(1024, s.merge_product(dry_run=True))
+            self.assertNotIn("_created_at >", bq_client.queries[0])
+            s.merge_product()
+            s.merge_product()
+            first_until = re.search(r'_created_at <= TIMESTAMP\("(.+?)"\)', bq_client.queries[1]).group(1)
+            # the dry run did not move the watermark, the first merge did
+            self.assertNotIn("_created_at >", bq_client.queries[1])
+            self.assertIn(f'_created_at > TIMESTAMP("{first_until}")', bq_client.queries[2])
+
+    def test_pipeline_is_not_lockstep(self):
+        # one slow link in each block of 100 rows: a batch-by-batch crawl waits for it 3 times
+        links = ["link"] + [f"https://shop.vn/p{i}" for i in range(300)] + ["", "https://unknown.vn/p"]
+        rows = [["", "", "", link] for link in links]
+        slow_links = {"https://shop.vn/p5", "https://shop.vn/p105", "https://shop.vn/p205"}
+        sheets_service = FakeSheetsService({"Sheet1": rows})
+        gsheet_client = GSheetClient("spreadsheet", None, service=sheets_service)
+        bq_client = FakeBQClient()
+        s = StreamingService(bq_client, gsheet_client)
+        crawler_getter = FakeCrawlerGetter(FakeCrawler("shop.vn", latency=0.01, slow_links=slow_links, slow_latency=0.5))
+        scheduler = DomainScheduler(default_concurrency=50, default_rate=0)
+
+        start = time.time()
+        asyncio.run(s._crawl_prices(crawler_getter, scheduler, BQProductSink(bq_client)))
+        elapsed = time.time() - start
+
+        self.assertEqual(300, len(bq_client.rows))
+        self.assertEqual(300, len({row["link"] for row in bq_client.rows}))
+        self.assertLess(elapsed, 1.0)
+        self.assertEqual([("get", ("Sheet1",)), ("values.batchGet", ("Sheet1!D2:D303",))], sheets_service.requests)
+
+    def test_shop_backlog_does_not_hold_the_crawl_window(self):
+        # 100 big.vn links read before 20 small.vn links, each shop crawls 2 links at a time
+        links = ["link"] + [f"https://big.vn/p{i}" for i in range(100)] + [f"https://small.vn/p{i}" for i in range(20)]
+        gsheet_client = GSheetClient("spreadsheet", None,
+                                     service=FakeSheetsService({"Sheet1": [["", "", "", link] for link in links]}))
+        bq_client = FakeBQClient()
+        s = StreamingService(bq_client, gsheet_client)
+        s.config = configparser.ConfigParser()
+        s.config.read_dict({"DEFAULT": {"LINK_RANGE_FORMART": "Sheet1!D{}:D{}"}, "PIPELINE": {"CRAWL_WINDOW": "10"}})
+        crawlers = {"big.vn": FakeCrawler("big.vn", latency=0.02), "small.vn": FakeCrawler("small.vn", latency=0.02)}
+        scheduler = DomainScheduler(default_concurrency=2, default_rate=0)
+
+        start = time.monotonic()
+        asyncio.run(s._crawl_prices(FakeCrawlerGetter(crawlers), scheduler, BQProductSink(bq_client)))
+        elapsed = time.monotonic() - start
+
+        self.assertEqual(120, len(bq_client.rows))
+        # the small shop is done at its own pace, not after the backlog of the big one
+        self.assertLess(max(crawlers["small.vn"].finished_at) - start, 0.5)
+        self.assertLess(elapsed, 1.5)
+
+    def test_crawling_stops_when_the_sink_dies(self):
+        links = ["link"] + [f"https://shop.vn/p{i}" for i in range(200)]
+        gsheet_client = GSheetClient("spreadsheet", None,
+                                     service=FakeSheetsService({"Sheet1": [["", "", "", link] for link in links]}))
+        bq_client = FakeBQClient()
+        s = StreamingService(bq_client, gsheet_client)
+        s.config = configparser.ConfigParser()
+        s.config.read_dict({"DEFAULT": {"LINK_RANGE_FORMART": "Sheet1!D{}:D{}"},
+                            "PIPELINE": {"PRODUCT_QUEUE_SIZE": "5", "RUN_DEADLINE": "0"}})
+        crawler = FakeCrawler("shop.vn", latency=0.001)
+        sink = BQProductSink(bq_client)
+
+        async def add(product):
+            raise RuntimeError("price store is gone")
+        sink.add = add
+
+        async def run():
+            scheduler = DomainScheduler(default_concurrency=50, default_rate=0)
+            await asyncio.wait_for(s._crawl_prices(FakeCrawlerGetter(crawler), scheduler, sink), timeout=5)
+
+        with self.assertLogs(level="ERROR") as logs, self.assertRaisesRegex(RuntimeError, "price store is gone"):
+            asyncio.run(run())
+        self.assertIn("the sink stopped", "\n".join(logs.output))
+        self.assertLess(len(crawler.links), 200)
+
+    def test_duplicate_links_are_crawled_once(self):
+        links = ["link"] + [f"https://shop.vn/p{i % 10}?utm_source=ads{i}" if i % 2 else f"https://shop.vn/p{i % 10}"
+                            for i in range(40)] + ["https://shop.vn/broken", "https://shop.vn/broken?gclid=x"]
+        rows = [["", "", "", link] for link in links]
+        gsheet_client = GSheetClient("spreadsheet", None, service=FakeSheetsService({"Sheet1": rows}))
+        bq_client = FakeBQClient()
+        s = StreamingService(bq_client, gsheet_client)
+        crawler = FakeCrawler("shop.vn", latency=0.01)
+        scheduler = DomainScheduler(default_concurrency=50, default_rate=0)
+        crawler_getter = FakeCrawlerGetter(crawler)
+
+        async def get_price(link):
+            if "broken" in link:
+                raise Exception("error getting shop.vn product, status: 404")
+            return await FakeCrawler.get_price(crawler, link)
+        crawler.get_price = get_price
+
+        with self.assertLogs(level="INFO") as logs:
+            asyncio.run(s._crawl_prices(crawler_getter, scheduler, BQProductSink(bq_client)))
+
+        self.assertEqual(10, len(crawler.links))
+        self.assertEqual(sorted(links[1:41]), sorted(row["link"] for row in bq_client.rows))
+        self.assertIn("read 42 links, 11 unique, duplicate ratio 73.8%", "\n".join(logs.output))
+
+    def _crawl_stalling_shop(self, http_client: HttpClient, run_deadline: float):
+        # 10 links answered right away, 5 links of a response that stalls for 5s
+        def stall(handler):
+            time.sleep(5)
+            return 200, {}, b"1"
+
+        with StubServer({"/stall": stall}, default_body=b"1790000") as server:
+            links = ["link"] + [server.url(f"/p{i}") for i in range(10)] + [server.url(f"/stall?i={i}") for i in range(5)]
+            gsheet_client = GSheetClient("spreadsheet", None,
+                                         service=FakeSheetsService({"Sheet1": [["", "", "", link] for link in links]}))
+            bq_client = FakeBQClient()
+            s = StreamingService(bq_client, gsheet_client)
+            s.config = configparser.ConfigParser()
+            s.config.read_dict({"DEFAULT": {"LINK_RANGE_FORMART": "Sheet1!D{}:D{}"},
+                                "PIPELINE": {"RUN_DEADLINE": str(run_deadline)}})
+            scheduler = DomainScheduler(default_concurrency=20, default_rate=0)
+
+            async def run():
+                async with http_client:
+                    crawler_getter = CrawlerGetter(http_client, registry={"127.0.0.1": PlainPriceCrawler})
+                    await s._crawl_prices(crawler_getter, scheduler, BQProductSink(bq_client))
+
+            start = time.monotonic()
+            with self.assertLogs(level="WARNING") as logs:
+                asyncio.run(run())
+            return time.monotonic() - start, bq_client.rows, logs.output
+
+    def test_read_timeout_bounds_stalled_links(self):
+        elapsed, rows, logs = self._crawl_stalling_shop(HttpClient(read_timeout=0.3), run_deadline=0)
+        self.assertEqual([1790000] * 10, [row["sale_price"] for row in rows])
+        self.assertEqual(5, sum("(timeout)" in line for line in logs))
+        self.assertLess(elapsed, 2)
+
+    def test_run_deadline_cancels_outstanding_crawls(self):
+        elapsed, rows, logs = self._crawl_stalling_shop(HttpClient(read_timeout=30), run_deadline=0.5)
+        # products collected before the deadline are still flushed
+        self.assertEqual([1790000] * 10, [row["sale_price"] for row in rows])
+        self.assertIn("run deadline of 0.5s reached, 5 read rows were not crawled", "\n".join(logs))
+        self.assertLess(elapsed, 2)
+